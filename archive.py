@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A compressed, content-addressed archive of the raw pages downloaded by the
+spiders, and a downloader middleware that records to and replays from it.
+
+Each page body is gzipped and stored once, under the SHA-1 hash of its
+content:
+
+    <archive>/pages/<first 2 characters of hash>/<hash>.gz
+
+An index file, <archive>/index.jsonl, has a line for each URL and content
+pair, holding the URL, the content hash, the status, the headers needed to
+rebuild the response and the time it was downloaded. A page that has not
+changed between crawls adds nothing to the archive. Pages reached through
+redirects are also indexed under the URLs that were redirected.
+
+With PAGE_ARCHIVE_REPLAY set, every request is answered from the archive
+(with the latest version of the page) or with a 404 if the page was never
+archived, so the spiders can be run with no network at all, e.g.:
+
+    scrapy crawl napier -s PAGE_ARCHIVE_REPLAY=1
+
+@author: abradbury
+"""
+
+import gzip                         # For compressing the archived pages
+import hashlib                      # For addressing pages by their content
+import json                         # For the archive index
+import os
+import time                         # For recording when pages were archived
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers, Response
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.python import to_native_str
+from w3lib.url import canonicalize_url
+
+INDEX_FILE = 'index.jsonl'
+PAGES_DIRECTORY = 'pages'
+
+# The response headers kept in the archive
+ARCHIVED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class PageArchive(object):
+    """
+    The pages in an archive directory, and the index of the latest version of
+    the page at each URL
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.latest = {}            # Canonical URL: latest index entry
+        self.archived = set()       # (Canonical URL, content hash) pairs
+        self.index_file = None
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as index_file:
+                for line in index_file:
+                    self.add_entry(json.loads(line))
+
+    @staticmethod
+    def key(url):
+        return canonicalize_url(url)
+
+    def add_entry(self, entry):
+        key = PageArchive.key(entry['url'])
+        self.latest[key] = entry
+        self.archived.add((key, entry['content_hash']))
+
+    def page_path(self, content_hash):
+        return os.path.join(self.directory, PAGES_DIRECTORY, content_hash[:2], content_hash + '.gz')
+
+    def store(self, response, urls=None):
+        """
+        Archives a response under its URL, or under each of the given URLs,
+        returning True if it was not already archived
+        """
+        urls = urls or [response.url]
+        content_hash = hashlib.sha1(response.body).hexdigest()
+        urls = [url for url in urls if (PageArchive.key(url), content_hash) not in self.archived]
+        if len(urls) == 0:
+            return False
+
+        path = self.page_path(content_hash)
+        if not os.path.exists(path):
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            # Written under a temporary name so that a partial page is never
+            # in the archive
+            with gzip.open(path + '.tmp', 'wb') as page_file:
+                page_file.write(response.body)
+            os.rename(path + '.tmp', path)
+
+        headers = dict((name, to_native_str(response.headers[name]))
+                       for name in ARCHIVED_HEADERS if name in response.headers)
+
+        if self.index_file is None:
+            self.index_file = open(self.index_path, 'a')
+
+        for url in urls:
+            entry = {'url': url, 'content_hash': content_hash,
+                     'status': response.status, 'headers': headers,
+                     'archived': int(time.time())}
+            self.index_file.write(json.dumps(entry, sort_keys=True) + '\n')
+            self.add_entry(entry)
+
+        self.index_file.flush()
+        return True
+
+    def load(self, url, request=None):
+        """
+        Returns the latest archived response for a URL, or None if the URL
+        has not been archived
+        """
+        entry = self.latest.get(PageArchive.key(url))
+        if entry is None:
+            return None
+
+        with gzip.open(self.page_path(entry['content_hash']), 'rb') as page_file:
+            body = page_file.read()
+
+        headers = Headers(entry['headers'])
+        response_class = responsetypes.from_args(headers=headers, url=url, body=body)
+        return response_class(url=url, status=entry['status'], headers=headers,
+                              body=body, request=request, flags=['archived'])
+
+    def close(self):
+        if self.index_file is not None:
+            self.index_file.close()
+            self.index_file = None
+
+
+class PageArchiveMiddleware(object):
+    """
+    Archives every successful response in PAGE_ARCHIVE_DIR or, when
+    PAGE_ARCHIVE_REPLAY is set, answers every request from the archive
+    """
+
+    def __init__(self, page_archive, replay, stats):
+        self.page_archive = page_archive
+        self.replay = replay
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get('PAGE_ARCHIVE_DIR')
+        if not directory:
+            raise NotConfigured
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        middleware = cls(PageArchive(directory), crawler.settings.getbool('PAGE_ARCHIVE_REPLAY'),
+                         crawler.stats)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_request(self, request, spider):
+        if not self.replay:
+            return None
+
+        response = self.page_archive.load(request.url, request)
+        if response is None:
+            self.stats.inc_value('archive/missing', spider=spider)
+            return Response(request.url, status=404, request=request, flags=['archived'])
+
+        self.stats.inc_value('archive/replayed', spider=spider)
+        return response
+
+    def process_response(self, request, response, spider):
+        if self.replay or response.status != 200:
+            return response
+
+        urls = request.meta.get('redirect_urls', []) + [response.url]
+        if self.page_archive.store(response, urls):
+            self.stats.inc_value('archive/stored', spider=spider)
+        else:
+            self.stats.inc_value('archive/unchanged', spider=spider)
+        return response
+
+    def spider_closed(self, spider):
+        self.page_archive.close()
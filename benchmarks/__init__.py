@@ -0,0 +1,2 @@
+# This package contains benchmarks for the parsing and crawling code, along
+# with generators of the pages they run against.
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end benchmark of the napier and clubs spiders, crawling a local
+stand-in of the websites (see site.py) at a range of CONCURRENT_REQUESTS
+settings. Item pipelines are disabled, so only crawling and parsing are
+measured. No crawl metrics file is written unless a path is given with
+--metrics-file, which then holds the metrics of the last crawl.
+
+Each crawl runs in its own process, as the Twisted reactor cannot be
+restarted, and reports the pages and items per second and the time to
+complete the crawl.
+
+Alternatively, crawls can replay a page archive (see archive.py) recorded
+by an earlier crawl of the real websites, so that every run parses exactly
+the same pages with no network at all.
+
+Usage:
+    python -m Orienteering_Scraper.benchmarks.crawl [--spider napier]
+        [--concurrency 1 4 16] [--events 50] [--latency 0.05]
+        [--metrics-file metrics.prom]
+    python -m Orienteering_Scraper.benchmarks.crawl --replay archive
+
+@author: abradbury
+"""
+
+import argparse                     # For parsing the command line
+import multiprocessing              # For running each crawl in a new process
+import os
+import signal                       # For stopping crawls that time out
+import sys
+import time                         # For timing each crawl
+
+from scrapy.crawler import CrawlerProcess
+from scrapy.settings import Settings
+from six.moves.queue import Empty
+
+from Orienteering_Scraper.benchmarks.site import StandInSite, start_server
+from Orienteering_Scraper.spiders.bo_club_spider import OrienteeringClubsSpider
+from Orienteering_Scraper.spiders.napier_spider import NapierSpider
+
+SPIDERS = {
+    'napier': (NapierSpider, '/results'),
+    'clubs': (OrienteeringClubsSpider, '/find_a_club')
+}
+
+# The longest a crawl is waited for, in seconds, by default
+CRAWL_TIMEOUT = 600
+
+
+def crawl_settings(concurrency, replay_archive=None, metrics_file=''):
+    """
+    Returns the project settings, changed for benchmarking at the given
+    number of concurrent requests. Pages are only archived when replaying
+    an archive, and metrics are only written to the given file, if any.
+    """
+    settings = Settings()
+    settings.setmodule('Orienteering_Scraper.settings')
+    settings.setdict({
+        'CONCURRENT_REQUESTS': concurrency,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': concurrency,
+        'ITEM_PIPELINES': {},
+        'FINGERPRINTS_FILE': '',
+        'METRICS_FILE': metrics_file,
+        'PAGE_ARCHIVE_DIR': replay_archive or '',
+        'PAGE_ARCHIVE_REPLAY': replay_archive is not None,
+        'LOG_LEVEL': 'WARNING',
+        'TELNETCONSOLE_ENABLED': False
+    })
+    return settings
+
+
+def run_crawl(spider_name, start_url, concurrency, replay_archive, metrics_file, results):
+    """
+    Runs a single crawl to completion, putting its stats and duration on the
+    results queue. The spiders' printed summaries are discarded.
+    """
+    sys.stdout = open(os.devnull, 'w')
+    spider_class, _ = SPIDERS[spider_name]
+
+    process = CrawlerProcess(crawl_settings(concurrency, replay_archive, metrics_file))
+    crawler = process.create_crawler(spider_class)
+    process.crawl(crawler, start_url=start_url)
+
+    start_time = time.time()
+    process.start()
+    results.put((crawler.stats.get_stats(), time.time() - start_time))
+
+
+def benchmark(spider_name, site, concurrency, replay_archive=None, timeout=CRAWL_TIMEOUT,
+              metrics_file=''):
+    """
+    Returns the stats and duration, in seconds, of crawling the site, or of
+    replaying the archive if there is no site. Raises a RuntimeError, with
+    the exit code of the crawl's process, if the crawl fails or does not
+    complete within the timeout.
+    """
+    _, path = SPIDERS[spider_name]
+    start_url = site.base_url + path if site is not None else None
+    results = multiprocessing.Queue()
+    crawl = multiprocessing.Process(target=run_crawl,
+                                    args=(spider_name, start_url, concurrency, replay_archive,
+                                          metrics_file, results))
+    crawl.start()
+
+    # The results are waited for only while the crawl's process is running,
+    # so that a crawl that dies is reported straight away
+    deadline = time.time() + timeout
+    result = None
+    while result is None and crawl.is_alive() and time.time() < deadline:
+        try:
+            result = results.get(timeout=1)
+        except Empty:
+            pass
+
+    # The results may have been put just before the process exited
+    if result is None:
+        try:
+            result = results.get(timeout=1)
+        except Empty:
+            pass
+
+    if result is None:
+        # Scrapy shuts down gracefully on SIGTERM, which could take as long
+        timed_out = crawl.is_alive()
+        if timed_out:
+            os.kill(crawl.pid, signal.SIGKILL)
+        crawl.join()
+        raise RuntimeError("Crawl at concurrency {:d} {} (exit code {})".format(
+            concurrency, "timed out after {:d}s".format(timeout) if timed_out else "failed",
+            crawl.exitcode))
+
+    crawl.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crawls of a local stand-in website")
+    parser.add_argument('--spider', choices=sorted(SPIDERS), default='napier')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                        help="CONCURRENT_REQUESTS settings to benchmark")
+    parser.add_argument('--events', type=int, default=50, help="number of events on the site")
+    parser.add_argument('--rows', type=int, default=100, help="number of results per course")
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="delay before each response, in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="proportion of requests that fail")
+    parser.add_argument('--replay', metavar='ARCHIVE',
+                        help="replay a page archive instead of crawling the stand-in site")
+    parser.add_argument('--timeout', type=int, default=CRAWL_TIMEOUT,
+                        help="longest time to wait for each crawl, in seconds")
+    parser.add_argument('--metrics-file', default='',
+                        help="file to write the crawl metrics to, none by default")
+    args = parser.parse_args()
+
+    site = server = None
+    if args.replay is None:
+        site = StandInSite(events_count=args.events, rows_count=args.rows,
+                           latency=args.latency, error_rate=args.error_rate)
+        server = start_server(site)
+
+    print("{:<12} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+        "Concurrency", "Pages", "Items", "Time (s)", "Pages/sec", "Items/sec"))
+    print("-" * 71)
+
+    failed = False
+    try:
+        for concurrency in args.concurrency:
+            try:
+                stats, seconds = benchmark(args.spider, site, concurrency, args.replay,
+                                           args.timeout, args.metrics_file)
+            except RuntimeError as error:
+                print(error)
+                failed = True
+                continue
+
+            pages = stats.get('response_received_count', 0)
+            items = stats.get('item_scraped_count', 0)
+            print("{:<12d} {:>10d} {:>10d} {:>10.2f} {:>12.1f} {:>12.1f}".format(
+                concurrency, pages, items, seconds, pages / seconds, items / seconds))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    if failed:
+        parser.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Generates realistic, synthetic results pages in the formats produced by
+Michael Napier's software, for benchmarking the parsers without downloading
+real results.
+
+Two formats are generated:
+    colour          a Napier Colour page, with a named anchor, course details
+                    and <pre> block for each course
+    mercs-simple    the results.htm of a simple MERCS event, with a <p> and
+                    <pre> block for each course but no anchors. The MERCS
+                    index page linking to it is generated separately.
+
+@author: abradbury
+"""
+
+import random                       # For generating varied results
+
+COLOUR = 'colour'
+MERCS_SIMPLE = 'mercs-simple'
+
+FIRST_NAMES = ['Alice', 'Ben', 'Carys', 'Dan', 'Eleanor', 'Fergus', 'Gemma',
+               'Hamish', 'Isla', 'Jack', 'Katie', 'Liam', 'Megan', 'Niall',
+               'Olivia', 'Patrick', 'Rhona', 'Sam', 'Tilly', 'Will']
+LAST_NAMES = ['Anderson', 'Brown', 'Campbell', 'Davies', 'Evans', 'Fraser',
+              'Graham', 'Hughes', 'Jones', 'Kerr', 'Lewis', 'Morgan', 'Nicholson',
+              'Owen', 'Patel', 'Roberts', 'Smith', 'Thomas', 'Walker', 'Young']
+CLUBS = ['SYO', 'EPOC', 'DVO', 'LOC', 'AIRE', 'CLOK', 'LEI', 'SROC', 'EBOR', 'HALO']
+AGE_CLASSES = ['M10', 'W10', 'M12', 'W12', 'M14', 'W14', 'M21', 'W21', 'M45',
+               'W45', 'M60', 'W60']
+COURSE_NAMES = ['White', 'Yellow', 'Orange', 'Light Green', 'Green', 'Blue',
+                'Brown', 'Black', 'Short Green', 'Short Blue']
+
+ROW_FORMAT = u"{:>4}  {:<24}{:<7}{:<6}{:>7}   {:<24}"
+
+
+def generate_rows(rows_count, rng):
+    """
+    Returns the lines of a course's results, in position order, including
+    mispunches, retirements and comments.
+
+    As with real results, the columns are only found if more than 5% of rows
+    have something other than a space at each position within a column, so
+    comments are common and kept to the same few lengths.
+    """
+    times = sorted(rng.randint(12 * 60, 150 * 60) for _ in range(rows_count))
+    lines = []
+    position = 0
+
+    for time in times:
+        name = rng.choice(FIRST_NAMES) + ' ' + rng.choice(LAST_NAMES)
+        club = rng.choice(CLUBS)
+        age_class = rng.choice(AGE_CLASSES)
+        raw_time = "{:d}:{:02d}".format(time // 60, time % 60)
+        comment = u""
+        outcome = rng.random()
+
+        if outcome < 0.12:
+            # Mispunched, with a range of missed controls
+            first_missed = rng.randint(1, 5)
+            raw_position = 'mp'
+            comment = "missing {:d},{:d}-{:d}".format(first_missed, first_missed + 1,
+                                                      first_missed + 3)
+        elif outcome < 0.18:
+            raw_position = 'mp'
+            comment = "{:d} out of order".format(rng.randint(1, 9))
+        elif outcome < 0.24:
+            raw_position = ''
+            raw_time = 'dnf'
+            comment = "no finish time"
+        else:
+            position += 1
+            raw_position = str(position)
+
+        lines.append(ROW_FORMAT.format(raw_position, name, club, age_class, raw_time, comment))
+
+    return lines
+
+
+def generate_results_page(results_format=COLOUR, courses_count=6, rows_count=100, seed=0):
+    """
+    Returns the HTML of a synthetic results page with the given number of
+    courses, each with the given number of results
+    """
+    rng = random.Random(seed)
+    html = [u"<html><head><title>Results</title></head><body>",
+            u"<a name=\"TOP\"><p><strong>Results for Regional Event, "
+            u"Big Moor, Sunday 22nd January 2017</strong></p></a>"]
+
+    for i in range(courses_count):
+        course_name = COURSE_NAMES[i % len(COURSE_NAMES)]
+        if i >= len(COURSE_NAMES):
+            course_name += " " + str(i // len(COURSE_NAMES) + 1)
+        controls_count = rng.randint(8, 30)
+        course_info = u"<p><strong>{}</strong> (length {:.1f}km, climb {:d}m, {:d} controls)</p>"\
+            .format(course_name, rng.uniform(1.5, 12), rng.randint(10, 400), controls_count)
+        rows = u"\n".join(generate_rows(rows_count, rng))
+
+        if results_format == COLOUR:
+            html.append(u"<a name=\"{:d}\">{}\n<pre>\n{}\n</pre></a>".format(i, course_info, rows))
+        else:
+            html.append(u"{}\n<pre>\n{}\n</pre>".format(course_info, rows))
+
+    html.append(u"<address><p>Results software provided by Michael Napier</p></address>")
+    html.append(u"</body></html>")
+    return u"\n".join(html).encode('utf-8')
+
+
+def generate_mercs_index_page(relay=False):
+    """
+    Returns the HTML of a MERCS event index page, linking to the results page
+    """
+    title = u"Relay" if relay else u"Results"
+    return (u"<html><body><h1>{}</h1>"
+            u"<p><a href=\"results.htm\">results.htm</a></p>"
+            u"<address><p>Produced by <a href=\"http://www.mercs.org\">MERCS</a></p></address>"
+            u"</body></html>").format(title).encode('utf-8')
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmarks of each stage of parsing a Napier results page, run against
+a synthetic page so that regressions can be caught before deploying.
+
+Each stage is run several times and the fastest run is reported, along with
+the throughput in results rows per second and the memory used by a single
+run of the stage. The memory is the growth in the peak resident memory
+(ru_maxrss) of a process forked for that run, so memory freed by the stages
+before it and reused is not counted. It is not available on Windows.
+
+Stages that use the cached field parsers (see fields.py) are reported twice:
+cold, with the parsers' lookup tables emptied before every run, and warm,
+with the tables already filled by an earlier run, as on later pages of a
+crawl.
+
+The memory held by each result as a ResultRecord (see records.py) is also
+compared with that held by the PersonItem and ResultItem that were built for
+each result before records were used.
+
+The throughput of parsing the fields of each result row (parse_result_row)
+can be checked against a target, warm, and a target, cold, e.g. ones set for
+the machine the benchmark runs on. The benchmark exits with an error if a
+given target is not met.
+
+Usage:
+    python -m Orienteering_Scraper.benchmarks.parser [--format colour]
+        [--courses 6] [--rows 100] [--repeat 5] [--target rows/sec]
+        [--cold-target rows/sec]
+
+@author: abradbury
+"""
+
+import argparse                     # For parsing the command line
+import multiprocessing              # For measuring memory in a new process
+import os
+import sys
+import timeit                       # For timing each stage
+
+try:
+    import resource                 # For measuring peak memory (not on Windows)
+except ImportError:
+    resource = None
+
+from scrapy.http import HtmlResponse
+
+from Orienteering_Scraper.benchmarks.pages import COLOUR, MERCS_SIMPLE, generate_results_page
+from Orienteering_Scraper.fields import clear_caches
+from Orienteering_Scraper.items import EventSummaryItem, PersonItem, ResultItem
+from Orienteering_Scraper.records import ResultRecord
+from Orienteering_Scraper.reparse import create_spider
+from Orienteering_Scraper.spiders.napier_spider import NapierSpider
+
+RESULTS_URL = 'https://www.southyorkshireorienteers.org.uk/event/benchmark/results.htm'
+
+# The stage whose throughput can be checked against targets
+TARGET_STAGE = 'parse_result_row'
+
+# The number of results whose memory is measured, see memory_per_result
+MEMORY_RESULTS = 100000
+
+# The stages that use the cached field parsers
+CACHED_STAGES = ('parse_result_row', 'parse_comments', 'extract_results', 'parse_napier_common')
+
+
+def measure(function, repeat, setup=None):
+    """
+    Returns the fastest time of running a function, in seconds, and the
+    memory used by a single run, in bytes (or None if unavailable). The setup
+    function, if any, is run before every run and is not timed.
+    """
+    peak_memory = memory_used(function, setup)
+    seconds = min(timeit.repeat(function, setup=setup or 'pass', number=1, repeat=repeat))
+    return seconds, peak_memory
+
+
+def max_rss():
+    """
+    Returns the peak resident memory of this process, in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_once(function, setup, results):
+    """
+    Runs a function once, after the setup function, if any, putting the
+    growth in the process's peak resident memory on the results queue
+    """
+    if setup is not None:
+        setup()
+    start_peak = max_rss()
+    function()
+    results.put(max_rss() - start_peak)
+
+
+def memory_used(function, setup=None):
+    """
+    Returns the memory used by a single run of a function, in bytes, as the
+    growth in the peak resident memory of a process forked for the run, or
+    None if the peak resident memory is unavailable. A forked process starts
+    with its current resident memory as its peak.
+    """
+    if resource is None:
+        return None
+
+    results = multiprocessing.Queue()
+    run = multiprocessing.Process(target=run_once, args=(function, setup, results))
+    run.start()
+    peak_memory = results.get()
+    run.join()
+    return peak_memory
+
+
+def new_event():
+    return EventSummaryItem(seq_id=1, name=RESULTS_URL, results_format="Napier - Colour")
+
+
+def benchmark_stages(response, repeat):
+    """
+    Times each stage of parsing the results page separately, with the output
+    of one stage as the input of the next. Stages that use the cached field
+    parsers are timed both cold and warm.
+
+    Returns:
+        a list of (stage name, seconds, memory in bytes) tuples, and the
+        records of the results rows on the page
+    """
+    courses, course_results = NapierSpider.identify_course_data(response, new_event())
+    valid_rows = [NapierSpider.get_valid_rows(results) for results in course_results]
+    (column_indices, _) = NapierSpider.identify_columns(valid_rows)
+    template = NapierSpider.identify_template(response, course_results)
+    extracted_data = [NapierSpider.extract_data(rows, column_indices) for rows in valid_rows]
+    result_rows = [row for course_data in extracted_data for row in course_data]
+    comments = [row[5] for row in result_rows if len(row) > 5 and row[5].strip()]
+    records = [NapierSpider.parse_result_row(row) for row in result_rows]
+    spider = create_spider()
+
+    def parse_all_comments():
+        for comment in comments:
+            NapierSpider.parse_comments(comment, records[0])
+
+    stages = [
+        ("identify_results_page", lambda: NapierSpider.identify_results_page(response)),
+        ("identify_course_data", lambda: NapierSpider.identify_course_data(response, new_event())),
+        ("get_valid_rows", lambda: [NapierSpider.get_valid_rows(results)
+                                    for results in course_results]),
+        ("identify_columns", lambda: NapierSpider.identify_columns(valid_rows)),
+        ("identify_columns cached", lambda: NapierSpider.identify_columns(valid_rows, template)),
+        ("extract_data", lambda: [NapierSpider.extract_data(rows, column_indices)
+                                  for rows in valid_rows]),
+        ("parse_result_row", lambda: [NapierSpider.parse_result_row(row) for row in result_rows]),
+        ("parse_comments", parse_all_comments),
+        ("records to dicts", lambda: [record.to_dict() for record in records]),
+        ("extract_results", lambda: list(NapierSpider.extract_results(response)['courses'])),
+        ("parse_napier_common", lambda: parse_napier_common(spider, response))
+    ]
+
+    timings = []
+    for name, function in stages:
+        if name not in CACHED_STAGES:
+            timings.append((name,) + measure(function, repeat))
+            continue
+
+        timings.append((name + " (cold)",) + measure(function, repeat, clear_caches))
+        function()
+        timings.append((name + " (warm)",) + measure(function, repeat))
+    return timings, records
+
+
+def result_items(record):
+    """
+    Returns a result as the PersonItem holding a ResultItem that was built for
+    each result before ResultRecords were used
+    """
+    person = record.to_dict()
+    person['result'] = ResultItem(person['result'])
+    return PersonItem(person)
+
+
+def memory_per_result(records):
+    """
+    Returns the memory held by each result, in bytes, as a ResultRecord and
+    as a PersonItem holding a ResultItem, or None if unavailable. The values
+    of the fields are shared, so only the memory of the containers counts.
+    The results are copied until there are enough that the memory measured
+    is not lost in memory freed by the stages.
+    """
+    copies = records * max(1, MEMORY_RESULTS // len(records))
+
+    def copy_records():
+        return [ResultRecord(record.name, record.club, record.age_class, record.status,
+                             record.position, record.time, record.missed, record.out_of_order,
+                             record.behind)
+                for record in copies]
+
+    record_memory = memory_used(copy_records)
+    items_memory = memory_used(lambda: [result_items(record) for record in copies])
+    if record_memory is None:
+        return None
+    return record_memory / float(len(copies)), items_memory / float(len(copies))
+
+
+def parse_napier_common(spider, response):
+    """
+    Runs the complete parse of a results page, discarding the printed summary
+    """
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as sys.stdout:
+        try:
+            return list(spider.parse_napier_common(response, new_event()))
+        finally:
+            sys.stdout = stdout
+
+
+def print_report(timings, rows_count):
+    print("{:<30} {:>12} {:>14} {:>14}".format("Stage", "Time (ms)", "Rows/sec", "Memory (KiB)"))
+    print("-" * 73)
+    for name, seconds, peak_memory in timings:
+        print("{:<30} {:>12.3f} {:>14,.0f} {:>14}".format(
+            name, seconds * 1000, rows_count / seconds if seconds > 0 else float('inf'),
+            "{:,.0f}".format(peak_memory / 1024.0) if peak_memory is not None else "n/a"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Napier results parser")
+    parser.add_argument('--format', choices=[COLOUR, MERCS_SIMPLE], default=COLOUR)
+    parser.add_argument('--courses', type=int, default=6, help="number of courses")
+    parser.add_argument('--rows', type=int, default=100, help="number of results per course")
+    parser.add_argument('--repeat', type=int, default=5, help="number of runs of each stage")
+    parser.add_argument('--seed', type=int, default=0, help="seed for generating the page")
+    parser.add_argument('--target', type=float,
+                        help="minimum rows/sec of the " + TARGET_STAGE + " stage, warm")
+    parser.add_argument('--cold-target', type=float,
+                        help="minimum rows/sec of the " + TARGET_STAGE + " stage, cold")
+    args = parser.parse_args()
+
+    body = generate_results_page(args.format, args.courses, args.rows, args.seed)
+    response = HtmlResponse(RESULTS_URL, body=body, encoding='utf-8')
+
+    timings, records = benchmark_stages(response, args.repeat)
+    rows_count = len(records)
+    print("{} page: {:d} courses, {:d} results rows, {:,d} bytes\n".format(
+        args.format, args.courses, rows_count, len(body)))
+    print_report(timings, rows_count)
+
+    result_memory = memory_per_result(records)
+    if result_memory is not None:
+        print("\nMemory per result: {:,.0f} bytes as a ResultRecord, {:,.0f} bytes as a "
+              "PersonItem holding a ResultItem".format(*result_memory))
+
+    stage_seconds = dict((name, seconds) for name, seconds, _ in timings)
+    below_target = False
+    targets = [(state, target) for state, target in (("warm", args.target),
+                                                     ("cold", args.cold_target))
+               if target is not None]
+    if len(targets) > 0:
+        print("")
+    for state, target in targets:
+        seconds = stage_seconds[TARGET_STAGE + " (" + state + ")"]
+        rows_per_second = rows_count / seconds if seconds > 0 else float('inf')
+        print("{} throughput {:,.0f} rows/sec {}, target {:,.0f} rows/sec".format(
+            TARGET_STAGE, rows_per_second, state, target))
+        below_target = below_target or rows_per_second < target
+    if below_target:
+        sys.exit("Below the {} throughput target".format(TARGET_STAGE))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A local stand-in for the websites crawled by the spiders, so that crawls can
+be load tested without requests to the club or British Orienteering
+websites. It serves:
+
+    /results?limitstart=N       results listing pages, with pagination
+    /events/event/<id>          event pages linking to the event results
+    /event/<id>/results.htm     Napier Colour results pages, or the results
+                                pages of simple MERCS events
+    /event/<id>/index.htm       MERCS event index pages
+    /find_a_club                the British Orienteering list of clubs
+    /clubs/<name>/              club homepages
+
+Every response can be delayed, and a proportion of responses can be made to
+fail, to mimic slow or unreliable sites.
+
+Usage:
+    python -m Orienteering_Scraper.benchmarks.site [--port 8000]
+    scrapy crawl napier -a start_url=http://127.0.0.1:8000/results
+    scrapy crawl clubs -a start_url=http://127.0.0.1:8000/find_a_club
+
+@author: abradbury
+"""
+
+import argparse                     # For parsing the command line
+import random                       # For failing a proportion of requests
+import re
+import threading                    # For serving in the background
+import time                         # For delaying responses
+
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import parse_qs, urlparse
+
+from Orienteering_Scraper.benchmarks.pages import COLOUR, MERCS_SIMPLE, CLUBS, \
+    generate_mercs_index_page, generate_results_page
+
+EVENT_PAGE = re.compile(r'^/events/event/(\d+)-')
+RESULTS_PAGE = re.compile(r'^/event/(\d+)/(results|index)\.htm$')
+CLUB_HOMEPAGE = re.compile(r'^/clubs/(\w+)/$')
+
+
+class StandInSite(object):
+    """
+    The content of the stand-in website. Every fifth event is a simple MERCS
+    event, the rest use Napier Colour.
+    """
+
+    def __init__(self, events_count=50, events_per_page=10, courses_count=6, rows_count=100,
+                 latency=0.0, error_rate=0.0):
+        self.events_count = events_count
+        self.events_per_page = events_per_page
+        self.courses_count = courses_count
+        self.rows_count = rows_count
+        self.latency = latency
+        self.error_rate = error_rate
+        self.base_url = None
+        self.results_pages = {}     # Event ID: results page body
+
+    @staticmethod
+    def is_mercs_event(event_number):
+        return event_number % 5 == 4
+
+    def listing_page(self, limit_start):
+        rows = "".join(
+            u"<tr><td headers=\"jem_title\"><a href=\"/events/event/{0:d}-event-{0:d}\">"
+            u"Event {0:d}</a></td></tr>".format(event_number)
+            for event_number in range(limit_start,
+                                      min(limit_start + self.events_per_page, self.events_count)))
+
+        # Page links, with Next and End links as on the real site
+        last_start = ((self.events_count - 1) // self.events_per_page) * self.events_per_page
+        links = [u"<li><a title=\"{0:d}\" href=\"/results?limitstart={1:d}\">{0:d}</a></li>"
+                 .format(start // self.events_per_page + 1, start)
+                 for start in range(0, last_start + 1, self.events_per_page)]
+        if limit_start < last_start:
+            links.append(u"<li><a title=\"Next\" href=\"/results?limitstart={:d}\">Next</a></li>"
+                         .format(limit_start + self.events_per_page))
+            links.append(u"<li><a title=\"End\" href=\"/results?limitstart={:d}\">End</a></li>"
+                         .format(last_start))
+
+        return (u"<html><body><table class=\"eventtable\">{}</table>"
+                u"<nav><ul class=\"pagination\">{}</ul></nav></body></html>")\
+            .format(rows, "".join(links)).encode('utf-8')
+
+    def event_page(self, event_number):
+        page = "index.htm" if StandInSite.is_mercs_event(event_number) else "results.htm"
+        return (u"<html><body><dl class=\"event_info\"><dt>Results</dt><dd class=\"custom4\">"
+                u"<a href=\"/event/{:d}/{}\">Results</a></dd></dl></body></html>")\
+            .format(event_number, page).encode('utf-8')
+
+    def results_page(self, event_number):
+        if event_number not in self.results_pages:
+            results_format = MERCS_SIMPLE if StandInSite.is_mercs_event(event_number) else COLOUR
+            self.results_pages[event_number] = generate_results_page(
+                results_format, self.courses_count, self.rows_count, seed=event_number)
+        return self.results_pages[event_number]
+
+    def clubs_page(self):
+        rows = "".join(
+            u"<tr><td><a href=\"{0}/clubs/{1}/\">{1}</a></td><td class=\"assoc\">YHOA</td></tr>"
+            .format(self.base_url, club) for club in CLUBS)
+        return (u"<html><body><table id=\"clubwebsites\">{}</table></body></html>")\
+            .format(rows).encode('utf-8')
+
+    @staticmethod
+    def club_homepage(club):
+        return (u"<html><head><title>{} Orienteering Club | Home</title></head>"
+                u"<body></body></html>").format(club).encode('utf-8')
+
+    def page(self, path, query):
+        """
+        Returns the body of the page at a path, or None if there is no page
+        """
+        if path == '/results':
+            return self.listing_page(int(query.get('limitstart', ['0'])[0]))
+        if path == '/find_a_club':
+            return self.clubs_page()
+
+        match = EVENT_PAGE.match(path)
+        if match and int(match.group(1)) < self.events_count:
+            return self.event_page(int(match.group(1)))
+
+        match = RESULTS_PAGE.match(path)
+        if match and int(match.group(1)) < self.events_count:
+            if match.group(2) == 'index':
+                return generate_mercs_index_page()
+            return self.results_page(int(match.group(1)))
+
+        match = CLUB_HOMEPAGE.match(path)
+        if match:
+            return StandInSite.club_homepage(match.group(1))
+        return None
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def request_handler(site):
+    """
+    Returns a request handler class that serves the pages of a site
+    """
+
+    class StandInRequestHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if site.latency > 0:
+                time.sleep(site.latency)
+
+            url = urlparse(self.path)
+            body = site.page(url.path, parse_qs(url.query))
+
+            if random.random() < site.error_rate:
+                self.send_error(500)
+            elif body is None:
+                self.send_error(404)
+            else:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StandInRequestHandler
+
+
+def start_server(site, port=0):
+    """
+    Serves a site from a background thread, returning the server. A port of
+    0 serves the site from any free port.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), request_handler(site))
+    site.base_url = "http://127.0.0.1:{:d}".format(server.server_address[1])
+
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of the crawled websites")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--events', type=int, default=50, help="number of events")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="delay before each response, in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="proportion of requests that fail")
+    args = parser.parse_args()
+
+    site = StandInSite(events_count=args.events, latency=args.latency, error_rate=args.error_rate)
+    server = start_server(site, args.port)
+    print("Serving at " + site.base_url + "/results and " + site.base_url + "/find_a_club")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Identifies the fixed-width columns of results presented as whitespace
+structured text (e.g. inside a HTML <pre> element).
+
+Rather than collecting the index of every space on every row and counting
+them, each row is laid out as a row of a dense character matrix. A space
+bitmap of this matrix is then reduced column-wise in a single operation to
+find the indices where (nearly) every row has a space.
+
+Most results pages come from a few versions of the results software, each
+with its own fixed-width layout. The LayoutCache keeps the columns found for
+each page template (the software's footer, the column headings and the
+width of the lines) and reuses them for later pages with the same template,
+once they have been checked against a sample of the page's lines. Only
+columns found from enough lines are cached, as the popularity threshold
+can misplace columns when there are few lines.
+
+@author: abradbury
+"""
+
+import numpy as np                  # For the per-row space bitmap
+
+# A space must be present in more than this fraction of rows for its index to
+# be treated as a column boundary
+POPULARITY_THRESHOLD = 0.95
+
+# Rows are padded to a common width with a character that is never a space
+PADDING_CHARACTER = u'\0'
+
+# Columns are only cached if found from at least this many lines, and cached
+# columns are checked against up to this many of a page's lines. A sample is
+# noisier than the whole page, so the columns fit if 90% of the sampled lines
+# have a space between each column.
+MIN_CACHED_LINES = 30
+SAMPLED_LINES = 50
+FIT_THRESHOLD = 0.9
+
+
+def build_space_bitmap(lines):
+    """
+    Returns a boolean matrix with one row per line and one column per
+    character index, set to True where the line has a space at that index.
+    Lines shorter than the longest line are treated as having no spaces past
+    their end.
+    """
+    width = max(len(line) for line in lines)
+    padded = u"".join(line.ljust(width, PADDING_CHARACTER) for line in lines)
+
+    # UTF-32 gives a fixed four bytes per character so the encoded text can
+    # be viewed directly as a matrix of code points
+    code_points = np.frombuffer(padded.encode('utf-32-le'), dtype='<u4')
+    return code_points.reshape(len(lines), width) == ord(u' ')
+
+
+def find_popular_space_indices(space_bitmap):
+    """
+    Returns a sorted list of the indices where more than 95% of the rows in
+    the space bitmap have a space.
+    """
+    threshold = int(np.floor(space_bitmap.shape[0] * POPULARITY_THRESHOLD))
+    return np.flatnonzero(space_bitmap.sum(axis=0) > threshold).tolist()
+
+
+def identify_column_indices(common_space_indices):
+    """
+    Returns a list of tuples where each tuple is the bounding indices
+    for a given column, identified through common spaces indices
+    """
+    pairs = zip(common_space_indices[:-1], common_space_indices[1:])
+    return [x for x in pairs if x[1] - x[0] > 1]
+
+
+def identify_columns(lines):
+    """
+    Returns a list of (start, end) tuples bounding each column that is common
+    to the input lines.
+    """
+    space_bitmap = build_space_bitmap(lines)
+    popular_space_indices = find_popular_space_indices(space_bitmap)
+    boundaries = sorted(set([0] + popular_space_indices + [space_bitmap.shape[1]]))
+
+    return identify_column_indices(boundaries)
+
+
+def fits_columns(column_indices, lines, width):
+    """
+    Returns True if, in an even sample of the lines, the indices between
+    the columns hold a space in enough of the lines
+    """
+    sample = lines[::max(len(lines) // SAMPLED_LINES, 1)]
+    boundaries = sorted(set(index for column in column_indices for index in column) - set([0, width]))
+    if len(boundaries) == 0:
+        return True
+
+    space_bitmap = build_space_bitmap(sample)
+    threshold = len(sample) * FIT_THRESHOLD
+    return bool((space_bitmap[:, boundaries].sum(axis=0) >= threshold).all())
+
+
+class LayoutCache(object):
+    """
+    Column layouts by page template, with counts of the lookups that found a
+    fitting layout (hits) and those that had to find the columns (misses)
+    """
+
+    def __init__(self):
+        self.layouts = {}           # Template key: [(start, end)]
+        self.hits = 0
+        self.misses = 0
+
+    def identify_columns(self, lines, template):
+        """
+        Returns the columns of the lines, from the cached layout of the
+        template if it fits, and whether the cached layout was used
+        """
+        width = max(len(line) for line in lines)
+        key = tuple(template) + (width,)
+        column_indices = self.layouts.get(key)
+
+        if column_indices is not None and fits_columns(column_indices, lines, width):
+            self.hits += 1
+            return column_indices, True
+
+        self.misses += 1
+        column_indices = identify_columns(lines)
+        if len(lines) >= MIN_CACHED_LINES:
+            self.layouts[key] = column_indices
+        return column_indices, False
+
+
+# The layouts seen by this process
+LAYOUT_CACHE = LayoutCache()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Statistics of the results of a course, computed once as the results are
+extracted so that they are stored with the course and each run, rather than
+being recomputed from every result whenever an event is shown.
+
+Each course gets a 'statistics' dict holding:
+
+    runners         the number of results
+    finishers       the number of runners placed with a time
+    winning_time    the fastest time of a finisher, in seconds
+    median_time     the median time of the finishers, in whole seconds
+
+and each finisher's result gets the percentage by which they were 'behind'
+the winner, to one decimal place e.g. 12.5.
+
+Times are whole seconds (see fields.parse_time), so the statistics are all
+computed with integers apart from the percentages.
+
+@author: abradbury
+"""
+
+from Orienteering_Scraper.fields import OK
+
+
+def is_finisher(record):
+    return record.status == OK and record.time is not None
+
+
+def median_time(sorted_times):
+    """
+    Returns the median of a sorted list of times, rounded down to a whole
+    second when there is an even number of times
+    """
+    middle = len(sorted_times) // 2
+    if len(sorted_times) % 2 == 1:
+        return sorted_times[middle]
+    return (sorted_times[middle - 1] + sorted_times[middle]) // 2
+
+
+def behind_winner(time, winning_time):
+    """
+    Returns the percentage of the winning time by which a time is behind it
+    """
+    if winning_time <= 0:
+        return None
+    return round(100.0 * (time - winning_time) / winning_time, 1)
+
+
+def course_statistics(records):
+    """
+    Returns the statistics of a course from its result records, setting how
+    far behind the winner each finisher was
+    """
+    times = sorted(record.time for record in records if is_finisher(record))
+    statistics = {'runners': len(records), 'finishers': len(times)}
+    if len(times) == 0:
+        return statistics
+
+    statistics['winning_time'] = times[0]
+    statistics['median_time'] = median_time(times)
+
+    for record in records:
+        if is_finisher(record):
+            record.behind = behind_winner(record.time, times[0])
+    return statistics
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Exports runs (single results) as a columnar Parquet dataset for analysis,
+with one row per run and one column per field, rather than the nested
+documents stored in MongoDB. Analytical scans then only read the columns
+they need, e.g.
+
+    pyarrow.parquet.read_table('export/runs', columns=['club', 'time'])
+
+The dataset is partitioned by event date, with one file per event in the
+directory of its date:
+
+    <dataset>/date=<YYYY-MM-DD>/<event ID>.parquet
+
+Events without a known date are kept under date=unknown. As each file is
+named after its event, exporting an event again replaces its runs rather
+than adding a second copy.
+
+Runs are exported by the ColumnarExportPipeline as they are crawled, or from
+the data already stored in MongoDB (in either storage layout) with:
+
+    python -m Orienteering_Scraper.export [--output export/runs]
+
+@author: abradbury
+"""
+
+import argparse                     # For parsing the command line
+import os
+import re                           # For parsing course lengths and climbs
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pymongo import MongoClient
+from scrapy.settings import Settings
+
+from Orienteering_Scraper.fields import parse_time
+from Orienteering_Scraper.normalize import COURSES, EVENTS, RUNS
+from Orienteering_Scraper.queries import stored_events
+
+# The columns of the exported runs, in order. The event date is the name of
+# each partition's directory, so is not held in the files themselves.
+SCHEMA = [
+    ('event_id', pa.string()),
+    ('event_name', pa.string()),
+    ('course', pa.string()),
+    ('course_length', pa.float32()),    # km
+    ('course_climb', pa.float32()),     # m
+    ('runner_id', pa.string()),         # See identity.py
+    ('name', pa.string()),
+    ('club', pa.string()),
+    ('ageClass', pa.string()),
+    ('position', pa.int32()),
+    ('time', pa.int32()),               # seconds
+    ('status', pa.string()),
+    ('missed_count', pa.int16())
+]
+
+PARTITION_KEY = 'date'
+UNKNOWN_DATE = 'unknown'
+
+# The number of the course length or climb, ignoring the units e.g. '5.2km'
+LEADING_NUMBER = re.compile(r'^\s*(\d+(?:\.\d+)?)')
+
+
+def parse_distance(raw_distance):
+    """
+    Returns the number of a course length or climb, or None if there is none
+    """
+    match = LEADING_NUMBER.match(raw_distance or '')
+    return float(match.group(1)) if match else None
+
+
+def parse_run_time(raw_time):
+    return parse_time(raw_time) if raw_time else None
+
+
+def run_row(event_doc, course_doc, run_doc):
+    """
+    Returns the row of a run, from the normalised documents of its event,
+    course and run (see normalize.py)
+    """
+    result = run_doc.get('result') or {}
+    position = result.get('position')
+
+    return {
+        'event_id': run_doc['event_id'],
+        'event_name': event_doc.get('name'),
+        'course': course_doc.get('name'),
+        'course_length': parse_distance(course_doc.get('length')),
+        'course_climb': parse_distance(course_doc.get('climb')),
+        'runner_id': run_doc.get('runner_id'),
+        'name': run_doc.get('name'),
+        'club': run_doc.get('club'),
+        'ageClass': run_doc.get('ageClass'),
+        'position': int(position) if position else None,
+        'time': parse_run_time(result.get('time')),
+        'status': result.get('status'),
+        'missed_count': len(result.get('missed') or [])
+    }
+
+
+def document_rows(documents):
+    """
+    Returns the rows of the runs in a list of (collection name, document)
+    tuples, as returned by normalize_event_summary
+    """
+    event_doc = {}
+    courses = {}
+    rows = []
+    for collection_name, document in documents:
+        if collection_name == EVENTS:
+            event_doc = document
+        elif collection_name == COURSES:
+            courses[document['_id']] = document
+        elif collection_name == RUNS:
+            rows.append(run_row(event_doc, courses.get(document['course_id'], {}),
+                                document))
+    return rows
+
+
+def partition_path(directory, date, doc_id):
+    return os.path.join(directory, PARTITION_KEY + '=' + (date or UNKNOWN_DATE),
+                        doc_id + '.parquet')
+
+
+def write_runs(directory, date, doc_id, rows):
+    """
+    Writes the rows of the runs of an event to its file in the dataset,
+    replacing any previous export. Returns the path of the file.
+    """
+    arrays = [pa.array([row[name] for row in rows], type=column_type)
+              for name, column_type in SCHEMA]
+    table = pa.Table.from_arrays(arrays, names=[name for name, _ in SCHEMA])
+
+    path = partition_path(directory, date, doc_id)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    # Written under a temporary name so that readers never see a partial
+    # file, starting with '.' as dataset readers skip such files
+    temporary_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+    pq.write_table(table, temporary_path)
+    os.rename(temporary_path, path)
+    return path
+
+
+def export_stored(db, storage_layout, directory):
+    """
+    Exports the runs of every event stored in MongoDB. Returns the number of
+    events and runs exported.
+    """
+    events_count = runs_count = 0
+    for event_doc_id, documents in stored_events(db, storage_layout):
+        rows = document_rows(documents)
+        if len(rows) > 0:
+            write_runs(directory, documents[0][1].get('date'), event_doc_id, rows)
+            events_count += 1
+            runs_count += len(rows)
+    return events_count, runs_count
+
+
+def main():
+    settings = Settings()
+    settings.setmodule('Orienteering_Scraper.settings')
+
+    parser = argparse.ArgumentParser(
+        description="Export the stored runs as a Parquet dataset partitioned by event date")
+    parser.add_argument('--mongo-uri', default=settings.get('MONGO_URI'))
+    parser.add_argument('--database', default=settings.get('MONGO_DATABASE'))
+    parser.add_argument('--layout', choices=['embedded', 'normalized'],
+                        default=settings.get('MONGO_STORAGE_LAYOUT'),
+                        help="storage layout to export from")
+    parser.add_argument('--output', default=settings.get('RUNS_EXPORT_DIR'),
+                        help="directory of the dataset")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    try:
+        events_count, runs_count = export_stored(client[args.database], args.layout, args.output)
+    finally:
+        client.close()
+
+    print("{:d} runs of {:d} events exported to {}".format(runs_count, events_count, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Parsers for the individual fields of a result row: the position, the time
+and the comments.
+
+Status codes are normalised through a lookup table, times and comments are
+matched with compiled patterns, and missed controls are expanded into a
+compact array of control numbers.
+
+The same few thousand times, positions and comments make up most results,
+so each parser remembers its results in a lookup table. Most fields are
+then parsed with a single dictionary lookup.
+
+@author: abradbury
+"""
+
+import functools                    # For wrapping the cached parsers
+import logging                      # For reporting unknown comments
+import re
+from array import array             # For compact lists of missed controls
+
+OK = 'ok'
+
+# Status codes as written in results, keyed in lower case
+STATUS_CODES = {
+    'dnf': 'dnf',
+    'mp': 'mp',
+    'rtd': 'rtd',
+    'ret': 'rtd',
+    'n/c': 'n/c',
+    'nc': 'n/c',
+    'dns': 'dns',
+    'dsq': 'dsq',
+    'disq': 'dsq'
+}
+
+# mm:ss or h:mm:ss, with the minutes allowed to go past 59 when there are no
+# hours e.g. 75:02
+TIME = re.compile(r'^(?:(\d+):)?(\d+):(\d{1,2})$')
+
+OUT_OF_ORDER = re.compile(r'(\d+)\s*out of order')
+MISSING = re.compile(r'missing\b(.*)')
+CONTROL_RANGE = re.compile(r'(\d+)(?:\s*-\s*(\d+))?')
+
+# The type code of the missed controls array, holding up to 65535
+CONTROLS_TYPE = 'H'
+
+# The number of values each parser remembers before starting again
+CACHE_SIZE = 50000
+
+# Every cached parser, in this and other modules
+CACHED_PARSERS = []
+
+logger = logging.getLogger(__name__)
+
+
+def cached(parser):
+    """
+    Decorates a parser of a single string such that its results are kept in
+    a lookup table. Cached values are shared, so must not be modified. The
+    parser itself remains available as the 'uncached' attribute.
+    """
+    table = {}
+
+    @functools.wraps(parser)
+    def wrapper(raw):
+        try:
+            return table[raw]
+        except KeyError:
+            if len(table) >= CACHE_SIZE:
+                table.clear()
+            value = table[raw] = parser(raw)
+            return value
+
+    wrapper.table = table
+    wrapper.uncached = parser
+    CACHED_PARSERS.append(wrapper)
+    return wrapper
+
+
+def clear_caches():
+    """
+    Empties the lookup table of every cached parser
+    """
+    for parser in CACHED_PARSERS:
+        parser.table.clear()
+
+
+@cached
+def parse_status(raw_status):
+    """
+    Returns the normalised status code, or the raw status if it is unknown
+    """
+    return STATUS_CODES.get(raw_status.lower(), raw_status)
+
+
+@cached
+def parse_position(raw_position):
+    """
+    Returns the (status, position) of a result from its position column,
+    with a position of None unless the runner was placed
+    """
+    raw_position = raw_position.rstrip('=;').strip()
+    if raw_position.isdigit():
+        return OK, raw_position
+    return parse_status(raw_position), None
+
+
+@cached
+def parse_time(raw_time):
+    """
+    Returns a time in whole seconds, or None if it is not a time
+    """
+    match = TIME.match(raw_time)
+    if match is None:
+        return None
+
+    hours, minutes, seconds = match.groups()
+    return (int(hours) * 3600 if hours else 0) + int(minutes) * 60 + int(seconds)
+
+
+def parse_missed(comment):
+    """
+    Returns the missed controls of a 'missing' comment e.g. 'missing 1,4-6'
+    becomes array('H', [1, 4, 5, 6])
+    """
+    missed = array(CONTROLS_TYPE)
+    for first, last in CONTROL_RANGE.findall(MISSING.search(comment).group(1)):
+        if last:
+            missed.extend(range(int(first), int(last) + 1))
+        else:
+            missed.append(int(first))
+    return missed
+
+
+def parse_out_of_order(comment):
+    """
+    Returns the number of controls visited out of order e.g. 5 for
+    '5 out of order'
+    """
+    return int(OUT_OF_ORDER.search(comment).group(1))
+
+
+# The phrase identifying each type of comment, the result field it sets and
+# the parser of the field's value. 'no finish time' sets nothing as the time
+# column holds 'dnf', which has already set the status.
+COMMENT_FIELDS = [
+    ('out of order', 'out_of_order', parse_out_of_order),
+    ('missing', 'missed', parse_missed),
+    ('no finish time', None, None)
+]
+
+
+@cached
+def parse_comment_fields(raw_comments):
+    """
+    Returns a tuple of (result field, value) pairs from the semicolon
+    separated comments of a result
+    """
+    comment_fields = []
+    for comment in raw_comments.lower().split(';'):
+        for phrase, field, parser in COMMENT_FIELDS:
+            if phrase in comment:
+                if field is not None:
+                    comment_fields.append((field, parser(comment)))
+                break
+        else:
+            logger.warning("Unknown comment: %s", comment.strip())
+    return tuple(comment_fields)
+
+
+def parse_comments(raw_comments, result):
+    """
+    Parses the comments of a result, such as the missed controls, into the
+    fields of the result record
+    """
+    for field, value in parse_comment_fields(raw_comments):
+        setattr(result, field, value)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A persistent, local record of the event results pages seen by previous
+crawls so that unchanged results do not have to be downloaded or parsed
+again.
+
+For each results URL the ETag and Last-Modified headers are kept, for use in
+conditional requests, along with a hash of the page content for servers that
+do not support conditional requests. The event pages that link to each known
+results page are also kept so that the crawl can stop once it only finds
+events that have been seen before.
+
+The fingerprint of a page is only recorded once its results have been
+stored: the spider stages it when the page has been handled, and the
+MongoPipeline confirms it once every document of the event has been written
+(or discards it if a batch failed), so that a failed write leaves the page
+to be parsed again by the next crawl.
+
+@author: abradbury
+"""
+
+import hashlib                      # For hashing the results page content
+import json                         # For storing the fingerprints on disk
+import os
+
+from scrapy.utils.python import to_native_str
+
+
+class FingerprintStore(object):
+    """
+    Fingerprints of the event results pages parsed by previous crawls
+    """
+
+    def __init__(self, path, pages=None, events=None):
+        self.path = path
+        self.pages = pages or {}    # Results URL: fingerprint dict
+        self.events = events or {}  # Event page URL: results URL
+        self.staged = {}            # Event ID: (results URL, fingerprint dict)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the store saved at the given path, or an empty store if no
+        crawl has saved one there yet
+        """
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path) as store_file:
+            stored = json.load(store_file)
+        return cls(path, stored.get('pages'), stored.get('events'))
+
+    def save(self):
+        """
+        Writes the store to disk, replacing the previous version in one step
+        so an interrupted crawl cannot leave a partially written file
+        """
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as store_file:
+            json.dump({'pages': self.pages, 'events': self.events},
+                      store_file, indent=1, sort_keys=True)
+        os.rename(temporary_path, self.path)
+
+    @staticmethod
+    def content_hash(response):
+        return hashlib.sha1(response.body).hexdigest()
+
+    def conditional_headers(self, results_url):
+        """
+        Returns the headers needed to make a conditional request for a known
+        results page, or an empty dict if the page has not been seen before
+        """
+        fingerprint = self.pages.get(results_url, {})
+        headers = {}
+        if fingerprint.get('etag'):
+            headers['If-None-Match'] = fingerprint['etag']
+        if fingerprint.get('last_modified'):
+            headers['If-Modified-Since'] = fingerprint['last_modified']
+        return headers
+
+    def is_unchanged(self, response):
+        """
+        Returns True if the server reported the results page as not modified
+        or if its content is identical to that seen in a previous crawl
+        """
+        if response.status == 304:
+            return True
+
+        fingerprint = self.pages.get(response.url)
+        return (fingerprint is not None and
+                fingerprint['content_hash'] == self.content_hash(response))
+
+    def is_known_event(self, event_url):
+        return event_url in self.events
+
+    def stage(self, doc_id, response):
+        """
+        Holds the fingerprint of a handled results page, for the event with
+        the given document ID, until the event has been stored
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        self.staged[doc_id] = (response.url, {
+            'etag': to_native_str(etag) if etag else None,
+            'last_modified': to_native_str(last_modified) if last_modified else None,
+            'content_hash': self.content_hash(response)
+        })
+
+    def confirm(self, doc_id, event_urls):
+        """
+        Records the staged fingerprint of a stored event's results page and
+        the event pages that link to it. The staged fingerprint is kept, as
+        the event is stored again if another event page links to it later.
+        """
+        if doc_id not in self.staged:
+            return
+
+        (results_url, fingerprint) = self.staged[doc_id]
+        self.pages[results_url] = fingerprint
+        for event_url in event_urls:
+            self.events[event_url] = results_url
+
+    def discard(self, doc_id):
+        """
+        Drops the staged fingerprint of an event that could not be stored
+        """
+        self.staged.pop(doc_id, None)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Derives stable identifiers for the documents stored in the database so that
+re-crawling the same event or club updates its existing document rather than
+adding a duplicate.
+
+@author: abradbury
+"""
+
+import hashlib                      # For deriving IDs from natural keys
+
+from bson.objectid import ObjectId
+from w3lib.url import canonicalize_url
+
+# Number of hexadecimal characters kept from the hash of a natural key
+ID_LENGTH = 24
+
+
+def document_id(key):
+    """
+    Returns a compact ID that is always the same for the same key
+    """
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:ID_LENGTH]
+
+
+def event_id(results_url):
+    """
+    Returns the ID of an event, derived from the URL of its results page (or
+    its event page if it has no results page)
+    """
+    return document_id(canonicalize_url(results_url))
+
+
+def course_id(event_doc_id, course_number):
+    """
+    Returns the ID of a course, derived from the ID of its event and the
+    position of the course on the event's results page
+    """
+    return document_id(event_doc_id + '/' + str(course_number))
+
+
+def legacy_event_id(document):
+    """
+    Returns the ID to give an event stored in the results collection. Events
+    stored before document IDs were introduced have an ObjectId, in which
+    case the ID is derived from the results URL as the crawler would do, or
+    is None if the event has no URL.
+    """
+    if not isinstance(document['_id'], ObjectId):
+        return document['_id']
+
+    results = document.get('results') or [{}]
+    url = document.get('url') or results[0].get('event', {}).get('url')
+    return event_id(url) if url else None
+
+
+def club_id(club_name):
+    return document_id(club_name.strip().upper())
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Resolves each result to a runner, giving every run a stable runner ID even
+though the same runner is written with different spellings, case, accents
+and clubs from one results page to the next.
+
+Names are reduced to a key: mojibake (UTF-8 read as Windows-1252, e.g.
+'SÃ¡enz') is repaired, accents are removed, case and punctuation are
+dropped and the words are sorted, so 'SÁENZ, Jimena' and 'Jimena Saenz'
+have the same key. A result is then resolved by, in order:
+
+    1. a runner with the same name key and club. A runner of another club
+       is only taken when one of the two has no club: a result without a
+       club goes to the only runner with the name key, and a result with a
+       club to the only runner with the name key who has only run without
+       one. Otherwise, runners who change club are kept apart, as they
+       cannot be told from namesakes.
+    2. a runner of the same club with a similar name, found through an
+       index of the trigrams of each club's names and scored by the Dice
+       coefficient of the trigrams (e.g. 'Jon Smith' and 'John Smith').
+       The words of the two names must start with the same letters, and
+       the age of the age class (e.g. 14 for M14) must be close to one the
+       runner has run in, so that 'Tom Brown' (M14) and 'Tim Brown' (M45)
+       are kept apart. Results without a club are not matched this way.
+    3. otherwise, a new runner
+
+Runners of a different sex (from the age class e.g. M21 or W45) are never
+matched. Both lookups are dictionary lookups whose size is bounded by the
+size of a club, so each result is resolved in near-constant time.
+
+The index is kept in a JSON file (IDENTITY_FILE) holding each runner's
+name, name keys, clubs, sex and age class ages; the lookups are rebuilt
+from it when loaded. It can be rebuilt from every run stored in MongoDB
+with:
+
+    python -m Orienteering_Scraper.identity --rebuild
+
+As the runner a result resolves to can depend on the results resolved
+before it, the runner ID stored with every run, and the Parquet export of
+the runs (see export.py), are rewritten to match the rebuilt index.
+
+@author: abradbury
+"""
+
+import argparse                     # For parsing the command line
+import json                         # For storing the index on disk
+import os
+import re                           # For removing punctuation from names
+import time                         # For timing the rebuild
+from collections import defaultdict  # For batching the rewritten runs
+import unicodedata                  # For removing accents from names
+
+from pymongo import MongoClient, ReplaceOne
+from scrapy.settings import Settings
+
+from Orienteering_Scraper.export import export_stored
+from Orienteering_Scraper.fields import cached
+from Orienteering_Scraper.identifiers import document_id
+from Orienteering_Scraper.queries import stored_runs
+
+# Characters that only appear in names when UTF-8 has been read as
+# Windows-1252 or Latin-1 e.g. 'Ã¡' for 'á'
+MOJIBAKE_MARKERS = re.compile(u'[ÂÃÅ][\u0080-¿‘-›Œ-Ÿ]')
+
+NOT_A_LETTER = re.compile(r'[^\w\s]|[\d_]', re.UNICODE)
+
+# The lowest Dice coefficient of the trigrams of two names for them to be
+# taken as the same runner of a club
+SIMILARITY_THRESHOLD = 0.75
+
+# The most that the ages of two age classes can differ by for a similar name
+# to be taken as the same runner, other than with the open class (21), which
+# can be run by anyone from the age of OPEN_CLASS_MIN_AGE
+AGE_CLASS_GAP = 10
+OPEN_CLASS_AGE = 21
+OPEN_CLASS_MIN_AGE = 16
+
+AGE = re.compile(r'\d+')
+
+# The number of rewritten documents replaced in each bulk write
+REBUILD_BATCH_SIZE = 1000
+
+EXACT = 'exact'
+SIMILAR = 'similar'
+NEW = 'new'
+
+
+def fix_mojibake(text):
+    """
+    Returns text with any UTF-8 that was read as Windows-1252 (or Latin-1)
+    decoded properly, or the text as it is if it does not look like mojibake
+    """
+    if not MOJIBAKE_MARKERS.search(text):
+        return text
+
+    for encoding in ('cp1252', 'latin-1'):
+        try:
+            return text.encode(encoding).decode('utf-8')
+        except UnicodeError:
+            pass
+    return text
+
+
+def clean_name(name):
+    """
+    Returns a name as it should be shown, with mojibake repaired and spacing
+    made consistent
+    """
+    return u' '.join(fix_mojibake(name or u'').split())
+
+
+@cached
+def name_key(name):
+    """
+    Returns the key of a name: without accents, case or punctuation and with
+    the words in order e.g. 'SÁENZ, Jimena' becomes 'jimena saenz'
+    """
+    decomposed = unicodedata.normalize('NFKD', fix_mojibake(name or u''))
+    unaccented = u''.join(c for c in decomposed if not unicodedata.combining(c))
+    return u' '.join(sorted(NOT_A_LETTER.sub(u' ', unaccented.lower()).split()))
+
+
+def club_key(club):
+    return (club or u'').strip().upper()
+
+
+def sex(age_class):
+    """
+    Returns 'M' or 'W' from an age class e.g. 'W45', or None if unknown
+    """
+    initial = (age_class or u'').strip()[:1].upper()
+    return initial if initial in (u'M', u'W') else None
+
+
+def same_sex(first_sex, second_sex):
+    return first_sex is None or second_sex is None or first_sex == second_sex
+
+
+def class_age(age_class):
+    """
+    Returns the age of an age class e.g. 45 for 'M45', or None if unknown
+    """
+    match = AGE.search(age_class or u'')
+    return int(match.group()) if match else None
+
+
+def compatible_ages(first_age, second_age):
+    """
+    Returns True if the same runner could have run in age classes of the two
+    ages, or if either is unknown
+    """
+    if first_age is None or second_age is None:
+        return True
+    if OPEN_CLASS_AGE in (first_age, second_age):
+        return min(first_age, second_age) >= OPEN_CLASS_MIN_AGE
+    return abs(first_age - second_age) <= AGE_CLASS_GAP
+
+
+def initials(key):
+    """
+    Returns the first letters of the words of a name key, in order
+    """
+    return sorted(word[0] for word in key.split())
+
+
+def trigrams(key):
+    padded = u'  ' + key + u' '
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(first_trigrams, second_trigrams):
+    """
+    Returns the Dice coefficient of two sets of trigrams
+    """
+    shared = len(first_trigrams & second_trigrams)
+    return 2.0 * shared / (len(first_trigrams) + len(second_trigrams))
+
+
+class IdentityIndex(object):
+    """
+    The known runners, looked up by name key and by the trigrams of the
+    names of each club's runners
+    """
+
+    def __init__(self, path, runners=None):
+        self.path = path
+        self.runners = {}       # Runner ID: runner dict
+        self.by_name = {}       # Name key: [runner ID]
+        self.by_trigram = {}    # (Club, trigram): set([runner ID])
+        self.counts = {EXACT: 0, SIMILAR: 0, NEW: 0}
+
+        for runner_id, runner in (runners or {}).items():
+            runner.setdefault('ages', [])
+            self.runners[runner_id] = runner
+            for key in runner['names']:
+                self.by_name.setdefault(key, []).append(runner_id)
+                for club in runner['clubs']:
+                    self.index_trigrams(runner_id, key, club)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the index saved at the given path, or an empty index if none
+        has been saved there yet
+        """
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path) as index_file:
+            return cls(path, json.load(index_file).get('runners'))
+
+    def save(self):
+        """
+        Writes the index to disk, replacing the previous version in one step
+        so that an interrupted crawl cannot leave a partial file
+        """
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as index_file:
+            json.dump({'runners': self.runners}, index_file, separators=(',', ':'),
+                      sort_keys=True)
+        os.rename(temporary_path, self.path)
+
+    def index_trigrams(self, runner_id, key, club):
+        for trigram in trigrams(key):
+            self.by_trigram.setdefault((club, trigram), set()).add(runner_id)
+
+    def same_name(self, key, club, runner_sex):
+        """
+        Returns the runner with a name key and club, or None. Without a club,
+        the only runner with the name key is returned, and with a club, the
+        only runner with the name key who has only run without a club.
+        """
+        candidates = sorted(runner_id for runner_id in self.by_name.get(key, [])
+                            if same_sex(self.runners[runner_id]['sex'], runner_sex))
+        for runner_id in candidates:
+            if club in self.runners[runner_id]['clubs']:
+                return runner_id
+
+        if club:
+            candidates = [runner_id for runner_id in candidates
+                          if self.runners[runner_id]['clubs'] == [u'']]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def similar_name(self, key, club, runner_sex, age=None):
+        """
+        Returns the runner of a club with the name most similar to a name
+        key, if similar enough, or None. Only names whose words start with
+        the same letters, of runners who have run in an age class of a
+        compatible age (or whose ages are unknown), are compared. Equally
+        similar runners are chosen between by ID, so that the same runner is
+        always chosen.
+        """
+        # Runners without a club are only ever matched by name
+        if not club:
+            return None
+
+        key_trigrams = trigrams(key)
+        shared = {}             # Runner ID: number of shared trigrams
+        for trigram in key_trigrams:
+            for runner_id in self.by_trigram.get((club, trigram), ()):
+                shared[runner_id] = shared.get(runner_id, 0) + 1
+
+        best = (SIMILARITY_THRESHOLD, None)
+        for runner_id, shared_count in shared.items():
+            # No runner can be similar enough without sharing this many
+            if 2.0 * shared_count / (len(key_trigrams) + shared_count) < SIMILARITY_THRESHOLD:
+                continue
+
+            runner = self.runners[runner_id]
+            if not same_sex(runner['sex'], runner_sex):
+                continue
+            if runner['ages'] and not any(compatible_ages(age, other_age)
+                                          for other_age in runner['ages']):
+                continue
+            for other_key in runner['names']:
+                if initials(other_key) != initials(key):
+                    continue
+                candidate = (similarity(key_trigrams, trigrams(other_key)), runner_id)
+                if candidate[0] >= best[0] and (best[1] is None or candidate > best):
+                    best = candidate
+        return best[1]
+
+    def resolve(self, name, club, age_class):
+        """
+        Returns the ID of the runner of a result and how the runner was found
+        (EXACT, SIMILAR or NEW), or (None, None) for a result with no name
+        """
+        key = name_key(name)
+        if not key:
+            return None, None
+
+        club = club_key(club)
+        runner_sex = sex(age_class)
+        age = class_age(age_class)
+
+        found = EXACT
+        runner_id = self.same_name(key, club, runner_sex)
+        if runner_id is None:
+            found = SIMILAR
+            runner_id = self.similar_name(key, club, runner_sex, age)
+
+        if runner_id is None:
+            found = NEW
+            runner_id = document_id(u'runner/' + key + u'|' + club + u'|' + (runner_sex or u''))
+            self.runners[runner_id] = {'name': clean_name(name), 'names': [], 'clubs': [],
+                                       'sex': runner_sex, 'ages': []}
+
+        self.add_alias(runner_id, key, club, runner_sex, age)
+        self.counts[found] += 1
+        return runner_id, found
+
+    def add_alias(self, runner_id, key, club, runner_sex, age=None):
+        """
+        Records a name key, club and age class age of a runner, if not
+        already known
+        """
+        runner = self.runners[runner_id]
+        if runner['sex'] is None:
+            runner['sex'] = runner_sex
+        if age is not None and age not in runner['ages']:
+            runner['ages'].append(age)
+
+        if key not in runner['names']:
+            runner['names'].append(key)
+            self.by_name.setdefault(key, []).append(runner_id)
+            for known_club in runner['clubs']:
+                self.index_trigrams(runner_id, key, known_club)
+
+        if club not in runner['clubs']:
+            runner['clubs'].append(club)
+            for known_key in runner['names']:
+                self.index_trigrams(runner_id, known_key, club)
+
+    def add_runner_ids(self, results):
+        """
+        Sets the 'runner_id' of each result (PersonItem dict) in a list
+        """
+        for result in results:
+            (result['runner_id'], _) = self.resolve(result.get('name'), result.get('club'),
+                                                   result.get('ageClass'))
+
+
+def rebuild(db, storage_layout, path):
+    """
+    Returns an index built from scratch from every run stored in MongoDB,
+    in the order they are stored, rewriting the runner ID stored with each
+    run whose runner has changed
+    """
+    # Imported here as the pipelines depend on this module
+    from Orienteering_Scraper.pipelines import add_content_hash
+
+    index = IdentityIndex(path)
+    replacements = defaultdict(list)    # Collection name: [ReplaceOne]
+    for collection_name, document, runs in stored_runs(db, storage_layout):
+        rewritten = False
+        for run in runs:
+            (runner_id, _) = index.resolve(run.get('name'), run.get('club'), run.get('ageClass'))
+            if run.get('runner_id') != runner_id:
+                run['runner_id'] = runner_id
+                rewritten = True
+
+        if not rewritten:
+            continue
+
+        # Documents stored without a content hash are stored as they were
+        if 'content_hash' in document:
+            add_content_hash(document)
+        replacements[collection_name].append(ReplaceOne({'_id': document['_id']}, document))
+        if len(replacements[collection_name]) >= REBUILD_BATCH_SIZE:
+            db[collection_name].bulk_write(replacements.pop(collection_name), ordered=False)
+
+    for collection_name, operations in replacements.items():
+        db[collection_name].bulk_write(operations, ordered=False)
+    return index
+
+
+def main():
+    settings = Settings()
+    settings.setmodule('Orienteering_Scraper.settings')
+
+    parser = argparse.ArgumentParser(description="Rebuild or query the runner identity index")
+    parser.add_argument('--mongo-uri', default=settings.get('MONGO_URI'))
+    parser.add_argument('--database', default=settings.get('MONGO_DATABASE'))
+    parser.add_argument('--layout', choices=['embedded', 'normalized'],
+                        default=settings.get('MONGO_STORAGE_LAYOUT'),
+                        help="storage layout to rebuild from")
+    parser.add_argument('--file', default=settings.get('IDENTITY_FILE'),
+                        help="identity index file")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="rebuild the index from every stored run")
+    parser.add_argument('--export', default=settings.get('RUNS_EXPORT_DIR'),
+                        help="Parquet dataset of the runs to export again after a rebuild, "
+                             "if it exists")
+    parser.add_argument('--name', help="show the runner a name resolves to")
+    parser.add_argument('--club', default='', help="club of the runner to show")
+    parser.add_argument('--age-class', default='', help="age class of the runner to show")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        start_time = time.time()
+        client = MongoClient(args.mongo_uri)
+        try:
+            index = rebuild(client[args.database], args.layout, args.file)
+            index.save()
+
+            print("{:d} runs resolved to {:d} runners in {:.1f}s ({:d} by name, {:d} by similar "
+                  "name)".format(sum(index.counts.values()), len(index.runners),
+                                 time.time() - start_time, index.counts[EXACT],
+                                 index.counts[SIMILAR]))
+
+            # The exported runs hold the runner IDs as they were
+            if args.export and os.path.isdir(args.export):
+                events_count, runs_count = export_stored(client[args.database], args.layout,
+                                                         args.export)
+                print("{:d} runs of {:d} events exported again to {}".format(
+                    runs_count, events_count, args.export))
+        finally:
+            client.close()
+    else:
+        index = IdentityIndex.load(args.file)
+
+    if args.name:
+        key = name_key(args.name)
+        runner_id = (index.same_name(key, club_key(args.club), sex(args.age_class)) or
+                     index.similar_name(key, club_key(args.club), sex(args.age_class),
+                                        class_age(args.age_class)))
+        if runner_id is None:
+            print("No runner found for " + args.name)
+        else:
+            print(runner_id + ": " + json.dumps(index.runners[runner_id], sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -13,16 +13,36 @@ from scrapy.item import Item, Field
 
 
 class EventSummaryItem(Item):
+    doc_id = Field()
     seq_id = Field()
     url = Field()
     name = Field()
     results_format = Field()
     status = Field()
-    results = Field()       # [PersonItem]
+    results = Field()       # [PersonItem], unless results are streamed
+    results_count = Field()
     courses = Field()       # [CourseItem]
+    event = Field()         # EventItem, only when results are streamed
+    venue = Field()         # VenueItem, only when results are streamed
+    referrers = Field()     # URLs of the event pages linking to the results
+
+
+class EventReferrersItem(Item):
+    doc_id = Field()        # Of the event summary, already yielded
+    referrers = Field()     # Every URL of the event pages linking to the results
+
+
+class CourseResultsItem(Item):
+    doc_id = Field()
+    event_id = Field()
+    course = Field()        # CourseItem
+    venue = Field()         # VenueItem
+    event = Field()         # EventItem
+    results = Field()       # [PersonItem] without course, venue and event
 
 
 class PersonItem(Item):
+    runner_id = Field()     # See identity.py
     name = Field()
     club = Field()
     ageClass = Field()
@@ -39,6 +59,7 @@ class ResultItem(Item):
     status = Field()
     missed = Field()
     out_of_order = Field()
+    behind = Field()        # Percentage behind the winner's time
 
 
 class CourseItem(Item):
@@ -46,6 +67,7 @@ class CourseItem(Item):
     length = Field()
     climb = Field()
     controls = Field()
+    statistics = Field()    # See course_stats.py
 
 
 class VenueItem(Item):
@@ -61,6 +83,7 @@ class EventItem(Item):
     url = Field()
 
 class ClubItem(Item):
+    doc_id = Field()
     name = Field()
     fullName = Field()
     association = Field()
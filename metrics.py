@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Per-stage timing and throughput metrics for the crawl.
+
+Spider callbacks decorated with @timed record how long they take in the
+crawler stats. The StageMetrics extension derives rates (items and results
+per second, parse time per result row, mean database write latency) from the
+stats, and regularly writes all the numeric stats to a file in the
+Prometheus text format, for collection by the node exporter.
+
+@author: abradbury
+"""
+
+import functools                    # For wrapping the timed callbacks
+import inspect                      # For timing generator callbacks
+import os
+import re
+import time                         # For timing callbacks
+
+from scrapy import signals
+from twisted.internet import task   # For writing the metrics periodically
+
+METRIC_PREFIX = 'orienteering_scraper_'
+INVALID_METRIC_CHARACTERS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def record_timing(stats, stage, seconds):
+    stats.inc_value('timing/{}/calls'.format(stage))
+    stats.inc_value('timing/{}/seconds'.format(stage), seconds)
+    stats.max_value('timing/{}/max_seconds'.format(stage), seconds)
+
+
+def timed_iteration(output, stats, stage):
+    """
+    Yields the output of a generator callback, timing only the time spent in
+    the callback itself and not in whatever is consuming its output
+    """
+    seconds = 0.0
+    iterator = iter(output)
+
+    while True:
+        start_time = time.time()
+        try:
+            value = next(iterator)
+        except StopIteration:
+            seconds += time.time() - start_time
+            break
+        seconds += time.time() - start_time
+        yield value
+
+    record_timing(stats, stage, seconds)
+
+
+def timed(stage):
+    """
+    Decorates a spider method such that the time taken by each call is
+    recorded in the crawler stats under timing/<stage>/
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(spider, *args, **kwargs):
+            start_time = time.time()
+            output = method(spider, *args, **kwargs)
+
+            if inspect.isgenerator(output):
+                return timed_iteration(output, spider.crawler.stats, stage)
+
+            record_timing(spider.crawler.stats, stage, time.time() - start_time)
+            return output
+        return wrapper
+    return decorator
+
+
+class StageMetrics(object):
+    """
+    Adds throughput rates to the crawler stats and writes the stats to a
+    Prometheus text format file, every METRICS_INTERVAL seconds and when the
+    spider closes. No file is written if METRICS_FILE is not set.
+    """
+
+    def __init__(self, stats, path, interval):
+        self.stats = stats
+        self.path = path
+        self.interval = interval
+        self.start_time = None
+        self.update_task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        extension = cls(crawler.stats, crawler.settings.get('METRICS_FILE'),
+                        crawler.settings.getfloat('METRICS_INTERVAL', 15))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        self.start_time = time.time()
+        self.update_task = task.LoopingCall(self.update, spider)
+        self.update_task.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.update_task is not None and self.update_task.running:
+            self.update_task.stop()
+        self.update(spider)
+
+    def update(self, spider):
+        self.update_rates()
+        if self.path:
+            self.write_metrics(spider)
+
+    def update_rates(self):
+        elapsed = time.time() - self.start_time
+        if elapsed <= 0:
+            return
+
+        stats = self.stats
+        results_count = stats.get_value('napier/results_processed', 0)
+        stats.set_value('rates/items_per_second', stats.get_value('item_scraped_count', 0) / elapsed)
+        stats.set_value('rates/results_per_second', results_count / elapsed)
+
+        # Results extracted in worker processes (see offload.py) are timed
+        # there, apart from building their items in parse_napier_common
+        if results_count > 0:
+            stats.set_value('rates/parse_seconds_per_result_row',
+                            (stats.get_value('timing/parse_napier_common/seconds', 0) +
+                             stats.get_value('timing/extract_results/seconds', 0)) / results_count)
+
+        layout_lookups = (stats.get_value('napier/layout_cache_hits', 0) +
+                          stats.get_value('napier/layout_cache_misses', 0))
+        if layout_lookups > 0:
+            stats.set_value('rates/layout_cache_hit_rate',
+                            stats.get_value('napier/layout_cache_hits', 0) / float(layout_lookups))
+
+        if stats.get_value('mongo/batches'):
+            stats.set_value('rates/mongo_flush_latency_mean',
+                            stats.get_value('mongo/flush_latency_total', 0) /
+                            stats.get_value('mongo/batches'))
+
+    def write_metrics(self, spider):
+        """
+        Writes each numeric stat as a gauge, replacing the previous file in
+        one step so that a partially written file is never collected
+        """
+        lines = []
+        for key, value in sorted(self.stats.get_stats().items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = METRIC_PREFIX + INVALID_METRIC_CHARACTERS.sub('_', key)
+            lines.append("# TYPE {} gauge".format(name))
+            lines.append("{}{{spider=\"{}\"}} {}".format(name, spider.name, repr(float(value))))
+
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as metrics_file:
+            metrics_file.write("\n".join(lines) + "\n")
+        os.rename(temporary_path, self.path)
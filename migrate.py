@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Migrates event results stored in the embedded layout (one document per event
+in the results collection, and one per course in the course_results
+collection for events whose results were streamed) to the normalised layout
+of separate events, courses and runs collections. The embedded collections
+are left as they are.
+
+Migrated documents are upserted by their IDs, so the migration can be re-run
+safely. Their content hashes are computed as the crawler computes them, but
+only match those of a crawl for the same content: results stored before the
+runner IDs (see identity.py), the times behind the winner and the course
+statistics (see course_stats.py) were added do not have them, so such events
+are rewritten in full the next time they are crawled.
+
+Events stored before document IDs were introduced that have no URL cannot be
+given the ID a crawl would give them, so are logged and not migrated.
+
+Usage:
+    python -m Orienteering_Scraper.migrate [--batch-size 1000]
+
+@author: abradbury
+"""
+
+import argparse                     # For parsing the command line
+import logging                      # For reporting events that cannot be migrated
+
+from pymongo import MongoClient, ReplaceOne
+from scrapy.settings import Settings
+
+from Orienteering_Scraper.identifiers import legacy_event_id
+from Orienteering_Scraper.pipelines import add_content_hash
+from Orienteering_Scraper.queries import embedded_event_documents
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(db, batch_size):
+    """
+    Normalises every event in the results collection, with its streamed
+    courses, writing the new documents in unordered bulk writes.
+
+    Returns:
+        the number of documents written to each collection, and the number
+        of events that could not be migrated
+    """
+    operations = {}     # Collection name: [ReplaceOne]
+    counts = {}
+    skipped_count = 0
+
+    def flush(collection_name):
+        if operations.get(collection_name):
+            db[collection_name].bulk_write(operations.pop(collection_name), ordered=False)
+
+    for document in db.results.find(no_cursor_timeout=True):
+        event_doc_id = legacy_event_id(document)
+        if event_doc_id is None:
+            logger.warning("Not migrating event %s (%s), which has no URL to give it an ID",
+                           document['_id'], document.get('name'))
+            skipped_count += 1
+            continue
+
+        for collection_name, new_document in embedded_event_documents(db, event_doc_id,
+                                                                      document):
+            add_content_hash(new_document)
+            pending = operations.setdefault(collection_name, [])
+            pending.append(ReplaceOne({'_id': new_document['_id']}, new_document, upsert=True))
+            counts[collection_name] = counts.get(collection_name, 0) + 1
+
+            if len(pending) >= batch_size:
+                flush(collection_name)
+
+    for collection_name in list(operations):
+        flush(collection_name)
+
+    return counts, skipped_count
+
+
+def main():
+    settings = Settings()
+    settings.setmodule('Orienteering_Scraper.settings')
+
+    parser = argparse.ArgumentParser(
+        description="Migrate the results collection to the normalised layout")
+    parser.add_argument('--mongo-uri', default=settings.get('MONGO_URI'))
+    parser.add_argument('--database', default=settings.get('MONGO_DATABASE'))
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="number of documents per bulk write")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    try:
+        counts, skipped_count = migrate(client[args.database], args.batch_size)
+    finally:
+        client.close()
+
+    for collection_name in sorted(counts):
+        print("{:d} documents written to {}".format(counts[collection_name], collection_name))
+    if skipped_count > 0:
+        print("{:d} events without a URL not migrated".format(skipped_count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Converts parsed results into a normalised storage layout, with separate
+events, courses and runs collections linked by compact IDs, rather than
+storing every result with its own copy of the course, venue and event.
+
+    events:   one document per event, including the venue
+    courses:  one document per course, with the ID of its event
+    runs:     one document per result, with the IDs of its event and course
+              and the event date (to allow runs to be queried by date)
+
+@author: abradbury
+"""
+
+import datetime                     # For parsing event dates
+import re                           # For parsing event dates
+
+from Orienteering_Scraper.identifiers import course_id, document_id
+
+EVENTS = 'events'
+COURSES = 'courses'
+RUNS = 'runs'
+
+# Formats of the dates found on results pages, after the day of the week and
+# any ordinal suffixes have been removed e.g. 'Saturday 14th January 2017'
+DATE_FORMATS = ('%d %B %Y', '%d %b %Y', '%d/%m/%Y', '%d/%m/%y', '%Y-%m-%d')
+
+ORDINAL_SUFFIX = re.compile(r'(?<=\d)(st|nd|rd|th)\b', re.IGNORECASE)
+DAY_OF_WEEK = re.compile(r'^(mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?\s+', re.IGNORECASE)
+
+
+def parse_event_date(raw_date):
+    """
+    Returns an event date as an ISO 8601 string (so that dates sort and can
+    be compared as strings), or None if the date is not in a known format
+    """
+    if not raw_date:
+        return None
+
+    cleaned_date = ORDINAL_SUFFIX.sub('', DAY_OF_WEEK.sub('', raw_date.strip()))
+    cleaned_date = ' '.join(cleaned_date.replace(',', ' ').split())
+
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(cleaned_date, date_format).date().isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+def run_id(course_doc_id, result_number):
+    return document_id(course_doc_id + '/' + str(result_number))
+
+
+def event_document(event_doc_id, summary, event_info, venue_info, courses_count):
+    """
+    Returns the document for an event from its summary and the event and venue
+    details that would otherwise be repeated on every result
+    """
+    event_info = event_info or {}
+    venue_info = venue_info or {}
+
+    return {
+        '_id': event_doc_id,
+        'name': event_info.get('name', summary.get('name')),
+        'date': parse_event_date(event_info.get('date')),
+        'raw_date': event_info.get('date'),
+        'venue': venue_info.get('name'),
+        'url': summary.get('url', event_info.get('url')),
+        'referrers': summary.get('referrers'),
+        'results_format': summary.get('results_format'),
+        'status': summary.get('status'),
+        'course_ids': [course_id(event_doc_id, i) for i in range(courses_count)],
+        'results_count': summary.get('results_count')
+    }
+
+
+def course_document(event_doc_id, course_doc_id, course_info):
+    document = dict(course_info)
+    document['_id'] = course_doc_id
+    document['event_id'] = event_doc_id
+    return document
+
+
+def run_document(course_doc, result_number, person, event_date):
+    """
+    Returns the document for a single result, without the copies of the
+    course, venue and event details
+    """
+    document = dict((key, value) for key, value in person.items()
+                    if key not in ('course', 'venue', 'event'))
+    document['_id'] = run_id(course_doc['_id'], result_number)
+    document['event_id'] = course_doc['event_id']
+    document['course_id'] = course_doc['_id']
+    document['date'] = event_date
+    return document
+
+
+def result_course_numbers(courses, results):
+    """
+    Returns the position on the results page of the course of each result
+    (or None if it cannot be found), from the results of every course in
+    course order.
+
+    When the number of runners of each course is known (see course_stats.py)
+    the results are counted off each course in turn. Otherwise, as in older
+    stored results, each result's copy of its course is matched by name to
+    the same or a later course than the previous result's.
+    """
+    runners_counts = [(course.get('statistics') or {}).get('runners') for course in courses]
+    if None not in runners_counts and sum(runners_counts) == len(results):
+        return [number for number, runners_count in enumerate(runners_counts)
+                for _ in range(runners_count)]
+
+    numbers = []
+    number = 0
+    for person in results:
+        name = (person.get('course') or {}).get('name')
+        later_number = number
+        while later_number < len(courses) and courses[later_number].get('name') != name:
+            later_number += 1
+
+        if later_number < len(courses):
+            number = later_number
+            numbers.append(number)
+        else:
+            numbers.append(None)
+    return numbers
+
+
+def normalize_event_summary(event_doc_id, summary):
+    """
+    Splits an event summary into event, course and run documents. The summary
+    either holds every result (as stored in the results collection) or, when
+    results are streamed, the event and venue details.
+
+    Returns:
+        a list of (collection name, document) tuples
+    """
+    results = summary.get('results') or []
+    courses = summary.get('courses') or []
+    context = results[0] if results else summary
+
+    event_doc = event_document(event_doc_id, summary, context.get('event'),
+                               context.get('venue'), len(courses))
+    documents = [(EVENTS, event_doc)]
+
+    # Streamed courses are normalised as they arrive
+    if 'results' not in summary:
+        return documents
+
+    # Each result is matched back to the position of its course on the
+    # results page, so that courses with the same name are kept apart
+    course_docs = [course_document(event_doc_id, course_id(event_doc_id, i), course)
+                   for i, course in enumerate(courses)]
+    documents.extend((COURSES, course_doc) for course_doc in course_docs)
+
+    # Results are numbered within their course
+    results_counts = [0] * len(courses)
+    for person, course_number in zip(results, result_course_numbers(courses, results)):
+        if course_number is not None:
+            documents.append((RUNS, run_document(course_docs[course_number],
+                                                 results_counts[course_number],
+                                                 person, event_doc['date'])))
+            results_counts[course_number] += 1
+
+    return documents
+
+
+def normalize_course_results(course_results):
+    """
+    Converts the results of a single, streamed, course into course and run
+    documents.
+
+    Returns:
+        a list of (collection name, document) tuples
+    """
+    course_doc = course_document(course_results['event_id'], course_results['doc_id'],
+                                 course_results['course'])
+    event_date = parse_event_date((course_results.get('event') or {}).get('date'))
+
+    documents = [(COURSES, course_doc)]
+    documents.extend((RUNS, run_document(course_doc, result_number, person, event_date))
+                     for result_number, person in enumerate(course_results['results']))
+    return documents
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Extracts the results of Napier Colour results pages in a pool of worker
+processes, so that parsing a large event does not stop the reactor from
+handling other responses, and so that a crawl can use every core.
+
+The ParseOffloadMiddleware sends the body of each downloaded results page
+to the pool to find its layout (see NapierSpider.extract_layout), then sends
+each course to the pool to have its results parsed, so that no single
+transfer between processes holds every result of a large event. The
+response is only passed on to the spider once every course has been parsed,
+with the courses in the 'extracted_results' meta key. The spider then only
+builds the items (see NapierSpider.parse_napier_common), taking one course
+at a time, so the crawl stats are still kept in the crawling process.
+
+The time spent in the workers is recorded under timing/extract_results/,
+so that the parse time per result row (see metrics.py) covers it.
+
+If a worker fails, or does not return within PARSE_TIMEOUT seconds (as when
+a worker process dies, which the pool never reports), the response is passed
+on without extracted results and the spider extracts them itself.
+
+@author: abradbury
+"""
+
+import logging                      # For reporting failed extractions
+from collections import deque       # For handing out one course at a time
+import multiprocessing              # For the pool of worker processes
+import time                         # For timing the extraction
+import traceback                    # For reporting failed extractions
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from twisted.internet import defer, reactor
+
+from Orienteering_Scraper import sniff
+from Orienteering_Scraper.metrics import record_timing
+
+logger = logging.getLogger(__name__)
+
+
+def in_worker(extract, *args):
+    """
+    Calls an extraction function of the spider, in a worker process.
+
+    Returns:
+        the output of the function (or None if it failed), the time taken in
+        seconds and the traceback of any failure
+    """
+    start_time = time.time()
+    try:
+        return extract(*args), time.time() - start_time, None
+    except Exception:
+        return None, time.time() - start_time, traceback.format_exc()
+
+
+def extract_layout(url, body, encoding):
+    # Imported here so that the spiders are only loaded by the workers
+    from Orienteering_Scraper.spiders.napier_spider import NapierSpider
+
+    return in_worker(lambda: NapierSpider.extract_layout(
+        HtmlResponse(url, body=body, encoding=encoding)))
+
+
+def extract_course(course_info, rows, column_indices):
+    from Orienteering_Scraper.spiders.napier_spider import NapierSpider
+
+    return in_worker(NapierSpider.extract_course, course_info, rows, column_indices)
+
+
+def take_each(courses):
+    """
+    Yields each course of a list, letting go of each as it is taken
+    """
+    remaining = deque(courses)
+    del courses[:]
+    while remaining:
+        yield remaining.popleft()
+
+
+class ParseOffloadMiddleware(object):
+    """
+    Extracts the results of results pages requested with the 'offload_parse'
+    meta key in PARSE_PROCESSES worker processes
+    """
+
+    def __init__(self, processes, stats, timeout):
+        self.stats = stats
+        self.timeout = timeout
+        self.pool = multiprocessing.Pool(processes)
+        self.reactor = reactor
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        processes = crawler.settings.getint('PARSE_PROCESSES')
+        if processes <= 0:
+            raise NotConfigured
+
+        middleware = cls(processes, crawler.stats, crawler.settings.getfloat('PARSE_TIMEOUT'))
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_response(self, request, response, spider):
+        if not request.meta.get('offload_parse') or response.status != 200:
+            return response
+
+        # Pages that will be skipped or are not parsed as Napier Colour are
+        # left to the spider
+        fingerprints = getattr(spider, 'fingerprints', None)
+        if fingerprints and fingerprints.is_unchanged(response):
+            return response
+        if sniff.results_format(response.body) != sniff.NAPIER_COLOUR:
+            return response
+
+        self.stats.inc_value('offload/pages', spider=spider)
+        extracted = self.run_in_pool(extract_layout, (response.url, response.body, response.encoding))
+        extracted.addCallback(self.extract_courses)
+        return extracted.addCallback(self.add_extracted_results, request, response, spider)
+
+    def run_in_pool(self, function, args):
+        """
+        Returns a Deferred that fires with the output of a function called in
+        a worker process, or with a failed output if there is none within
+        the timeout
+        """
+        output = defer.Deferred()
+
+        def timed_out():
+            self.stats.inc_value('offload/timeouts')
+            output.callback((None, self.timeout,
+                             "No output from the worker process after {:g}s".format(self.timeout)))
+
+        def returned(value):
+            if timeout.active():
+                timeout.cancel()
+                output.callback(value)
+
+        timeout = self.reactor.callLater(self.timeout, timed_out)
+        self.pool.apply_async(function, args,
+                              callback=lambda value: self.reactor.callFromThread(returned, value))
+        return output
+
+    def extract_courses(self, output):
+        """
+        Parses the results of each course of a page, whose layout has been
+        found, each course in its own call to a worker
+        """
+        (layout, seconds, failure) = output
+        if layout is None:
+            return output
+
+        column_indices = layout.pop('columns')
+        courses = [self.run_in_pool(extract_course, (course_info, rows, column_indices))
+                   for course_info, rows in layout.pop('course_rows')]
+        return defer.gatherResults(courses).addCallback(self.add_courses, layout, seconds)
+
+    @staticmethod
+    def add_courses(course_outputs, layout, seconds):
+        courses = []
+        for (course, course_seconds, failure) in course_outputs:
+            seconds += course_seconds
+            if course is None:
+                return None, seconds, failure
+            courses.append(course)
+
+        layout['courses'] = take_each(courses)
+        return layout, seconds, None
+
+    def add_extracted_results(self, output, request, response, spider):
+        (extracted, seconds, failure) = output
+
+        if extracted is None:
+            # The spider extracts the results itself, reporting the failure
+            self.stats.inc_value('offload/failures', spider=spider)
+            logger.error("Failed to extract results from %s in a worker process:\n%s",
+                         response.url, failure)
+        else:
+            record_timing(self.stats, 'extract_results', seconds)
+            request.meta['extracted_results'] = extracted
+        return response
+
+    def spider_closed(self, spider):
+        self.pool.close()
+        self.pool.join()
@@ -8,32 +8,452 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: http://doc.scrapy.org/topics/item-pipeline.html
 
-from pymongo import MongoClient
+import hashlib                      # For hashing document content
+import json                         # For hashing document content
+import logging                      # For reporting failed writes
+import time                         # For measuring the flush latency
+
+from pymongo import InsertOne, MongoClient, ReplaceOne
+from scrapy.exceptions import NotConfigured
+from twisted.internet import defer, reactor, task, threads
+from twisted.python.threadpool import ThreadPool    # For writing off the reactor thread
+
+from Orienteering_Scraper.export import document_rows, write_runs
+from Orienteering_Scraper.identity import IdentityIndex
+from Orienteering_Scraper.items import CourseResultsItem, EventReferrersItem, EventSummaryItem
+from Orienteering_Scraper.metrics import record_timing
+from Orienteering_Scraper.normalize import (COURSES, EVENTS, RUNS, normalize_course_results,
+                                            normalize_event_summary)
+from Orienteering_Scraper.queries import ensure_indexes
+from Orienteering_Scraper.rankings import Rankings
+
+# Fields that can differ between crawls of unchanged content, such as the
+# order in which events were found, are left out of the content hash
+UNHASHED_FIELDS = ('_id', 'content_hash', 'seq_id')
+
+# Ways of storing the results of an event:
+#   embedded:   one document per event in the results collection, each result
+#               holding a copy of its course, venue and event
+#   normalized: separate events, courses and runs collections
+EMBEDDED_LAYOUT = 'embedded'
+NORMALIZED_LAYOUT = 'normalized'
+
+# The collections holding the documents of each course of an event, for each
+# storage layout. These are numbered by position (see identifiers.course_id
+# and normalize.run_id), so once an event has been written, those of its
+# documents that were left by a previous crawl and not written again (e.g. as
+# a course now has fewer results) are deleted.
+COURSE_COLLECTIONS = {
+    EMBEDDED_LAYOUT: ['course_results'],
+    NORMALIZED_LAYOUT: [COURSES, RUNS]
+}
+
+logger = logging.getLogger(__name__)
+
+
+def add_content_hash(document):
+    """
+    Adds a hash of the content of a document, so that writes of unchanged
+    documents can be skipped, and returns the document
+    """
+    hashed = dict((key, value) for key, value in document.items()
+                  if key not in UNHASHED_FIELDS)
+    content = json.dumps(hashed, sort_keys=True, default=str)
+    document['content_hash'] = hashlib.sha1(content.encode('utf-8')).hexdigest()
+    return document
+
+
+def event_documents(item, streamed):
+    """
+    Returns the normalised documents of an event summary item (see
+    normalize.py), with those of its streamed courses. The documents of a
+    streamed course are held in the streamed dict until the event summary
+    that follows them, and None is returned. None is also returned for the
+    new referrers of an event, which hold no runs.
+    """
+    if isinstance(item, EventReferrersItem):
+        return None
+
+    if isinstance(item, CourseResultsItem):
+        streamed.setdefault(item['event_id'], []).extend(normalize_course_results(item))
+        return None
+
+    documents = normalize_event_summary(item['doc_id'], item)
+    return documents + streamed.pop(item['doc_id'], [])
+
 
 # From http://doc.scrapy.org/en/latest/topics/item-pipeline.html#write-items-to-mongodb
 class MongoPipeline(object):
+    """
+    Writes items to MongoDB. Items are buffered per collection and written
+    with unordered bulk writes once the buffer reaches the batch size or the
+    flush interval has passed, and always when the spider closes.
+
+    Items with a document ID are upserted by that ID, and are not written at
+    all if the stored document already has the same content hash.
 
-    def __init__(self, mongo_uri, mongo_db):
+    With write_threads set, batches are written by a pool of that many
+    threads so that the reactor is never blocked by the database. Once
+    max_pending_batches are being written, process_item returns a Deferred
+    that only fires when a batch completes, which holds back the crawl until
+    the database catches up.
+
+    Documents of an event's courses left over from a previous crawl are
+    deleted once the event summary arrives (see COURSE_COLLECTIONS).
+
+    The referrers of an event found after its summary (EventReferrersItem)
+    are set on the stored summary, once every batch that may hold the
+    summary has been written.
+
+    When crawling incrementally, the fingerprint of each event's results page
+    is confirmed once the event summary and every other document of the event
+    have been written, and discarded if any of them could not be written.
+    """
+
+    def __init__(self, mongo_uri, mongo_db, stats, batch_size=1, flush_interval=0,
+                 storage_layout=EMBEDDED_LAYOUT, write_threads=0, max_pending_batches=1):
         self.mongo_uri = mongo_uri
         self.mongo_db = mongo_db
+        self.stats = stats
+        self.storage_layout = storage_layout
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_threads = write_threads
+        self.max_pending_batches = max_pending_batches
+        self.buffers = {}       # Collection name: [document]
+        self.flush_task = None
+        self.write_pool = None
+        self.pending = set()    # Deferreds of the batches being written
+        self.waiting = []       # Deferreds of items held back until a batch completes
+        self.failed_batches = 0
+        self.fingerprints = None
+        self.buffered_events = {}   # Collection name: [event ID of each buffered document]
+        self.unwritten = {}     # Event ID: number of its documents not yet written
+        self.summaries = {}     # Event ID: referrers of its summary, until written
+        self.failed_events = set()
+        self.written_ids = {}   # Event ID: {collection name: [ID of each course document]}
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
             mongo_uri=crawler.settings.get('MONGO_URI'),
-            mongo_db=crawler.settings.get('MONGO_DATABASE')
+            mongo_db=crawler.settings.get('MONGO_DATABASE'),
+            stats=crawler.stats,
+            batch_size=crawler.settings.getint('MONGO_BATCH_SIZE', 1),
+            flush_interval=crawler.settings.getfloat('MONGO_FLUSH_INTERVAL', 0),
+            storage_layout=crawler.settings.get('MONGO_STORAGE_LAYOUT', EMBEDDED_LAYOUT),
+            write_threads=crawler.settings.getint('MONGO_WRITE_THREADS', 0),
+            max_pending_batches=crawler.settings.getint('MONGO_MAX_PENDING_BATCHES', 1)
         )
 
     def process_item(self, item, spider):
-        if spider.name == "clubs":
-            collection_name = "clubs"
-        else:
-            collection_name = "results"
+        if isinstance(item, EventReferrersItem):
+            self.update_referrers(item)
+            return item
+
+        event_id = None
+        if self.fingerprints is not None:
+            event_id = item['event_id'] if isinstance(item, CourseResultsItem) else item['doc_id']
+
+        documents = self.to_documents(item, spider)
+        for collection_name, document in documents:
+            buffered = self.buffers.setdefault(collection_name, [])
+            buffered.append(document)
+            self.buffered_events.setdefault(collection_name, []).append(event_id)
+            if event_id is not None:
+                self.unwritten[event_id] = self.unwritten.get(event_id, 0) + 1
 
-        self.db[collection_name].insert(dict(item))
+            if len(buffered) >= self.batch_size:
+                self.flush(collection_name)
+
+        if spider.name != "clubs":
+            self.remove_stale_documents(item, documents, event_id)
+
+        # The summary is only awaited once all of the event's documents are
+        # counted, as batches can be written while they are being buffered
+        if event_id is not None:
+            if isinstance(item, EventSummaryItem):
+                self.summaries[event_id] = list(item['referrers'])
+            self.settle_events([event_id])
+
+        if len(self.pending) >= self.max_pending_batches:
+            self.stats.inc_value('mongo/backpressure_waits')
+            waiting = defer.Deferred()
+            self.waiting.append(waiting)
+            return waiting.addCallback(lambda _: item)
         return item
 
+    def to_documents(self, item, spider):
+        """
+        Returns a list of (collection name, document) tuples to be written for
+        an item, according to the storage layout
+        """
+        if spider.name == "clubs":
+            return [("clubs", MongoPipeline.to_document(item))]
+
+        if self.storage_layout == NORMALIZED_LAYOUT:
+            if isinstance(item, CourseResultsItem):
+                documents = normalize_course_results(item)
+            else:
+                documents = normalize_event_summary(item['doc_id'], item)
+            return [(collection_name, add_content_hash(document))
+                    for collection_name, document in documents]
+
+        if isinstance(item, CourseResultsItem):
+            return [("course_results", MongoPipeline.to_document(item))]
+        return [("results", MongoPipeline.to_document(item))]
+
+    def flush(self, collection_name):
+        """
+        Writes all buffered items for a collection in a single unordered bulk
+        write, in the write pool if there is one, and records the batch in the
+        crawler stats
+        """
+        documents = self.buffers.pop(collection_name, [])
+        event_ids = self.buffered_events.pop(collection_name, [])
+        if len(documents) == 0:
+            return
+
+        self.write(self.write_batch, (collection_name, documents), self.record_batch,
+                   collection_name, len(documents), event_ids)
+
+    def write(self, write_function, args, record_function, collection_name, documents_count,
+              event_ids):
+        """
+        Calls a write function, in the write pool if there is one, then
+        records the result (or the failure) with the event ID of each
+        document written
+        """
+        if self.write_pool is None:
+            try:
+                written = write_function(*args)
+            except Exception:
+                self.events_failed(event_ids)
+                raise
+            record_function(written, event_ids)
+            return
+
+        written = threads.deferToThreadPool(reactor, self.write_pool, write_function, *args)
+        self.pending.add(written)
+        written.addCallbacks(record_function, self.record_failure,
+                             callbackArgs=(event_ids,),
+                             errbackArgs=(collection_name, documents_count, event_ids))
+        written.addBoth(self.batch_completed, written)
+
+    def remove_stale_documents(self, item, documents, event_id):
+        """
+        Collects the IDs of the course documents written for each event and,
+        once its summary arrives, deletes the event's other course documents
+        """
+        stale_event_id = item['event_id'] if isinstance(item, CourseResultsItem) else item['doc_id']
+        if isinstance(item, (CourseResultsItem, EventSummaryItem)):
+            written_ids = self.written_ids.setdefault(stale_event_id, dict(
+                (collection_name, []) for collection_name in COURSE_COLLECTIONS[self.storage_layout]))
+            for collection_name, document in documents:
+                if collection_name in written_ids:
+                    written_ids[collection_name].append(document['_id'])
+
+        if not isinstance(item, EventSummaryItem):
+            return
+
+        event_ids = []
+        if event_id is not None:
+            self.unwritten[event_id] = self.unwritten.get(event_id, 0) + 1
+            event_ids.append(event_id)
+        self.write(self.delete_stale, (stale_event_id, self.written_ids.pop(stale_event_id)),
+                   self.record_deletion, ', '.join(COURSE_COLLECTIONS[self.storage_layout]), 0,
+                   event_ids)
+
+    def update_referrers(self, item):
+        """
+        Sets the referrers of an event's stored summary, after the batches
+        already being written, one of which may hold the summary itself
+        """
+        collection_name = EVENTS if self.storage_layout == NORMALIZED_LAYOUT else 'results'
+        event_ids = []
+        if self.fingerprints is not None:
+            event_ids.append(item['doc_id'])
+            self.unwritten[item['doc_id']] = self.unwritten.get(item['doc_id'], 0) + 1
+            self.summaries[item['doc_id']] = list(item['referrers'])
+
+        self.flush(collection_name)
+        args = (collection_name, item['doc_id'], list(item['referrers']))
+        if self.write_pool is None or not self.pending:
+            self.write(self.write_referrers, args, self.record_referrers, collection_name, 1,
+                       event_ids)
+            return
+
+        earlier = defer.DeferredList(list(self.pending))
+        self.pending.add(earlier)
+        earlier.addCallback(lambda _: self.write(self.write_referrers, args, self.record_referrers,
+                                                 collection_name, 1, event_ids))
+        earlier.addBoth(self.batch_completed, earlier)
+
+    def write_referrers(self, collection_name, doc_id, referrers):
+        """
+        Sets the referrers of a stored event summary. As this can run in the
+        write pool, the stats are left to record_referrers.
+
+        Returns:
+            the number of documents updated
+        """
+        updated = self.db[collection_name].update_one({'_id': doc_id},
+                                                      {'$set': {'referrers': referrers}})
+        return updated.modified_count
+
+    def record_referrers(self, updated_count, event_ids=()):
+        self.events_written(event_ids)
+        self.stats.inc_value('mongo/referrers_updated', updated_count)
+
+    def delete_stale(self, event_id, written_ids):
+        """
+        Deletes the course documents of an event other than those just
+        written. As this can run in the write pool, the stats are left to
+        record_deletion.
+
+        Returns:
+            the number of documents deleted
+        """
+        deleted_count = 0
+        for collection_name, ids in written_ids.items():
+            deleted = self.db[collection_name].delete_many({'event_id': event_id,
+                                                            '_id': {'$nin': ids}})
+            deleted_count += deleted.deleted_count
+        return deleted_count
+
+    def record_deletion(self, deleted_count, event_ids=()):
+        self.events_written(event_ids)
+        self.stats.inc_value('mongo/stale_deleted', deleted_count)
+
+    def write_batch(self, collection_name, documents):
+        """
+        Writes documents to a collection, skipping those whose content is
+        unchanged. As this can run in the write pool, the stats are left to
+        record_batch.
+
+        Returns:
+            the number of documents written, the number skipped and the time
+            taken in seconds
+        """
+        start_time = time.time()
+        collection = self.db[collection_name]
+
+        # Look up the content hashes of the documents already stored
+        ids = [document['_id'] for document in documents if '_id' in document]
+        stored_hashes = dict((stored['_id'], stored.get('content_hash')) for stored in
+                             collection.find({'_id': {'$in': ids}}, {'content_hash': 1}))
+
+        operations = []
+        for document in documents:
+            if '_id' not in document:
+                operations.append(InsertOne(document))
+            elif stored_hashes.get(document['_id']) != document['content_hash']:
+                operations.append(ReplaceOne({'_id': document['_id']}, document, upsert=True))
+
+        if len(operations) > 0:
+            collection.bulk_write(operations, ordered=False)
+        return len(operations), len(documents) - len(operations), time.time() - start_time
+
+    def record_batch(self, written, event_ids=()):
+        (documents_count, skipped_count, latency) = written
+        self.events_written(event_ids)
+        self.stats.inc_value('mongo/batches')
+        self.stats.inc_value('mongo/documents', documents_count)
+        self.stats.inc_value('mongo/unchanged_skipped', skipped_count)
+        self.stats.inc_value('mongo/flush_latency_total', latency)
+        self.stats.set_value('mongo/flush_latency_last', latency)
+        self.stats.max_value('mongo/flush_latency_max', latency)
+
+    def record_failure(self, failure, collection_name, documents_count, event_ids=()):
+        """
+        Logs a failed batch, rather than failing the crawl, and counts the
+        documents that were not written
+        """
+        self.events_failed(event_ids)
+        self.failed_batches += 1
+        self.stats.inc_value('mongo/failed_batches')
+        self.stats.inc_value('mongo/failed_documents', documents_count)
+        logger.error("Failed to write %d documents to %s: %s", documents_count,
+                     collection_name, failure.getErrorMessage())
+
+    def events_written(self, event_ids):
+        """
+        Counts the documents written for each event, given the event ID of
+        each document (None if not tracked)
+        """
+        for event_id in event_ids:
+            if event_id is not None:
+                self.unwritten[event_id] -= 1
+        self.settle_events(event_ids)
+
+    def events_failed(self, event_ids):
+        """
+        Counts the documents of each event that could not be written, given
+        the event ID of each document, so that the events are not confirmed
+        """
+        self.failed_events.update(event_id for event_id in event_ids if event_id is not None)
+        self.events_written(event_ids)
+
+    def settle_events(self, event_ids):
+        """
+        Confirms the fingerprint of each event whose summary and every other
+        document have been written, or discards it if any failed
+        """
+        for event_id in set(event_ids):
+            if event_id not in self.summaries or self.unwritten.get(event_id, 0) > 0:
+                continue
+
+            referrers = self.summaries.pop(event_id)
+            self.unwritten.pop(event_id, None)
+            if event_id in self.failed_events:
+                self.failed_events.discard(event_id)
+                self.fingerprints.discard(event_id)
+            else:
+                self.fingerprints.confirm(event_id, referrers)
+
+    def batch_completed(self, _, written):
+        """
+        Releases items held back by process_item now that a batch is done
+        """
+        self.pending.discard(written)
+        while self.waiting and len(self.pending) < self.max_pending_batches:
+            self.waiting.pop(0).callback(None)
+
+    @staticmethod
+    def to_document(item):
+        """
+        Converts an item to a MongoDB document, using the item's document ID
+        (if it has one) as the _id and adding a hash of the content
+        """
+        document = dict(item)
+        doc_id = document.pop('doc_id', None)
+
+        if doc_id is not None:
+            add_content_hash(document)
+            document['_id'] = doc_id
+
+        return document
+
+    def flush_all(self):
+        for collection_name in list(self.buffers):
+            self.flush(collection_name)
+
+    @defer.inlineCallbacks
     def close_spider(self, spider):
+        if self.flush_task is not None and self.flush_task.running:
+            self.flush_task.stop()
+        self.flush_all()
+
+        # Wait for the write pool to finish the remaining batches, including
+        # any written once earlier batches completed
+        while self.pending:
+            yield defer.DeferredList(list(self.pending))
+        if self.write_pool is not None:
+            self.write_pool.stop()
+        if self.failed_batches > 0:
+            logger.error("%d batches of documents could not be written to MongoDB",
+                         self.failed_batches)
+
         # Close DB connection
         self.client.close()
         print("Spider closed (blah)")
@@ -42,4 +462,138 @@ class MongoPipeline(object):
         # Open DB connection
         self.client = MongoClient(self.mongo_uri)
         self.db = self.client[self.mongo_db]
+
+        if spider.name != "clubs":
+            ensure_indexes(self.db, self.storage_layout)
+            self.fingerprints = getattr(spider, 'fingerprints', None)
+
+        if self.write_threads > 0:
+            self.write_pool = ThreadPool(minthreads=1, maxthreads=self.write_threads,
+                                         name='MongoPipeline')
+            self.write_pool.start()
+
+        if self.flush_interval > 0:
+            self.flush_task = task.LoopingCall(self.flush_all)
+            self.flush_task.start(self.flush_interval, now=False)
         print("Spider opened (blah)")
+
+
+class ColumnarExportPipeline(object):
+    """
+    Exports the runs of each event to the Parquet dataset in RUNS_EXPORT_DIR
+    (see export.py). When results are streamed, the runs of each course are
+    held until the event summary that follows them, so that every event is
+    exported to a single file.
+    """
+
+    def __init__(self, directory, stats):
+        self.directory = directory
+        self.stats = stats
+        self.streamed = {}      # Event ID: [(collection name, document)]
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        directory = crawler.settings.get('RUNS_EXPORT_DIR')
+        if not directory:
+            raise NotConfigured
+        return cls(directory, crawler.stats)
+
+    def process_item(self, item, spider):
+        if spider.name == "clubs":
+            return item
+
+        start_time = time.time()
+        documents = event_documents(item, self.streamed)
+        if documents is None:
+            return item
+
+        rows = document_rows(documents)
+        if len(rows) > 0:
+            write_runs(self.directory, documents[0][1]['date'], item['doc_id'], rows)
+            self.stats.inc_value('export/events')
+            self.stats.inc_value('export/runs', len(rows))
+            record_timing(self.stats, 'export_runs', time.time() - start_time)
+        return item
+
+
+class RankingPipeline(object):
+    """
+    Updates the runner and club rankings in RANKINGS_FILE with the results of
+    each event as it is crawled (see rankings.py). The scores of an event
+    crawled again without any runs are removed, as the MongoPipeline removes
+    its stored runs. As the runs are scored by runner ID, this must run after
+    the IdentityPipeline.
+    """
+
+    def __init__(self, path, stats):
+        self.path = path
+        self.stats = stats
+        self.rankings = None
+        self.streamed = {}      # Event ID: [(collection name, document)]
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('RANKINGS_FILE')
+        if not path:
+            raise NotConfigured
+        return cls(path, crawler.stats)
+
+    def open_spider(self, spider):
+        self.rankings = Rankings.load(self.path)
+
+    def process_item(self, item, spider):
+        if spider.name == "clubs":
+            return item
+
+        start_time = time.time()
+        documents = event_documents(item, self.streamed)
+        if documents is None:
+            return item
+
+        runners_count = self.rankings.update_event(item['doc_id'], documents)
+        self.stats.inc_value('rankings/events')
+        self.stats.inc_value('rankings/runners_updated', runners_count)
+        record_timing(self.stats, 'update_rankings', time.time() - start_time)
+        return item
+
+    def close_spider(self, spider):
+        self.rankings.save()
+
+
+class IdentityPipeline(object):
+    """
+    Gives each result the ID of its runner, from the runner identity index
+    in IDENTITY_FILE (see identity.py). As the ID is stored with the result,
+    this must run before the MongoPipeline.
+    """
+
+    def __init__(self, path, stats):
+        self.path = path
+        self.stats = stats
+        self.index = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('IDENTITY_FILE')
+        if not path:
+            raise NotConfigured
+        return cls(path, crawler.stats)
+
+    def open_spider(self, spider):
+        self.index = IdentityIndex.load(self.path)
+
+    def process_item(self, item, spider):
+        if spider.name == "clubs" or not item.get('results'):
+            return item
+
+        start_time = time.time()
+        runners_count = len(self.index.runners)
+        self.index.add_runner_ids(item['results'])
+
+        self.stats.inc_value('identity/results', len(item['results']))
+        self.stats.inc_value('identity/new_runners', len(self.index.runners) - runners_count)
+        record_timing(self.stats, 'resolve_runners', time.time() - start_time)
+        return item
+
+    def close_spider(self, spider):
+        self.index.save()
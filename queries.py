@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+The indexes needed to look up runners, clubs and courses quickly, and the
+queries that make use of them.
+
+The queries are made against the normalised layout (see normalize.py), in
+which each result is a document in the runs collection, and raise a
+ValueError for the embedded layout, which has no runs collection. Indexes are
+also declared for the embedded layout so that queries such as
+    db.results.find({ 'results.name': 'Bob Smith' })
+do not have to scan every event.
+
+@author: abradbury
+"""
+
+import sys
+
+from bson.codec_options import CodecOptions
+from bson.son import SON
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from Orienteering_Scraper.identifiers import course_id, legacy_event_id
+from Orienteering_Scraper.normalize import (COURSES, EVENTS, RUNS, normalize_course_results,
+                                            normalize_event_summary)
+
+# Collection name: [index keys], for each storage layout
+INDEXES = {
+    'embedded': {
+        'results': [
+            [('results.name', ASCENDING)],
+            [('results.club', ASCENDING)],
+            [('results.ageClass', ASCENDING)],
+            [('results.event.date', ASCENDING)],
+            [('results.course.name', ASCENDING)]
+        ],
+        'course_results': [
+            [('event_id', ASCENDING)]
+        ]
+    },
+    'normalized': {
+        RUNS: [
+            [('name', ASCENDING), ('date', DESCENDING)],
+            [('club', ASCENDING), ('date', DESCENDING)],
+            [('ageClass', ASCENDING), ('date', DESCENDING)],
+            [('date', DESCENDING)],
+            [('course_id', ASCENDING), ('result.status', ASCENDING), ('result.time', ASCENDING)],
+            [('event_id', ASCENDING), ('course_id', ASCENDING)]
+        ],
+        COURSES: [
+            [('event_id', ASCENDING)]
+        ],
+        EVENTS: [
+            [('date', DESCENDING)]
+        ]
+    }
+}
+
+
+def ensure_indexes(db, storage_layout):
+    """
+    Creates any of the declared indexes for a storage layout that do not
+    already exist
+    """
+    for collection_name, indexes in INDEXES[storage_layout].items():
+        db[collection_name].create_indexes([IndexModel(keys) for keys in indexes])
+
+
+def runs_collection(db, storage_layout):
+    """
+    Returns the runs collection of a storage layout. Raises a ValueError for
+    the embedded layout, whose runs are held within each event, rather than
+    querying an empty collection.
+    """
+    if storage_layout != 'normalized':
+        raise ValueError("Runs can only be looked up in the normalized storage layout, not the "
+                         "{} layout. Migrate the stored results with "
+                         "python -m Orienteering_Scraper.migrate".format(storage_layout))
+    return db[RUNS]
+
+
+def runs_by_runner(db, storage_layout, name):
+    """
+    Returns a cursor over all the runs by a runner, most recent first
+    """
+    return runs_collection(db, storage_layout).find({'name': name}).sort('date', DESCENDING)
+
+
+def club_results(db, storage_layout, club, start_date, end_date):
+    """
+    Returns a cursor over the runs by members of a club between two ISO 8601
+    dates (inclusive), most recent first
+    """
+    return runs_collection(db, storage_layout)\
+        .find({'club': club, 'date': {'$gte': start_date, '$lte': end_date}})\
+        .sort('date', DESCENDING)
+
+
+def course_leaderboard(db, storage_layout, course_id, limit=0):
+    """
+    Returns a cursor over the successful runs on a course, fastest first
+    """
+    return runs_collection(db, storage_layout)\
+        .find({'course_id': course_id, 'result.status': 'ok'})\
+        .sort('result.time', ASCENDING).limit(limit)
+
+
+def event_runs(db, storage_layout, event_id):
+    """
+    Returns a cursor over all the runs of an event, grouped by course. With
+    the course statistics and each run's percentage behind the winner stored
+    at ingest (see course_stats.py), this is all an event's page needs.
+    """
+    return runs_collection(db, storage_layout).find({'event_id': event_id})\
+        .sort('course_id', ASCENDING)
+
+
+def stored_events(db, storage_layout):
+    """
+    Yields the ID and normalised documents (see normalize.py) of every event
+    stored in either storage layout, one event at a time. In the embedded
+    layout, the courses of an event whose results were streamed are read from
+    the course_results collection, and an event stored before document IDs
+    were introduced without a URL has the ID of its ObjectId.
+    """
+    if storage_layout == 'embedded':
+        for document in db.results.find(no_cursor_timeout=True):
+            event_doc_id = legacy_event_id(document) or str(document['_id'])
+            yield event_doc_id, embedded_event_documents(db, event_doc_id, document)
+        return
+
+    for event_doc in db[EVENTS].find(no_cursor_timeout=True):
+        documents = [(EVENTS, event_doc)]
+        for course_doc in db[COURSES].find({'event_id': event_doc['_id']}):
+            documents.append((COURSES, course_doc))
+            documents.extend((RUNS, run_doc) for run_doc in
+                             db[RUNS].find({'course_id': course_doc['_id']}))
+        yield event_doc['_id'], documents
+
+
+def embedded_event_documents(db, event_doc_id, document):
+    """
+    Returns the normalised documents of an event stored in the embedded
+    layout, with those of its courses in the course_results collection if
+    its results were streamed
+    """
+    documents = normalize_event_summary(event_doc_id, document)
+    if 'results' not in document:
+        for course_results in streamed_courses(db, event_doc_id, document):
+            documents.extend(normalize_course_results(course_results))
+    return documents
+
+
+def streamed_courses(db, event_doc_id, summary):
+    """
+    Returns the stored course_results documents of an event whose results
+    were streamed, in course order, each with its 'doc_id' as in the
+    CourseResultsItem it was stored from
+    """
+    numbers = dict((course_id(event_doc_id, number), number)
+                   for number in range(len(summary.get('courses') or [])))
+    courses = [dict(document, doc_id=document['_id'])
+               for document in db.course_results.find({'event_id': event_doc_id})]
+    return sorted(courses, key=lambda course: (numbers.get(course['doc_id'], len(numbers)),
+                                               course['doc_id']))
+
+
+def stored_runs(db, storage_layout):
+    """
+    Yields every stored document holding runs, in either storage layout, as
+    a (collection name, document, [run dict]) tuple. The run dicts are those
+    of the document itself, so changes to them can be written back by
+    replacing the document.
+    """
+    if storage_layout == 'embedded':
+        for collection_name in ('results', 'course_results'):
+            for document in db[collection_name].find(no_cursor_timeout=True):
+                yield collection_name, document, document.get('results') or []
+        return
+
+    for run_doc in db[RUNS].find(no_cursor_timeout=True):
+        yield RUNS, run_doc, [run_doc]
+
+
+def plan_stages(plan):
+    """
+    Returns the names of all the stages in a query plan, as found in the
+    output of explain()
+    """
+    stages = [plan.get('stage')]
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            stages.extend(plan_stages(child))
+    return stages
+
+
+def ordered_database(db):
+    """
+    Returns a database whose documents are decoded as SON, keeping the order
+    of their keys. Query plans must be explained through it, as the order of
+    the keys of a compound index is otherwise lost by Python 2 dicts.
+    """
+    return db.client.get_database(db.name, codec_options=CodecOptions(document_class=SON))
+
+
+def plan_index_keys(plan):
+    """
+    Returns the keys of each index scanned in a query plan, as lists of
+    (field, direction) tuples in the form used by INDEXES. The plan must have
+    been decoded with the order of its keys kept (see ordered_database).
+    """
+    keys = []
+    if plan.get('stage') == 'IXSCAN':
+        key_pattern = plan['keyPattern']
+        if type(key_pattern) is dict and len(key_pattern) > 1 and sys.version_info < (3, 7):
+            raise TypeError("The order of the index keys has been lost: explain the query "
+                            "through ordered_database")
+        keys.append([(field, int(direction)) for field, direction in key_pattern.items()])
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            keys.extend(plan_index_keys(child))
+    return keys
+
+
+def winning_plan(cursor):
+    """
+    Returns the winning plan of a query, from the output of explain(). The
+    cursor's collection decides how the plan is decoded, so to keep the order
+    of index keys the query should be made on ordered_database(db).
+    """
+    plan = cursor.explain()['queryPlanner']['winningPlan']
+
+    # Servers with the slot based execution engine nest the plan
+    return plan.get('queryPlan', plan)
+
+
+def uses_index(cursor):
+    """
+    Returns True if the winning plan for a query does not scan the whole
+    collection
+    """
+    return 'COLLSCAN' not in plan_stages(winning_plan(cursor))
+
+
+def used_indexes(cursor):
+    """
+    Returns the keys of the indexes scanned by the winning plan for a query
+    """
+    return plan_index_keys(winning_plan(cursor))
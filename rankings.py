@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Runner and club rankings, updated incrementally from each newly crawled
+event rather than recomputed over every result after each crawl.
+
+Each finisher of a course scores points from the ratio of the winning time
+to their time, with the winner scoring POINTS:
+
+    points = POINTS * winning time / time
+
+Runners are identified by the runner ID given to each result (see
+identity.py), so a runner's scores are kept together across spellings of
+their name and across clubs. Results stored without a runner ID fall back
+to their name and club as written.
+
+Runners are ranked on their league score, the total of their best
+LEAGUE_EVENTS scores, and on their personal best score. Clubs are ranked on
+the total league score of their runners, each runner counting for the club
+they have run for at the most events.
+
+The state is kept in a JSON file (RANKINGS_FILE) holding each runner's
+score and club at each event, the runners of each event and the club
+totals, with all points as integers. Adding an event only updates its
+runners and their clubs, and an event that is crawled again (as its results
+have changed) first has its previous scores removed, as does an event
+crawled again without any results. A full rebuild from the results stored
+in MongoDB gives the same state, which can be checked with:
+
+    python -m Orienteering_Scraper.rankings --rebuild --verify
+
+@author: abradbury
+"""
+
+import argparse                     # For parsing the command line
+import json                         # For storing the rankings on disk
+import os
+from collections import Counter     # For finding each runner's club
+
+from pymongo import MongoClient
+from scrapy.settings import Settings
+
+from Orienteering_Scraper.fields import OK, parse_time
+from Orienteering_Scraper.normalize import RUNS
+from Orienteering_Scraper.queries import stored_events
+
+# The points scored by the winner of a course
+POINTS = 1000
+
+# The number of a runner's best scores counted towards their league score
+LEAGUE_EVENTS = 6
+
+
+def runner_key(run):
+    """
+    Returns the key of the runner of a run: their runner ID or, for a run
+    stored without one, their name and club as written in results
+    """
+    if run.get('runner_id'):
+        return run['runner_id']
+    return (u' '.join((run.get('name') or u'').split()).lower() + u'|' +
+            (run.get('club') or u'').strip().upper())
+
+
+def course_points(runs):
+    """
+    Returns the points of each finisher of a course.
+
+    Args:
+        runs: a list of (runner, status, time in seconds) tuples, where the
+            runner is any value identifying the runner
+    Returns:
+        a list of (runner, points) tuples
+    """
+    finishers = [(runner, time) for runner, status, time in runs if status == OK and time]
+    if len(finishers) == 0:
+        return []
+
+    winning_time = min(time for _, time in finishers)
+    return [(runner, int(round(POINTS * float(winning_time) / time)))
+            for runner, time in finishers]
+
+
+def event_runs(documents):
+    """
+    Returns the runs of each course of an event from its normalised documents
+    (see normalize.py).
+
+    Returns:
+        a dict of course ID: [((runner key, name, club), status, time in
+        seconds)]
+    """
+    courses = {}
+    for collection_name, document in documents:
+        if collection_name == RUNS:
+            result = document.get('result') or {}
+            raw_time = result.get('time')
+            runner = (runner_key(document), document.get('name') or u'',
+                      (document.get('club') or u'').strip().upper())
+            courses.setdefault(document['course_id'], []).append(
+                (runner, result.get('status'), parse_time(raw_time) if raw_time else None))
+    return courses
+
+
+class Rankings(object):
+    """
+    The scores of every runner at every event, and the league scores of
+    every runner and club
+    """
+
+    def __init__(self, path, runners=None, events=None, clubs=None):
+        self.path = path
+        self.runners = runners or {}    # Runner key: runner dict
+        self.events = events or {}      # Event ID: [runner key]
+        self.clubs = clubs or {}        # Club: league score
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the rankings saved at the given path, or empty rankings if
+        none have been saved there yet. Raises a ValueError if the rankings
+        need to be rebuilt.
+        """
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path) as rankings_file:
+            stored = json.load(rankings_file)
+
+        # Rankings saved before runners were keyed by runner ID
+        if any('clubs' not in runner for runner in stored.get('runners', {}).values()):
+            raise ValueError(path + " holds rankings keyed by name and club, rebuild them with "
+                             "python -m Orienteering_Scraper.rankings --rebuild")
+        return cls(path, stored.get('runners'), stored.get('events'), stored.get('clubs'))
+
+    def save(self):
+        """
+        Writes the rankings to disk, replacing the previous version in one
+        step so that an interrupted crawl cannot leave a partial file
+        """
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as rankings_file:
+            json.dump(self.state(), rankings_file, separators=(',', ':'), sort_keys=True)
+        os.rename(temporary_path, self.path)
+
+    def state(self):
+        return {'runners': self.runners, 'events': self.events, 'clubs': self.clubs}
+
+    @staticmethod
+    def league_score(runner):
+        return sum(sorted(runner['scores'].values(), reverse=True)[:LEAGUE_EVENTS])
+
+    @staticmethod
+    def main_club(runner):
+        """
+        Returns the club a runner has run for at the most events, the first
+        by name of equally frequent clubs
+        """
+        counts = Counter(runner['clubs'].values())
+        return min(counts, key=lambda club: (-counts[club], club))
+
+    def add_club_score(self, club, points):
+        score = self.clubs.get(club, 0) + points
+        if score == 0:
+            self.clubs.pop(club, None)
+        else:
+            self.clubs[club] = score
+
+    def set_score(self, key, event_id, points, club=None):
+        """
+        Sets (or with points of None, removes) a runner's score and club at
+        an event, updating their league score and that of their club
+        """
+        runner = self.runners[key]
+        self.add_club_score(runner['club'], -runner['league'])
+        if points is None:
+            runner['scores'].pop(event_id, None)
+            runner['clubs'].pop(event_id, None)
+        else:
+            runner['scores'][event_id] = points
+            runner['clubs'][event_id] = club
+
+        if len(runner['scores']) == 0:
+            del self.runners[key]
+            return
+
+        runner['league'] = Rankings.league_score(runner)
+        runner['club'] = Rankings.main_club(runner)
+        self.add_club_score(runner['club'], runner['league'])
+
+    def remove_event(self, event_id):
+        for key in self.events.pop(event_id, []):
+            self.set_score(key, event_id, None)
+
+    def update_event(self, event_id, documents):
+        """
+        Replaces the scores of an event with those of its normalised
+        documents, removing them if the documents hold no runs. Returns the
+        number of runners scored.
+        """
+        self.remove_event(event_id)
+
+        # A runner on more than one course of an event keeps their best score
+        scores = {}
+        for runs in event_runs(documents).values():
+            for (key, name, club), points in course_points(runs):
+                if key not in scores or points > scores[key][2]:
+                    scores[key] = (name, club, points)
+
+        for key, (name, club, points) in scores.items():
+            runner = self.runners.setdefault(key, {'club': club, 'clubs': {}, 'scores': {},
+                                                   'league': 0})
+            runner['name'] = u' '.join(name.split())
+            self.set_score(key, event_id, points, club)
+
+        if len(scores) > 0:
+            self.events[event_id] = sorted(scores)
+        return len(scores)
+
+    def league_table(self, limit=None):
+        """
+        Returns a list of (league score, name, club) tuples, highest first
+        """
+        table = sorted(((runner['league'], runner['name'], runner['club'])
+                        for runner in self.runners.values()), key=lambda row: (-row[0],) + row[1:])
+        return table[:limit]
+
+    def personal_bests(self, limit=None):
+        """
+        Returns a list of (best score, name, club) tuples, highest first
+        """
+        table = sorted(((max(runner['scores'].values()), runner['name'], runner['club'])
+                        for runner in self.runners.values()), key=lambda row: (-row[0],) + row[1:])
+        return table[:limit]
+
+    def club_table(self, limit=None):
+        """
+        Returns a list of (league score, club) tuples, highest first
+        """
+        return sorted(((score, club) for club, score in self.clubs.items()),
+                      key=lambda row: (-row[0], row[1]))[:limit]
+
+
+def rebuild(db, storage_layout, path):
+    """
+    Returns rankings built from scratch from every event stored in MongoDB
+    """
+    rankings = Rankings(path)
+    for event_doc_id, documents in stored_events(db, storage_layout):
+        rankings.update_event(event_doc_id, documents)
+    return rankings
+
+
+def ranked_state(rankings):
+    """
+    Returns the parts of the rankings' state that are ranked, leaving out the
+    names shown for each runner, which are as last written in results
+    """
+    runners = dict((key, (runner['scores'], runner['clubs'], runner['league']))
+                   for key, runner in rankings.runners.items())
+    return {'runners': runners, 'events': rankings.events, 'clubs': rankings.clubs}
+
+
+def differences(rankings, rebuilt):
+    """
+    Returns a list of descriptions of the differences between two rankings
+    """
+    state = ranked_state(rankings)
+    rebuilt_state = ranked_state(rebuilt)
+
+    found = []
+    for name in sorted(state):
+        for key in sorted(set(state[name]) | set(rebuilt_state[name])):
+            if state[name].get(key) != rebuilt_state[name].get(key):
+                found.append(u"{} {}: {} rebuilt as {}".format(
+                    name, key, state[name].get(key), rebuilt_state[name].get(key)))
+    return found
+
+
+def print_table(title, rows):
+    print(title)
+    for place, row in enumerate(rows, 1):
+        print(u"{:4d}. {:6d}  {}".format(place, row[0], u"  ".join(row[1:])))
+
+
+def main():
+    settings = Settings()
+    settings.setmodule('Orienteering_Scraper.settings')
+
+    parser = argparse.ArgumentParser(description="Show or rebuild the runner and club rankings")
+    parser.add_argument('--mongo-uri', default=settings.get('MONGO_URI'))
+    parser.add_argument('--database', default=settings.get('MONGO_DATABASE'))
+    parser.add_argument('--layout', choices=['embedded', 'normalized'],
+                        default=settings.get('MONGO_STORAGE_LAYOUT'),
+                        help="storage layout to rebuild from")
+    parser.add_argument('--file', default=settings.get('RANKINGS_FILE'),
+                        help="rankings state file")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="rebuild the rankings from every stored event")
+    parser.add_argument('--verify', action='store_true',
+                        help="with --rebuild, compare the rebuilt rankings with the saved "
+                             "rankings instead of replacing them")
+    parser.add_argument('--top', type=int, default=20, help="number of places to show")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        client = MongoClient(args.mongo_uri)
+        try:
+            rebuilt = rebuild(client[args.database], args.layout, args.file)
+        finally:
+            client.close()
+
+        if args.verify:
+            found = differences(Rankings.load(args.file), rebuilt)
+            for difference in found[:args.top]:
+                print(difference)
+            print("{:d} differences between the saved and rebuilt rankings".format(len(found)))
+            if len(found) > 0:
+                parser.exit(1)
+            return
+
+        rebuilt.save()
+        rankings = rebuilt
+    else:
+        rankings = Rankings.load(args.file)
+
+    print_table("League", rankings.league_table(args.top))
+    print_table("Personal bests", rankings.personal_bests(args.top))
+    print_table("Clubs", rankings.club_table(args.top))
+
+
+if __name__ == '__main__':
+    main()
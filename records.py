@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+A compact record of a single result, used while extracting results from a
+results page instead of Scrapy items. Records are only converted into the
+dicts that make up the scraped items once, when the items are built.
+
+@author: abradbury
+"""
+
+
+def format_time(seconds):
+    """
+    Returns a time in seconds as an ISO 8601 time string e.g. 4502 -> 01:15:02
+    """
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{:02d}:{:02d}:{:02d}".format(hours, minutes, seconds)
+
+
+class ResultRecord(object):
+    """
+    A single result from a course. Fields that were not found in the result
+    are None, apart from the status which is always set.
+
+    The time is held in whole seconds and the missed controls as an array of
+    control numbers (see fields.py). How far behind the winner a finisher
+    was is set once the whole course is parsed (see course_stats.py).
+    """
+
+    __slots__ = ('name', 'club', 'age_class', 'status', 'position', 'time',
+                 'missed', 'out_of_order', 'behind')
+
+    def __init__(self, name, club, age_class, status, position=None, time=None,
+                 missed=None, out_of_order=None, behind=None):
+        self.name = name
+        self.club = club
+        self.age_class = age_class
+        self.status = status
+        self.position = position
+        self.time = time
+        self.missed = missed
+        self.out_of_order = out_of_order
+        self.behind = behind
+
+    def to_dict(self):
+        """
+        Returns the result in the form of a PersonItem holding a ResultItem,
+        both as dicts
+        """
+        result = {'status': self.status}
+        if self.position is not None:
+            result['position'] = self.position
+        if self.time is not None:
+            result['time'] = format_time(self.time)
+        if self.missed is not None:
+            result['missed'] = list(self.missed)
+        if self.out_of_order is not None:
+            result['out_of_order'] = self.out_of_order
+        if self.behind is not None:
+            result['behind'] = self.behind
+
+        return {
+            'name': self.name,
+            'club': self.club,
+            'ageClass': self.age_class,
+            'result': result
+        }
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Re-parses event results pages that have been saved, using the same parsing
+code as the napier spider but without starting the Scrapy crawler. Pages are
+spread across a pool of processes and the resulting event summary items are
+written as JSON lines, as with `scrapy crawl napier -o file.jl`.
+
+The pages are read from either:
+
+    a page archive (see archive.py), recorded by an earlier crawl, in which
+    case every archived page in a known results format is re-parsed
+
+    a directory of saved pages, each of which is treated as an event results
+    page, with --base-url giving the URL the directory was saved from (e.g.
+    https://www.southyorkshireorienteers.org.uk/ for a mirror of that site)
+
+Each page is parsed at the URL it was downloaded from, so that the items have
+the same document IDs as those of a crawl. Links from a MERCS index page to
+its results page are followed if the linked page has also been saved, in
+which case the linked page is not parsed again on its own.
+
+A page that cannot be parsed is logged and counted, and the other pages are
+parsed as usual. The output file is only replaced once every page has been
+parsed.
+
+Usage:
+    python -m Orienteering_Scraper.reparse <archive> [-o results.jl] [-j processes]
+    python -m Orienteering_Scraper.reparse <dir> --base-url <url> [-o results.jl]
+
+@author: abradbury
+"""
+
+import argparse                     # For parsing the command line
+import logging                      # For reporting pages that cannot be parsed
+import multiprocessing              # For spreading pages across CPU cores
+import os
+import traceback                    # For reporting pages that cannot be parsed
+
+from scrapy.crawler import Crawler
+from scrapy.exporters import JsonLinesItemExporter
+from scrapy.http import HtmlResponse, Request
+from scrapy.settings import Settings
+from six.moves.urllib.parse import quote, unquote, urljoin
+from w3lib.url import canonicalize_url
+
+from Orienteering_Scraper import sniff
+from Orienteering_Scraper.archive import INDEX_FILE, PageArchive
+from Orienteering_Scraper.identifiers import event_id
+from Orienteering_Scraper.items import EventSummaryItem
+from Orienteering_Scraper.spiders.napier_spider import NapierSpider
+
+RESULTS_PAGE_EXTENSIONS = ('.htm', '.html')
+
+# The results page linked to by a MERCS simple event index page
+MERCS_RESULTS_PAGE = 'results.htm'
+
+logger = logging.getLogger(__name__)
+
+# The spider and pages of each worker process, see init_worker
+spider = None
+pages = None
+
+
+class SavedPages(object):
+    """
+    Pages saved under a directory from a website, each at the URL of its
+    path relative to the directory, under the URL the directory was saved
+    from. Every saved HTML file is taken to be a results page.
+    """
+
+    every_page_is_results = True
+
+    def __init__(self, directory, base_url):
+        self.directory = directory
+        self.base_url = base_url.rstrip('/') + '/'
+
+    def urls(self):
+        urls = []
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.lower().endswith(RESULTS_PAGE_EXTENSIONS):
+                    relative_path = os.path.relpath(os.path.join(root, filename), self.directory)
+                    urls.append(self.base_url + quote('/'.join(relative_path.split(os.sep))))
+        return urls
+
+    def load(self, url, request=None):
+        """
+        Returns the saved page at a URL, or None if it has not been saved
+        """
+        if not url.startswith(self.base_url):
+            return None
+
+        path = os.path.join(self.directory, *unquote(url[len(self.base_url):]).split('/'))
+        if not os.path.isfile(path):
+            return None
+
+        with open(path, 'rb') as page:
+            body = page.read()
+        return HtmlResponse(url, body=body, request=request)
+
+
+class ArchivedPages(object):
+    """
+    The pages of a page archive, at the URLs they were downloaded from. Only
+    pages in a known results format are taken to be results pages.
+    """
+
+    every_page_is_results = False
+
+    def __init__(self, directory):
+        self.archive = PageArchive(directory)
+
+    def urls(self):
+        return [entry['url'] for entry in self.archive.latest.values() if entry['status'] == 200]
+
+    def load(self, url, request=None):
+        """
+        Returns the archived page at a URL, or None if it was not archived
+        """
+        response = self.archive.load(url, request)
+        return response if response is not None and response.status == 200 else None
+
+
+def find_results_pages(saved_pages):
+    """
+    Returns a sorted list of the URLs of the saved results pages, leaving out
+    those that are parsed by following a link from another (the results of a
+    simple MERCS event)
+    """
+    urls = []
+    followed = set()
+    for url in saved_pages.urls():
+        (page_format, mercs_subtype) = sniff.sniff(saved_pages.load(url).body)
+        if page_format == sniff.UNKNOWN and not saved_pages.every_page_is_results:
+            continue
+
+        urls.append(url)
+        if page_format == sniff.NAPIER_MERCS and mercs_subtype == sniff.MERCS_SIMPLE:
+            followed.add(canonicalize_url(urljoin(url, MERCS_RESULTS_PAGE)))
+
+    return sorted(url for url in urls if canonicalize_url(url) not in followed)
+
+
+def init_worker(saved_pages):
+    """
+    Creates the spider used for every page parsed by a worker process, and
+    keeps the pages to parse
+    """
+    global spider, pages
+    spider = create_spider()
+    pages = saved_pages
+
+
+def create_spider():
+    """
+    Returns a napier spider attached to a crawler that is never started, so
+    that the spider has the project settings and somewhere to keep its stats.
+    Previous crawls' fingerprints are ignored so every page is parsed.
+    """
+    settings = Settings()
+    settings.setmodule('Orienteering_Scraper.settings')
+    settings.set('FINGERPRINTS_FILE', '')
+    return NapierSpider.from_crawler(Crawler(NapierSpider, settings))
+
+
+def reparse_page(job):
+    """
+    Parses a single saved event results page, following any requests made by
+    the spider to other saved pages. The worker's spider is reset first, so
+    that its stats and shared results pages are those of this page only.
+
+    Args:
+        job: a tuple of the sequence ID to give the event and the page URL
+    Returns:
+        the parsed items as dicts, the spider's stats and the traceback of the
+        failure if the page could not be parsed (in which case there are no
+        items)
+    """
+    seq_id, url = job
+    spider.crawler.stats.clear_stats()
+    spider.results_events.clear()
+    spider.completed_results.clear()
+
+    try:
+        items = parse_saved_page(seq_id, url)
+    except Exception:
+        return [], spider.crawler.stats.get_stats(), traceback.format_exc()
+    return items, spider.crawler.stats.get_stats(), None
+
+
+def parse_saved_page(seq_id, url):
+    """
+    Returns the items parsed from a saved event results page as dicts
+    """
+    event = EventSummaryItem(doc_id=event_id(url), seq_id=seq_id, name=url, url=url)
+    meta = {'event_object': event, 'event_page_url': url}
+    pending = [pages.load(url, Request(url, meta=meta))]
+    items = []
+
+    while pending:
+        response = pending.pop()
+        for output in spider.parse_event_results_page(response):
+            if not isinstance(output, Request):
+                items.append(dict(output))
+                continue
+
+            linked_response = pages.load(output.url, output)
+            if linked_response is not None:
+                pending.append(linked_response)
+            else:
+                linked_event = output.meta['event_object']
+                linked_event['status'] = "Linked results page not saved: " + output.url
+                NapierSpider.print_summary(linked_event)
+                items.append(dict(linked_event))
+
+    return items
+
+
+def reparse(saved_pages, urls, output_file, processes=None):
+    """
+    Re-parses the saved pages at the given URLs using a pool of processes,
+    each with its own spider, writing each event summary item to the output
+    file in page order.
+
+    Returns:
+        the number of items written, the number of pages that could not be
+        parsed and the totals of the spiders' napier/ counters
+    """
+    exporter = JsonLinesItemExporter(output_file)
+    exporter.start_exporting()
+    items_count = failed_count = 0
+    counts = {}
+
+    pool = multiprocessing.Pool(processes, initializer=init_worker, initargs=(saved_pages,))
+    try:
+        for url, (items, stats, failure) in zip(urls, pool.imap(reparse_page,
+                                                                enumerate(urls, 1))):
+            if failure is not None:
+                logger.error("Failed to re-parse %s:\n%s", url, failure)
+                failed_count += 1
+                continue
+
+            for item in items:
+                exporter.export_item(item)
+                items_count += 1
+            for key, value in stats.items():
+                if key.startswith('napier/'):
+                    counts[key] = counts.get(key, 0) + value
+    finally:
+        pool.close()
+        pool.join()
+
+    exporter.finish_exporting()
+    return items_count, failed_count, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Re-parse saved event results pages without crawling")
+    parser.add_argument('directory', help="page archive, or directory of saved results pages")
+    parser.add_argument('--base-url',
+                        help="URL the directory of saved pages was saved from")
+    parser.add_argument('-o', '--output', default='results.jl',
+                        help="JSON lines file to write the items to")
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    if os.path.exists(os.path.join(args.directory, INDEX_FILE)):
+        saved_pages = ArchivedPages(args.directory)
+    elif args.base_url:
+        saved_pages = SavedPages(args.directory, args.base_url)
+    else:
+        parser.error(args.directory + " is not a page archive, so --base-url is needed to give "
+                     "the saved pages the URLs (and document IDs) of a crawl")
+
+    urls = find_results_pages(saved_pages)
+    if len(urls) == 0:
+        parser.error("No results pages found in " + args.directory)
+
+    # Written under a temporary name so that a failed run leaves no partial
+    # output in place of the previous one
+    temporary_path = os.path.join(os.path.dirname(args.output),
+                                  '.' + os.path.basename(args.output) + '.tmp')
+    try:
+        with open(temporary_path, 'wb') as output_file:
+            items_count, failed_count, counts = reparse(saved_pages, urls, output_file,
+                                                        args.processes)
+        os.rename(temporary_path, args.output)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+    print("{:d} items written to {} from {:d} results pages ({:d} could not be parsed)"
+          .format(items_count, args.output, len(urls), failed_count))
+    print("{:d} results found over {:d} processed courses of {:d} processed events"
+          .format(counts.get('napier/results_processed', 0),
+                  counts.get('napier/courses_processed', 0),
+                  counts.get('napier/events_processed', 0)))
+
+
+if __name__ == '__main__':
+    main()
@@ -20,14 +20,58 @@ NEWSPIDER_MODULE = 'Orienteering_Scraper.spiders'
 
 ITEM_PIPELINES = {
     'scrapy.pipelines.images.ImagesPipeline': 1,
-    'Orienteering_Scraper.pipelines.MongoPipeline': 300
+    'Orienteering_Scraper.pipelines.IdentityPipeline': 200,
+    'Orienteering_Scraper.pipelines.MongoPipeline': 300,
+    'Orienteering_Scraper.pipelines.ColumnarExportPipeline': 400,
+    'Orienteering_Scraper.pipelines.RankingPipeline': 500
 }
 
 MONGO_DATABASE = 'Orienteering'
 MONGO_URI = 'mongodb://localhost:27017'
 
+# Items are written to MongoDB in unordered bulk writes of up to this many
+# items, or after this many seconds, whichever comes first
+MONGO_BATCH_SIZE = 100
+MONGO_FLUSH_INTERVAL = 5.0
+
+# Batches are written by a pool of this many threads, off the reactor thread
+# (0 writes in the reactor thread). Once MONGO_MAX_PENDING_BATCHES batches are
+# being written, new items wait for one to complete, slowing the crawl to the
+# speed of the database
+MONGO_WRITE_THREADS = 4
+MONGO_MAX_PENDING_BATCHES = 8
+
+# How event results are stored: 'embedded' (one document per event in the
+# results collection) or 'normalized' (separate events, courses and runs
+# collections). Existing results can be converted with
+# `python -m Orienteering_Scraper.migrate`
+MONGO_STORAGE_LAYOUT = 'embedded'
+
+# The Parquet dataset of every run, partitioned by event date, for analysis
+# (see export.py). Runs already in MongoDB can be exported with
+# `python -m Orienteering_Scraper.export`. Set to '' to disable the export.
+RUNS_EXPORT_DIR = 'export/runs'
+
+# The state of the runner and club rankings, updated with each crawled event
+# (see rankings.py). Set to '' to stop updating the rankings.
+RANKINGS_FILE = 'rankings.json'
+
+# The index of known runners, used to give each result a stable runner ID
+# (see identity.py). It can be rebuilt from every stored run with
+# `python -m Orienteering_Scraper.identity --rebuild`
+IDENTITY_FILE = 'identities.json'
+
 IMAGES_STORE = './' # TODO: Liaise with the JS app to determine location
 
+# Fingerprints of the results pages parsed by previous crawls, used by the
+# napier spider to skip unchanged events. Set to '' to re-crawl everything
+FINGERPRINTS_FILE = 'fingerprints.json'
+
+# Yield the results of each course as it is parsed, followed by a small event
+# summary, rather than one item per event holding every result. Course results
+# are stored in the course_results collection
+STREAM_RESULTS = False
+
 LOG_LEVEL = 'DEBUG'
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
@@ -64,15 +108,38 @@ USER_AGENT = 'OrienteeringScraper/0.8 (+https://github.com/abradbury)'
 
 # Enable or disable downloader middlewares
 # See http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    'Orienteering_Scraper.middlewares.MyCustomDownloaderMiddleware': 543,
-#}
+# The page archive runs before the built-in middlewares, so it archives
+# responses after they have been decompressed
+DOWNLOADER_MIDDLEWARES = {
+    'Orienteering_Scraper.archive.PageArchiveMiddleware': 50,
+    'Orienteering_Scraper.offload.ParseOffloadMiddleware': 100,
+}
+
+# Results are extracted from results pages by this many worker processes,
+# leaving the crawling process free to handle other responses. Set to 0 to
+# extract results in the spider callbacks
+PARSE_PROCESSES = 2
+
+# The longest, in seconds, that the results of a page or course are waited
+# for from a worker process before the spider extracts them itself
+PARSE_TIMEOUT = 60
+
+# Every downloaded page is archived (compressed) in this directory. Set to ''
+# to disable. With PAGE_ARCHIVE_REPLAY set, pages are served from the archive
+# instead of being downloaded, and fingerprints are not used
+PAGE_ARCHIVE_DIR = 'archive'
+PAGE_ARCHIVE_REPLAY = False
 
 # Enable or disable extensions
 # See http://scrapy.readthedocs.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    'scrapy.telnet.TelnetConsole': None,
-#}
+EXTENSIONS = {
+    'Orienteering_Scraper.metrics.StageMetrics': 500,
+}
+
+# Crawl metrics (from the crawler stats) are written in the Prometheus text
+# format to this file every METRICS_INTERVAL seconds. Set to '' to disable
+METRICS_FILE = 'metrics.prom'
+METRICS_INTERVAL = 15
 
 # Configure item pipelines
 # See http://scrapy.readthedocs.org/en/latest/topics/item-pipeline.html
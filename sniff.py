@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Identifies the format of a results page from its raw body, without building
+a DOM or extracting the text of the document.
+
+Each results software leaves a marker in the page: a generator footer in an
+<address> element (Napier Colour and MERCS), a credit link (Stephan), a
+generator meta tag (Cocoa) or a container element (Tryner ColourResults).
+The markers are matched by one compiled pattern. As footers are at the end
+of a page, the end of the body is searched first and the rest of the body
+is only searched if no footer is found there.
+
+MERCS event index pages are further classified into a sub-type by a second
+pattern, run over the (small) index page only.
+
+@author: abradbury
+"""
+
+import re
+
+NAPIER_COLOUR = "Napier - Colour"
+NAPIER_MERCS = "Napier - MERCS"
+STEPHAN = "Stephan"
+COCOA = "Cocoa"
+TRYNER = "Tryner/ColourResults"
+UNKNOWN = "--Unknown--"
+
+MERCS_SIMPLE = 'simple'
+MERCS_RELAY = 'relay'
+MERCS_MULTI_DAY = 'multi-day'
+MERCS_CLASS_SPLIT = 'class-split'
+
+# The number of bytes at the end of a page searched for the footer first
+FOOTER_SEARCH_LENGTH = 4096
+
+FORMAT_MARKERS = re.compile(
+    br'<(?:'
+    br'address[^>]*>\s*<p[^>]*>(?P<napier>[^<]*Napier)'
+    br'|address[^>]*>(?:(?!</address)[\s\S])*?<a[^>]*>(?P<mercs>[^<]*MERCS)'
+    br'|small[^>]*>\s*<a[^>]*>(?P<stephan>[^<]*Stephan)'
+    br'|meta[^>]*name=["\']?Generator["\']?[^>]*content=["\']?(?P<cocoa>[^"\'>]*Cocoa)'
+    br'|div[^>]*id=["\']?(?P<tryner>colourResults)["\'\s>]'
+    br')', re.IGNORECASE)
+
+FORMATS = {
+    'napier': NAPIER_COLOUR,
+    'mercs': NAPIER_MERCS,
+    'stephan': STEPHAN,
+    'cocoa': COCOA,
+    'tryner': TRYNER
+}
+
+# A relay heading or label, or a link from a paragraph of the page (as the
+# links to results are laid out on MERCS index pages) to another page of the
+# event: the results of one day of several e.g. day1.htm, the results by
+# class e.g. classM21.htm, or the results of a simple event. Links to other
+# sites or directories, and links outside of paragraphs (such as those of a
+# website's navigation), are not matched. The link is looked ahead for, so
+# that a relay heading in the same paragraph is still found.
+MERCS_MARKERS = re.compile(
+    br'>\s*(?P<relay>relay)\s*<'
+    br'|<p\b(?=[^>]*>(?:(?!</?p\b)[\s\S])*?<a[^>]*href=["\']?(?:'
+    br'(?P<multi_day>[\w%-]*day[\w%-]*\d[\w%-]*\.html?)'
+    br'|(?P<class_split>[\w%-]*class[\w%-]*\.html?)'
+    br'|(?P<simple>results\.htm)'
+    br')["\'\s>])', re.IGNORECASE)
+
+# In order of precedence
+MERCS_SUBTYPES = [
+    ('relay', MERCS_RELAY),
+    ('multi_day', MERCS_MULTI_DAY),
+    ('class_split', MERCS_CLASS_SPLIT),
+    ('simple', MERCS_SIMPLE)
+]
+
+
+def results_format(body):
+    """
+    Returns the format of a results page, as one of the format constants
+    """
+    match = FORMAT_MARKERS.search(body, max(len(body) - FOOTER_SEARCH_LENGTH, 0))
+    if match is None or match.lastgroup not in ('napier', 'mercs'):
+        match = FORMAT_MARKERS.search(body)
+
+    return FORMATS[match.lastgroup] if match else UNKNOWN
+
+
+def mercs_subtype(body):
+    """
+    Returns the sub-type of a MERCS event index page, or None if the page
+    does not link to any results
+    """
+    found = set(match.lastgroup for match in MERCS_MARKERS.finditer(body))
+    for group, subtype in MERCS_SUBTYPES:
+        if group in found:
+            return subtype
+    return None
+
+
+def sniff(body):
+    """
+    Identifies a results page from its raw body.
+
+    Returns:
+        the results format and, for MERCS pages, the MERCS sub-type (None
+        for other formats)
+    """
+    page_format = results_format(body)
+    if page_format == NAPIER_MERCS:
+        return page_format, mercs_subtype(body)
+    return page_format, None
@@ -13,6 +13,7 @@ Usage:
 
 import scrapy                       # For scraping the web pages
 
+from Orienteering_Scraper.identifiers import club_id
 from Orienteering_Scraper.items import ClubItem
 
 class OrienteeringClubsSpider(scrapy.Spider):
@@ -24,6 +25,14 @@ class OrienteeringClubsSpider(scrapy.Spider):
     name = "clubs"
     start_urls = ["https://www.britishorienteering.org.uk/find_a_club"]
 
+    def __init__(self, start_url=None, *args, **kwargs):
+        super(OrienteeringClubsSpider, self).__init__(*args, **kwargs)
+
+        # Allows another copy of the club list, such as the benchmark
+        # stand-in, to be crawled e.g. scrapy crawl clubs -a start_url=...
+        if start_url:
+            self.start_urls = [start_url]
+
     # ======================================================================= #
     # Page parsers ---------------------------------------------------------- #
     # ======================================================================= #
@@ -50,6 +59,7 @@ class OrienteeringClubsSpider(scrapy.Spider):
             raw_name = raw_club.css('::text').extract_first()
             if raw_name.isalpha():
                 club['name'] = raw_name
+                club['doc_id'] = club_id(raw_name)
                 raw_website = raw_club.css('a::attr(href)').extract_first()
 
                 if raw_website:
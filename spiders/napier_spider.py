@@ -67,18 +67,21 @@ Data source problems:
 # Error:
 #   https://www.southyorkshireorienteers.org.uk/event/2014-06-18-wheata-woods/results_v2.htm
 
-# Useful MongoDB queries:
+# Useful MongoDB queries (see also queries.py):
 # db.results.find({ 'results.name': 'Bob Smith' }, { 'name': 1 })
 # { "_id" : ObjectId("87y"), "name" : "Night Event at Bowden Houstead" }
 
-import datetime                     # For storing time information
 import scrapy                       # For scraping the web pages
 from urlparse import urlparse       # For determining file type of web page
-import itertools                    # For parsing course results in pre
-from collections import Counter     # For parsing course results in pre
-import math
+from w3lib.url import add_or_replace_parameter, url_query_parameter  # For listing page offsets
 
-from Orienteering_Scraper.items import ResultItem, CourseItem, PersonItem, EventItem, VenueItem, EventSummaryItem
+from Orienteering_Scraper import columns, course_stats, fields, sniff, tokenizer
+from Orienteering_Scraper.fingerprints import FingerprintStore
+from Orienteering_Scraper.identifiers import course_id, event_id
+from Orienteering_Scraper.metrics import timed
+from Orienteering_Scraper.items import CourseItem, EventItem, VenueItem, EventSummaryItem, CourseResultsItem, \
+    EventReferrersItem
+from Orienteering_Scraper.records import ResultRecord
 
 
 class NapierSpider(scrapy.Spider):
@@ -90,32 +93,83 @@ class NapierSpider(scrapy.Spider):
     allowed_domains = ["www.southyorkshireorienteers.org.uk"]
     start_urls = ["https://www.southyorkshireorienteers.org.uk/results"]
 
-    # Counters used in end of scraping summary output
-    discovered_events_count = 0
-    discovered_courses_count = 0
-    processed_events_count = 0
-    processed_courses_count = 0
-    processed_results_count = 0
-
+    # The number of results listing pages parsed after the first
     page_limit = 5
     page_counter = 0
 
+    # The query parameter holding the offset of a results listing page
+    listing_offset_parameter = 'limitstart'
+
+    # Results pages seen by previous crawls, None if not crawling incrementally
+    fingerprints = None
+
+    # Whether to yield the results of each course as they are parsed, followed
+    # by a summary of the event, rather than one item with all the results
+    stream_results = False
+
+    def __init__(self, start_url=None, page_limit=None, *args, **kwargs):
+        super(NapierSpider, self).__init__(*args, **kwargs)
+
+        # The sequence ID, document ID and referrers of the event summary of
+        # each results page requested, by the page's document ID, and the IDs
+        # of those whose summary has been yielded. Only these are kept, not
+        # the summaries themselves, which can hold every result of an event.
+        self.results_events = {}
+        self.completed_results = set()
+
+        if page_limit is not None:
+            self.page_limit = int(page_limit)
+
+        # Allows another copy of the website, such as the benchmark stand-in,
+        # to be crawled e.g. scrapy crawl napier -a start_url=...
+        if start_url:
+            self.start_urls = [start_url]
+            self.allowed_domains = [urlparse(start_url).hostname]
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(NapierSpider, cls).from_crawler(crawler, *args, **kwargs)
+
+        # Archived pages are replayed in full, so none are skipped as unchanged
+        fingerprints_file = crawler.settings.get('FINGERPRINTS_FILE')
+        if fingerprints_file and not crawler.settings.getbool('PAGE_ARCHIVE_REPLAY'):
+            spider.fingerprints = FingerprintStore.load(fingerprints_file)
+
+        spider.stream_results = crawler.settings.getbool('STREAM_RESULTS')
+        return spider
+
+    def inc_count(self, name, count=1):
+        """
+        Increments one of the counters used in the end of scraping summary,
+        which are kept in the crawler stats under napier/<name>
+        """
+        self.crawler.stats.inc_value('napier/' + name, count)
+
+    def get_count(self, name):
+        return self.crawler.stats.get_value('napier/' + name, 0)
+
     # ======================================================================= #
     # Page parsers ---------------------------------------------------------- #
     # ======================================================================= #
 
+    @timed('parse')
     def parse(self, response):
         """
         The main entry into the parsing process, starts at the results list
         page of an orienteering website and works through the results pages,
         yielding to another parser for each event found on these pages.
 
+        From the first results list page, every other page (up to the page
+        limit) is requested at once, using the page offsets in the pagination
+        links. When crawling incrementally, the pages are instead followed
+        one at a time so that the crawl can stop at the first page of known
+        events.
+
         Example URL:
             https://www.southyorkshireorienteers.org.uk/results
         """
 
-        if self.page_counter > self.page_limit:
-            exit()
+        self.inc_count('listing_pages')
 
         # Process each event on the current results page
         events = response.css(
@@ -125,17 +179,46 @@ class NapierSpider(scrapy.Spider):
         if len(events) == 0:
             print("Error - no events found on " + response.url)
 
+        known_events_count = 0
         for event in events:
-            yield scrapy.Request(response.urljoin(event),
-                                 callback=self.parse_event_page)
-
-        # Parse the next results page
-        next_page = response.css('nav ul.pagination li a[title=Next]::attr(href)').extract_first()
-        if next_page is not None:
-            self.page_counter += 1
-            next_page = response.urljoin(next_page)
-            yield scrapy.Request(next_page, callback=self.parse)
-
+            event_url = response.urljoin(event)
+
+            # The pages of events parsed by a previous crawl are still
+            # requested, as their results may have been republished under a
+            # new link. Unchanged results pages are skipped once requested.
+            if self.fingerprints and self.fingerprints.is_known_event(event_url):
+                known_events_count += 1
+            yield scrapy.Request(event_url, callback=self.parse_event_page)
+
+        # Stop walking the (newest first) results pages once only events
+        # already seen by a previous crawl are found
+        if len(events) > 0 and known_events_count == len(events):
+            print("Only known events found on " + response.url + ", stopping")
+            return
+
+        # Later results pages are requested from the first page only, ahead
+        # of the event pages so that every event is found as soon as possible
+        if response.meta.get('listing_fan_out'):
+            return
+
+        listing_pages = None
+        if not (self.fingerprints and self.fingerprints.events):
+            listing_pages = self.later_listing_pages(response)
+
+        if listing_pages is not None:
+            for listing_page in listing_pages[:max(self.page_limit - self.page_counter, 0)]:
+                self.page_counter += 1
+                yield scrapy.Request(listing_page, callback=self.parse, priority=1,
+                                     meta={'listing_fan_out': True})
+        else:
+            # Parse the next results page
+            next_page = response.css('nav ul.pagination li a[title=Next]::attr(href)').extract_first()
+            if next_page is not None and self.page_counter < self.page_limit:
+                self.page_counter += 1
+                next_page = response.urljoin(next_page)
+                yield scrapy.Request(next_page, callback=self.parse)
+
+    @timed('parse_event_page')
     def parse_event_page(self, response):
         """
         Parses a single event page on the orienteering website to identify the
@@ -149,9 +232,7 @@ class NapierSpider(scrapy.Spider):
             https://www.southyorkshireorienteers.org.uk/events/event/622-local-and-schools-event
         """
 
-        event = EventSummaryItem(seq_id=self.discovered_events_count + 1)
-        self.discovered_events_count += 1
-        event['name'] = response.url
+        event = self.new_event_summary(response.url)
 
         # From an event's page, get the link to its results & send for parsing
         results_url = response.css('dl.event_info dd.custom4 a::attr(href)').extract_first()
@@ -161,9 +242,9 @@ class NapierSpider(scrapy.Spider):
 
             if "http" not in results_url or "southyorkshireorienteers" in results_url:
                 if file_type is None or "htm" in file_type:
-                    yield scrapy.Request(response.urljoin(results_url),
-                                         meta={'event_object': event},
-                                         callback=self.parse_event_results_page)
+                    for output in self.request_results_page(response.urljoin(results_url),
+                                                            response.url, event):
+                        yield output
                 else:
                     event['status'] = str(file_type.upper()) + " not supported"
                     NapierSpider.print_summary(event)
@@ -177,6 +258,7 @@ class NapierSpider(scrapy.Spider):
             NapierSpider.print_summary(event)
             yield event
 
+    @timed('parse_event_results_page')
     def parse_event_results_page(self, response):
         """
         Parses and identifies the type of the event results pages
@@ -186,56 +268,151 @@ class NapierSpider(scrapy.Spider):
         """
 
         event = response.meta['event_object']
-        results_format = NapierSpider.identify_results_page(response)
 
-        if "Napier - Colour" in results_format:
-            self.update_event_results_format(event, "Napier - Colour")
-            yield self.parse_napier_common(response, event)
-
-        elif "MERCS" in results_format:
-            text = response.css("::text").extract()
-
-            if "Relay" in text or "relay" in text:
-                self.update_event_results_format(event, "MERCS relay")
-                event['status'] = "MERCS relay events not supported"
-                NapierSpider.print_summary(event)
-                yield event
+        if self.fingerprints and self.fingerprints.is_unchanged(response):
+            event['status'] = "Unchanged since last crawl"
+            NapierSpider.print_summary(event)
+            return
 
-            # elif ???
-            #     self.update_event_results_format(event, "MERCS multi-day")
-            #     event['status'] = "MERCS multi-day events not supported"
-            #     NapierSpider.print_summary(event)
-            #     yield event
+        (results_format, mercs_subtype) = NapierSpider.identify_results_page(response)
 
-            # elif ???
-            #     self.update_event_results_format(event, "MERCS class-split")
-            #     event['status'] = "MERCS class-split events not supported"
-            #     NapierSpider.print_summary(event)
-            #     yield event
+        # Every page handled here is fingerprinted, whatever the status of its
+        # results, once the event summary has been stored. Staged before the
+        # summary is yielded, as the pipelines may store it straight away. A
+        # simple MERCS index page is summarised from its results page instead.
+        if self.fingerprints and mercs_subtype != sniff.MERCS_SIMPLE:
+            self.fingerprints.stage(event['doc_id'], response)
 
+        if results_format == sniff.NAPIER_COLOUR:
+            self.update_event_results_format(event, "Napier - Colour")
+            for item in self.parse_napier_common(response, event, response.meta.get('extracted_results')):
+                yield item
+
+        elif results_format == sniff.NAPIER_MERCS:
+            if mercs_subtype == sniff.MERCS_SIMPLE:
+                self.update_event_results_format(event, "MERCS simple")
+                for output in self.request_results_page(response.urljoin("results.htm"),
+                                                        response.meta['event_page_url'],
+                                                        event):
+                    yield output
             else:
-                links = response.css("p a::attr(href)").extract()
-
-                if "results.htm" in links:
-                    mercs_result_page = links[links.index("results.htm")]
-                    self.update_event_results_format(event, "MERCS simple")
-                    yield scrapy.Request(response.urljoin(mercs_result_page),
-                                         meta={'event_object': event},
-                                         callback=self.parse_event_results_page)
-                else:
+                if mercs_subtype is None:
                     event['status'] = "MERCS no results link found"
-                    NapierSpider.print_summary(event)
-                    yield event
+                else:
+                    self.update_event_results_format(event, "MERCS " + mercs_subtype)
+                    event['status'] = "MERCS " + mercs_subtype + " events not supported"
+                NapierSpider.print_summary(event)
+                yield event
         else:
             event['status'] = "Unsupported results format: " + results_format
             self.update_event_results_format(event, results_format)
             NapierSpider.print_summary(event)
             yield event
 
+        # The summary has been yielded, unless the page was another request
+        if 'status' in event:
+            self.completed_results.add(event['doc_id'])
+
     # ======================================================================= #
     # Other functions ------------------------------------------------------- #
     # ======================================================================= #
 
+    def later_listing_pages(self, response):
+        """
+        Returns the URLs of every results listing page after the current one,
+        in order, from the page offsets of the pagination links (such as the
+        End link) e.g. ?limitstart=10, ?limitstart=20 etc. Returns None if
+        the pagination links have no page offsets.
+        """
+        offset_links = {}
+        for link in response.css('nav ul.pagination li a::attr(href)').extract():
+            link = response.urljoin(link)
+            offset = url_query_parameter(link, self.listing_offset_parameter)
+            if offset is not None and offset.isdigit():
+                offset_links[int(offset)] = link
+
+        if len(offset_links) == 0:
+            return None
+
+        current_offset = url_query_parameter(response.url, self.listing_offset_parameter, '0')
+        current_offset = int(current_offset) if current_offset.isdigit() else 0
+        later_offsets = sorted(offset for offset in offset_links if offset > current_offset)
+        if len(later_offsets) == 0:
+            return []
+
+        # The pages in between are not all linked, so are found by stepping
+        # through the offsets to the last page
+        last_offset = later_offsets[-1]
+        page_size = later_offsets[0] - current_offset
+        return [add_or_replace_parameter(offset_links[last_offset], self.listing_offset_parameter,
+                                         str(offset))
+                for offset in range(current_offset + page_size, last_offset + 1, page_size)]
+
+    def new_event_summary(self, event_url):
+        """
+        Returns a new event summary, numbered in the order events are found
+        """
+        self.inc_count('events_discovered')
+        return EventSummaryItem(doc_id=event_id(event_url),
+                                seq_id=self.get_count('events_discovered'),
+                                name=event_url,
+                                referrers=[event_url])
+
+    def request_results_page(self, results_url, event_url, event):
+        """
+        Yields a request for an event results page, unless the page has
+        already been requested for another event, as happens when several
+        event pages link to the same results.
+
+        A page is only requested once, keyed by its normalised URL, and
+        every event page linking to it is added to the referrers of the one
+        event summary. If that summary has already been yielded, an item
+        holding its new referrers is yielded instead.
+        """
+        results_doc_id = event_id(results_url)
+        shared_results = self.results_events.get(results_doc_id)
+
+        if shared_results is None or shared_results['seq_id'] == event['seq_id']:
+            # An event following its MERCS index page to the results page
+            # keeps the one record, now under the results page's ID
+            shared_results = self.results_events.get(event.get('doc_id'))
+            if shared_results is None or shared_results['seq_id'] != event['seq_id']:
+                shared_results = {'seq_id': event['seq_id'], 'referrers': event.get('referrers')}
+            shared_results['doc_id'] = results_doc_id
+            self.results_events[results_doc_id] = shared_results
+
+            yield self.results_page_request(results_url, event_url, event)
+            return
+
+        self.inc_count('shared_results_hits')
+        if event_url not in shared_results['referrers']:
+            # The list is the summary's own, so a summary yet to be yielded
+            # has every referrer
+            shared_results['referrers'].append(event_url)
+            if shared_results['doc_id'] in self.completed_results:
+                self.inc_count('shared_results_late_referrers')
+                yield EventReferrersItem(doc_id=shared_results['doc_id'],
+                                         referrers=list(shared_results['referrers']))
+
+    def results_page_request(self, results_url, event_url, event):
+        """
+        Returns a request for an event results page. When crawling
+        incrementally, the request is made conditional on the page having
+        changed since the previous crawl.
+        """
+        event['url'] = results_url
+        event['doc_id'] = event_id(results_url)
+
+        headers = {}
+        meta = {'event_object': event, 'event_page_url': event_url, 'offload_parse': True}
+
+        if self.fingerprints:
+            headers = self.fingerprints.conditional_headers(results_url)
+            meta['handle_httpstatus_list'] = [304]
+
+        return scrapy.Request(results_url, headers=headers, meta=meta,
+                              callback=self.parse_event_results_page)
+
     @staticmethod
     def update_event_results_format(event, results_format):
         """
@@ -252,29 +429,15 @@ class NapierSpider(scrapy.Spider):
     @staticmethod
     def identify_results_page(response):
         """
-        Identifies the format of a results page based on the response.
+        Identifies the format of a results page, and the sub-type of MERCS
+        pages, from the raw body of the response (see sniff.py).
 
         Args:
             response: the Scrapy HTTP Response object
+        Returns:
+            a (results format, MERCS sub-type or None) tuple
         """
-        napier_raw = response.css('address p::text')
-        mercs_raw = response.css('address p a::text')
-        stephan_raw = response.css('table tr td small a::text')
-        cocoa_raw = response.css('head meta[name=Generator]::attr(content)')
-        tryner = response.css('div#colourResults')
-
-        if napier_raw and "Napier" in napier_raw.extract_first():
-            return "Napier - Colour"
-        elif mercs_raw and "MERCS" in mercs_raw.extract_first():
-            return "Napier - MERCS"
-        elif stephan_raw and "Stephan" in stephan_raw.extract_first():
-            return "Stephan"
-        elif cocoa_raw and "Cocoa" in cocoa_raw.extract_first():
-            return "Cocoa"
-        elif tryner:
-            return "Tryner/ColourResults"
-        else:
-            return "--Unknown--"
+        return sniff.sniff(response.body)
 
 
 
@@ -315,53 +478,151 @@ class NapierSpider(scrapy.Spider):
 
         return filtered_courses, results
 
-    def parse_napier_common(self, response, event):
-        (courses, course_results) = NapierSpider.identify_course_data(response, event)
-        (event_info, venue_info) = NapierSpider.identify_event_info(response)
+    @timed('parse_napier_common')
+    def parse_napier_common(self, response, event, extracted=None):
+        """
+        Parses the results of each course of a Napier format results page.
+
+        By default, a single event summary item holding every result is
+        yielded. When streaming results, an item holding the results of each
+        course is yielded as soon as that course is parsed and the event
+        summary that follows only holds the course details.
+
+        The results are extracted from the page here unless they have already
+        been extracted, in a worker process, by the ParseOffloadMiddleware.
+        """
+        if extracted is None:
+            extracted = NapierSpider.extract_results(response)
+
+        event['results_format'] += extracted['format_notes']
+        event_info = extracted['event']
+        venue_info = extracted['venue']
 
-        if len(courses) != len(course_results):
+        self.inc_count('layout_cache_hits' if extracted['layout_cached'] else 'layout_cache_misses')
+
+        if extracted['mismatched']:
             event['status'] = (str(event.get('status', "")) +
                                ("**Mismatch between number of courses and " +
                                 "course results - investigate parser**"))
 
-        event_results = []      # Each result
+        event_results = []      # Each result, unless streaming results
         processed_courses = []  # A list of all courses for the event
-
-        # Identify the columns by looking at all course results as a whole
-        column_indices = NapierSpider.identify_columns(course_results)
+        results_count = 0
 
         # Iterate over each set of course results e.g. white results
-        for course, results in zip(courses, course_results):
-            if course.css('p::text').extract_first():
-                self.discovered_courses_count += 1
-                course_info = NapierSpider.parse_course_info(course)
-                parsed_results = NapierSpider.parse_course_results(results,
-                                                                   course_info,
-                                                                   venue_info,
-                                                                   event_info,
-                                                                   column_indices)
-
-                if len(parsed_results) > 0:
-                    self.processed_courses_count += 1
-                    self.processed_results_count += len(parsed_results)
-
+        for course_info, parsed_results in extracted['courses']:
+            self.inc_count('courses_discovered')
+
+            if len(parsed_results) > 0:
+                self.inc_count('courses_processed')
+                self.inc_count('results_processed', len(parsed_results))
+
+            results_count += len(parsed_results)
+            processed_courses.append(dict(course_info))
+
+            if self.stream_results:
+                yield CourseResultsItem(doc_id=course_id(event['doc_id'], len(processed_courses) - 1),
+                                        event_id=event['doc_id'],
+                                        course=dict(course_info),
+                                        venue=dict(venue_info),
+                                        event=dict(event_info),
+                                        results=parsed_results)
+            else:
+                NapierSpider.add_result_context(parsed_results, course_info, venue_info, event_info)
                 event_results.extend(parsed_results)
-                processed_courses.append(dict(course_info))
 
-        if len(event_results) == 0:
+        if results_count == 0:
             event['status'] = (str(event.get('status', "")) +
                                ("**No results detected - " +
                                 "investigate parser**"))
         else:
-            self.processed_events_count += 1
+            self.inc_count('events_processed')
             event['status'] = "OK"
 
         event['name'] = event_info['name'] + " at " + venue_info['name']
-        event['results'] = event_results
         event['courses'] = processed_courses
+        event['results_count'] = results_count
+        if self.stream_results:
+            event['event'] = dict(event_info)
+            event['venue'] = dict(venue_info)
+        else:
+            event['results'] = event_results
         NapierSpider.print_summary(event)
 
-        return event
+        yield event
+
+    @staticmethod
+    def extract_results(response):
+        """
+        Extracts the event, venue, course and result details of a Napier
+        format results page.
+
+        Returns:
+            the dict returned by extract_layout, with the 'courses' as an
+            iterator of (course details, [result dict]) tuples in place of the
+            'course_rows' and 'columns'. Each course's results are only parsed
+            as the iterator reaches it.
+        """
+        extracted = NapierSpider.extract_layout(response)
+        course_rows = extracted.pop('course_rows')
+        column_indices = extracted.pop('columns')
+
+        extracted['courses'] = (NapierSpider.extract_course(course_info, rows, column_indices)
+                                for course_info, rows in course_rows)
+        return extracted
+
+    @staticmethod
+    def extract_layout(response):
+        """
+        Extracts the event, venue and course details of a Napier format
+        results page and identifies the columns of its results, leaving the
+        results of each course to be parsed by extract_course. As this depends
+        only on the response and returns plain values, it can be run in a
+        worker process (see offload.py).
+
+        Returns:
+            a dict holding the 'event' and 'venue' details, the 'course_rows'
+            as a list of (course details, [result line]) tuples, the column
+            indices of the results ('columns'), any 'format_notes' to add to
+            the results format, whether the numbers of courses and course
+            results 'mismatched' and whether the columns were found in the
+            layout cache ('layout_cached')
+        """
+        notes = {'results_format': ""}
+        (courses, course_results) = NapierSpider.identify_course_data(response, notes)
+        (event_info, venue_info) = NapierSpider.identify_event_info(response)
+
+        # Each course's results are split into lines once, then identify the
+        # columns by looking at all course results as a whole, reusing the
+        # columns of earlier pages with the same template where they fit
+        course_rows = [NapierSpider.get_valid_rows(results) for results in course_results]
+        (column_indices, layout_cached) = NapierSpider.identify_columns(
+            course_rows, NapierSpider.identify_template(response, course_results))
+
+        return {
+            'event': dict(event_info),
+            'venue': dict(venue_info),
+            'course_rows': [(dict(NapierSpider.parse_course_info(course)), rows)
+                            for course, rows in zip(courses, course_rows)
+                            if course.css('p::text').extract_first()],
+            'columns': column_indices,
+            'format_notes': notes['results_format'],
+            'mismatched': len(courses) != len(course_results),
+            'layout_cached': layout_cached
+        }
+
+    @staticmethod
+    def extract_course(course_info, rows, column_indices):
+        """
+        Parses the result lines of a course, as found by extract_layout.
+        Returns the course details, with the course statistics added, and the
+        list of result dicts.
+        """
+        parsed_results = NapierSpider.parse_course_results(rows, column_indices)
+        course_info['statistics'] = course_stats.course_statistics(parsed_results)
+
+        # Records are converted to dicts only once, as the items are built
+        return course_info, [record.to_dict() for record in parsed_results]
 
     @staticmethod
     def identify_event_info(response):
@@ -413,9 +674,9 @@ class NapierSpider(scrapy.Spider):
     # ======================================================================= #
 
     @staticmethod
-    def parse_course_results(course_results, course_info, venue_info, event_info, column_indices):
+    def parse_course_results(rows, column_indices):
         """
-        Takes the raw results for a given course and extracts the results into 
+        Takes the result rows for a given course and extracts the results into 
         a list of result objects. 
 
         Rather than splitting each row by spaces, this function finds the 
@@ -423,71 +684,60 @@ class NapierSpider(scrapy.Spider):
         course results. These indices are then used to extract the data. 
 
         Args:
-            course_results  the raw course results
-            course_info     a
-            venue_info      a
-            event_info      a 
+            rows            the result rows of the course (see get_valid_rows)
+            column_indices  the (start, end) indices of each column
         """
 
         # Extract data to list based on common space indices
-        extracted_data = NapierSpider.extract_data(NapierSpider.get_valid_rows(course_results), column_indices)
-
-        # Process extracted data into list of objects
-        parsed_results = []
-        for result_row in extracted_data:
-            parsed_result = NapierSpider.parse_result_row(result_row)
-            
-            parsed_result['course'] = dict(course_info)
-            parsed_result['venue'] = dict(venue_info)
-            parsed_result['event'] = dict(event_info)
+        extracted_data = NapierSpider.extract_data(rows, column_indices)
 
-            parsed_results.append(parsed_result)
-
-        return parsed_results
+        # Process extracted data into list of records
+        return [NapierSpider.parse_result_row(result_row) for result_row in extracted_data]
 
     @staticmethod
-    def get_valid_rows(data):
-        extracted_course_results = "".join(data.css('pre::text').extract())
-        return [line for line in extracted_course_results.split('\n')
-                if len(line) > 0 and
-                '<i>' not in line and
-                not line.isspace() and
-                (' and ' not in line and '&' not in line and '+' not in line and '/' not in line)]
-
-    @staticmethod
-    def identify_columns(data):
-        filtered_event_results = NapierSpider.get_valid_rows(data)
-        space_indices = [NapierSpider.find_space_indices(line) for line in filtered_event_results]
-        max_line_length = max([len(line) for line in filtered_event_results])
-        popular_space_indices = sorted(list(set([0] + NapierSpider.find_popular_space_indices(space_indices, len(filtered_event_results)) + [max_line_length])))
-
-        return NapierSpider.identify_column_indices(popular_space_indices)
+    def add_result_context(parsed_results, course_info, venue_info, event_info):
+        """
+        Adds the course, venue and event details to each result of a course.
+        The details are converted to dicts once and shared by every result.
+        """
+        context = {'course': dict(course_info), 'venue': dict(venue_info), 'event': dict(event_info)}
+        for parsed_result in parsed_results:
+            parsed_result.update(context)
 
     @staticmethod
-    def find_space_indices(line):
+    def get_valid_rows(data):
         """
-        Returns a list of the indices where there is a space in the input line
+        Returns the result rows of a course's results, leaving out blank,
+        italic, team and header lines (see tokenizer.py)
         """
-        return [i for i, x in enumerate(line) if x == ' ']
+        return tokenizer.course_result_lines(data)
 
     @staticmethod
-    def find_popular_space_indices(space_indices, course_results_count):
+    def identify_template(response, course_results):
         """
-        Returns a list of most popular indices from the input list of lists 
-        of indices where there are spaces on a given line. Popularity is 
-        defined as if more than 90% of the course results have this space. 
+        Returns the parts of a results page that identify its template: the
+        results software's footer and the column headings
         """
-        totals = Counter(i for i in list(itertools.chain.from_iterable(space_indices))).most_common()
-        return sorted([x[0] for x in totals if x[1] > int(math.floor(course_results_count * 0.95))])
+        footer = u"".join(response.css('address ::text').extract()).strip()
+        headings = None
+        if len(course_results) > 0:
+            headings = tokenizer.header_line(u"".join(course_results[0].css('pre::text').extract()))
+        return footer, headings
 
     @staticmethod
-    def identify_column_indices(common_space_indices):
+    def identify_columns(course_rows, template=None):
         """
-        Returns a list of tuples where each tuple is the bounding indices 
-        for a given column, identified through common spaces indices
+        Identifies the columns from the result rows of every course. Given
+        the page template, the columns are looked up in the layout cache.
+
+        Returns:
+            the (start, end) indices of each column, and whether they came
+            from the layout cache
         """
-        pairs = [(x, common_space_indices[i+1]) for i, x in enumerate(common_space_indices) if i < len(common_space_indices) - 1]
-        return [x for x in pairs if x[1] - x[0] > 1]
+        rows = [row for rows in course_rows for row in rows]
+        if template is None or len(rows) == 0:
+            return columns.identify_columns(rows), False
+        return columns.LAYOUT_CACHE.identify_columns(rows, template)
 
     @staticmethod
     def extract_data(data, column_indices):
@@ -507,42 +757,21 @@ class NapierSpider(scrapy.Spider):
     def parse_result_row(input_row):
         """
         Identifies the element in a row
-        TODO: Separate person and result item parsing into two methods
 
         Args:
             :param input_row: a result from a course as a list of column elements
+        Returns:
+            a ResultRecord
         """
-        person = PersonItem()
-        result = ResultItem()
+        # Position and status, then name, club and age class
+        (status, position) = fields.parse_position(input_row[0])
+        result = ResultRecord(input_row[1], input_row[2], input_row[3], status, position)
 
-        # Position
-        raw_position = input_row[0].rstrip('=;').strip()
-        if raw_position.isdigit():
-            result['status'] = 'ok'
-            result['position'] = raw_position
-        else:
-            result['status'] = raw_position
-
-        # Name
-        person['name'] = input_row[1]
-
-        # Club
-        person['club'] = input_row[2]
-
-        # Age Class
-        person['ageClass'] = input_row[3]
-
-        # Time
+        # Time, or a status such as 'dnf' in place of the time
         raw_time = input_row[4]
-        if ':' in raw_time:
-            time_parts = raw_time.split(':')
-            full_minutes = int(time_parts[0])
-            hours = full_minutes / 60
-            minutes = full_minutes % 60
-            seconds = int(time_parts[1])
-            result['time'] = datetime.time(hours, minutes, seconds).isoformat()
-        elif raw_time.isalpha():
-            result['status'] = raw_time
+        result.time = fields.parse_time(raw_time)
+        if result.time is None and raw_time.isalpha():
+            result.status = fields.parse_status(raw_time)
 
         # Comments
         if len(input_row) > 5:
@@ -550,40 +779,15 @@ class NapierSpider(scrapy.Spider):
             if len(raw_comments) > 0 and not raw_comments.isspace():
                 NapierSpider.parse_comments(input_row[5], result)
 
-        person['result'] = dict(result)
-        return person
+        return result
 
     @staticmethod
     def parse_comments(raw_comments, result):
         """
         Parses final column of data that contains comments. One example that it parses the missed controls numbers 
-        from a string such as '1,4-6' to return a list of missed control numbers as integers e.g. [1,4,5,6].
+        from a string such as '1,4-6' to return an array of missed control numbers as integers e.g. (1,4,5,6).
         """
-        split_comments = raw_comments.lower().split(';')
-
-        for comment in split_comments:
-            if "out of order" in comment:
-                result['out_of_order'] = int(comment.split("out of order")[0].strip().split()[-1])
-
-            elif "missing" in comment:
-                missing_numbers_raw = comment.strip().split(' ')[-1]
-                missing_numbers_processed = []
-                for group in missing_numbers_raw.split(','):
-                    split_group = group.split('-')
-                    if len(split_group) > 1:
-                        missing_numbers_processed += range(int(split_group[0]), int(split_group[1]) + 1)
-                    else:
-                        missing_numbers_processed += [int(split_group[0])]
-
-                result['missed'] = missing_numbers_processed
-
-            elif "no finish time" in comment:
-                # Nothing needs to be done as 'dnf' would be in the time field in this case and a prior part of the
-                # code would have detected the 'dnf' and set the result status field accordingly
-                pass
-
-            else:
-                print("Unknown comment: " + str(comment))
+        fields.parse_comments(raw_comments, result)
 
     # ======================================================================= #
     # Miscellaneous functions  ---------------------------------------------- #
@@ -594,20 +798,26 @@ class NapierSpider(scrapy.Spider):
         Called when the Scrapy crawler has completed and it being closed down
         """
 
+        if self.fingerprints:
+            self.fingerprints.save()
+
+        events_discovered = self.get_count('events_discovered')
+        events_processed = self.get_count('events_processed')
+        courses_discovered = self.get_count('courses_discovered')
+        courses_processed = self.get_count('courses_processed')
+
         print("{:d}% of events processed ({:d} of {:d})"\
-            .format(int((self.processed_events_count /
-                    float(self.discovered_events_count)) * 100),
-                    self.processed_events_count, self.discovered_events_count))
+            .format(int((events_processed / float(max(events_discovered, 1))) * 100),
+                    events_processed, events_discovered))
 
         print("{:d}% of courses processed ({:d} of {:d})" \
-            .format(int((self.processed_courses_count /
-                         float(self.discovered_courses_count)) * 100),
-                    self.processed_courses_count, self.discovered_courses_count))
+            .format(int((courses_processed / float(max(courses_discovered, 1))) * 100),
+                    courses_processed, courses_discovered))
 
         print("{:d} results found over {:d} processed courses of {:d} processed events)"\
-            .format(int(self.processed_results_count), 
-                    int(self.processed_courses_count),
-                    int(self.processed_events_count)))
+            .format(int(self.get_count('results_processed')),
+                    int(courses_processed),
+                    int(events_processed)))
 
     @staticmethod
     def print_summary(event):
@@ -621,6 +831,6 @@ class NapierSpider(scrapy.Spider):
         print("| {0:<10} {1:<150} |".format("Status:", event.get("status", "")))
         print("| {0:<10} {1:<150} |".format("Format:", event.get("results_format", "")))
         print("| {0:<10} {1:<150} |".format("Courses:", len(event.get("courses", ""))))
-        print("| {0:<10} {1:<150} |".format("Results:", len(event.get("results", ""))))
+        print("| {0:<10} {1:<150} |".format("Results:", event.get("results_count", len(event.get("results", "")))))
         print("\\" + ("=" * 163) + "/")
         print("")
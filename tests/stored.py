@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Items parsed from generated results pages, and an in-memory stand-in for
+MongoDB holding them as the MongoPipeline stores them, for the tests that
+read stored events back without a MongoDB server.
+
+@author: abradbury
+"""
+
+import os
+import sys
+
+from scrapy.http import HtmlResponse
+
+from Orienteering_Scraper.benchmarks.pages import generate_results_page
+from Orienteering_Scraper.items import CourseResultsItem
+from Orienteering_Scraper.normalize import normalize_course_results, normalize_event_summary
+from Orienteering_Scraper.pipelines import MongoPipeline, add_content_hash
+from Orienteering_Scraper.reparse import create_spider
+
+
+class FakeCollection(object):
+    """
+    The documents of a collection, found by equality on top-level fields
+    """
+
+    def __init__(self):
+        self.documents = []
+
+    def find(self, query=None, *args, **kwargs):
+        return [document for document in self.documents
+                if all(document.get(field) == value for field, value in (query or {}).items())]
+
+    def insert_many(self, documents):
+        self.documents.extend(documents)
+
+    def bulk_write(self, operations, ordered=True):
+        """
+        Applies ReplaceOne upserts by _id
+        """
+        for operation in operations:
+            document = operation._doc
+            self.documents = [stored for stored in self.documents
+                              if stored['_id'] != operation._filter['_id']]
+            self.documents.append(document)
+
+
+class FakeDatabase(object):
+
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, collection_name):
+        return self.collections.setdefault(collection_name, FakeCollection())
+
+    def __getattr__(self, collection_name):
+        if collection_name.startswith('_'):
+            raise AttributeError(collection_name)
+        return self[collection_name]
+
+
+def crawled_items(url, stream_results, courses_count=3, rows_count=20, seed=0):
+    """
+    Returns the items the spider yields for a generated results page
+    """
+    spider = create_spider()
+    spider.stream_results = stream_results
+    event = spider.new_event_summary(url)
+    event['url'] = url
+    event['results_format'] = ""
+
+    body = generate_results_page(courses_count=courses_count, rows_count=rows_count, seed=seed)
+    response = HtmlResponse(url, body=body, encoding='utf-8')
+
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as sys.stdout:
+        try:
+            return list(spider.parse_napier_common(response, event))
+        finally:
+            sys.stdout = stdout
+
+
+def store(db, items, storage_layout):
+    """
+    Adds the documents of items to a database, as the MongoPipeline writes
+    them in a storage layout
+    """
+    for item in items:
+        if storage_layout == 'embedded':
+            collection_name = 'course_results' if isinstance(item, CourseResultsItem) else 'results'
+            db[collection_name].insert_many([MongoPipeline.to_document(item)])
+        elif isinstance(item, CourseResultsItem):
+            for collection_name, document in normalize_course_results(item):
+                db[collection_name].insert_many([add_content_hash(document)])
+        else:
+            for collection_name, document in normalize_event_summary(item['doc_id'], item):
+                db[collection_name].insert_many([add_content_hash(document)])
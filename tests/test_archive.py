@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks that pages stored in the page archive (see archive.py) are loaded
+back as they were downloaded, under every URL they were requested at, and
+that the archive answers requests in replay mode.
+
+@author: abradbury
+"""
+
+from scrapy.http import HtmlResponse, Request
+
+from Orienteering_Scraper.archive import PageArchive, PageArchiveMiddleware
+from Orienteering_Scraper.reparse import create_spider
+
+RESULTS_URL = 'http://www.example.com/event/results.htm'
+REDIRECTED_URL = 'http://www.example.com/event/results'
+
+HEADERS = {'Content-Type': 'text/html; charset=utf-8', 'ETag': '"abc"', 'Set-Cookie': 'id=1'}
+
+
+def results_page(body=b'<html><body><pre>Results</pre></body></html>'):
+    return HtmlResponse(RESULTS_URL, body=body, headers=HEADERS)
+
+
+def test_store_and_load(tmpdir):
+    archive = PageArchive(str(tmpdir))
+    assert archive.store(results_page())
+    assert not archive.store(results_page())
+    archive.close()
+
+    request = Request(RESULTS_URL)
+    response = PageArchive(str(tmpdir)).load(RESULTS_URL, request)
+
+    assert isinstance(response, HtmlResponse)
+    assert (response.url, response.status, response.body) == (RESULTS_URL, 200,
+                                                               results_page().body)
+    assert response.headers['ETag'] == b'"abc"'
+    assert 'Set-Cookie' not in response.headers
+    assert response.request is request
+    assert response.flags == ['archived']
+    assert PageArchive(str(tmpdir)).load('http://www.example.com/other.htm') is None
+
+
+def test_latest_version_is_loaded(tmpdir):
+    archive = PageArchive(str(tmpdir))
+    archive.store(results_page())
+    archive.store(results_page(b'<html><body><pre>Corrected results</pre></body></html>'))
+    archive.store(results_page())
+    archive.close()
+
+    reloaded = PageArchive(str(tmpdir))
+    assert len(reloaded.archived) == 2
+    assert reloaded.load(RESULTS_URL).body == b'<html><body><pre>Corrected results</pre></body></html>'
+
+
+def archive_middleware(directory, replay):
+    spider = create_spider()
+    return PageArchiveMiddleware(PageArchive(directory), replay, spider.crawler.stats), spider
+
+
+def test_redirect_urls_are_archived(tmpdir):
+    middleware, spider = archive_middleware(str(tmpdir), replay=False)
+    request = Request(RESULTS_URL, meta={'redirect_urls': [REDIRECTED_URL]})
+    middleware.process_response(request, results_page(), spider)
+    middleware.spider_closed(spider)
+
+    middleware, spider = archive_middleware(str(tmpdir), replay=True)
+    for url in (REDIRECTED_URL, RESULTS_URL):
+        response = middleware.process_request(Request(url), spider)
+        assert (response.url, response.body) == (url, results_page().body)
+    assert spider.crawler.stats.get_value('archive/replayed') == 2
+
+
+def test_missing_page_in_replay(tmpdir):
+    middleware, spider = archive_middleware(str(tmpdir), replay=True)
+    request = Request(RESULTS_URL)
+    response = middleware.process_request(request, spider)
+
+    assert (response.url, response.status, response.request) == (RESULTS_URL, 404, request)
+    assert spider.crawler.stats.get_value('archive/missing') == 1
+
+    # Responses are not archived while replaying
+    middleware.process_response(request, results_page(), spider)
+    assert middleware.page_archive.load(RESULTS_URL) is None
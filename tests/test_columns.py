@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks that the space bitmap column inference (see columns.py) finds the
+same columns as the original algorithm, which counted the index of every
+space on every row, on a saved results page and on generated pages.
+
+@author: abradbury
+"""
+
+import itertools                    # For flattening the space indices
+import math
+import os
+import random                       # For generating ragged lines
+from collections import Counter     # For counting the space indices
+
+import pytest
+from scrapy.http import HtmlResponse
+
+from Orienteering_Scraper import columns
+from Orienteering_Scraper.benchmarks.pages import COLOUR, MERCS_SIMPLE, generate_results_page
+from Orienteering_Scraper.spiders.napier_spider import NapierSpider
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+
+
+def baseline_identify_columns(lines):
+    """
+    The column inference the spider used before columns.py, kept here as the
+    reference
+    """
+    space_indices = [[i for i, x in enumerate(line) if x == ' '] for line in lines]
+    max_line_length = max(len(line) for line in lines)
+
+    totals = Counter(itertools.chain.from_iterable(space_indices)).most_common()
+    popular = sorted(x[0] for x in totals if x[1] > int(math.floor(len(lines) * 0.95)))
+    indices = sorted(set([0] + popular + [max_line_length]))
+
+    pairs = [(x, indices[i + 1]) for i, x in enumerate(indices) if i < len(indices) - 1]
+    return [x for x in pairs if x[1] - x[0] > 1]
+
+
+def page_lines(body, url='http://www.example.com/results.htm'):
+    """
+    Returns the result lines of every course of a results page, as the
+    spider passes them to the column inference
+    """
+    response = HtmlResponse(url, body=body, encoding='utf-8')
+    (_, course_results) = NapierSpider.identify_course_data(response, {'results_format': ""})
+    return [row for results in course_results for row in NapierSpider.get_valid_rows(results)]
+
+
+def test_saved_page():
+    with open(os.path.join(PAGES_DIR, 'napier_colour.htm'), 'rb') as page:
+        lines = page_lines(page.read())
+
+    assert len(lines) > 0
+    assert columns.identify_columns(lines) == baseline_identify_columns(lines)
+
+
+@pytest.mark.parametrize('results_format', [COLOUR, MERCS_SIMPLE])
+@pytest.mark.parametrize('seed', range(5))
+def test_generated_pages(results_format, seed):
+    lines = page_lines(generate_results_page(results_format, courses_count=4, rows_count=60,
+                                             seed=seed))
+
+    assert columns.identify_columns(lines) == baseline_identify_columns(lines)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_ragged_lines(seed):
+    """
+    Lines of different lengths, where the padding of the shorter lines must
+    not be taken as spaces
+    """
+    rng = random.Random(seed)
+    lines = [u"".join(rng.choice(u"ab  ") for _ in range(rng.randint(1, 40)))
+             for _ in range(rng.randint(1, 30))]
+
+    assert columns.identify_columns(lines) == baseline_identify_columns(lines)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks that the runs exported from MongoDB (see export.py) are those
+exported by the ColumnarExportPipeline as the event was crawled, whether or
+not its results were streamed, and that no partial files are left in the
+dataset.
+
+@author: abradbury
+"""
+
+import os
+
+import pyarrow.parquet as pq
+import pytest
+
+from Orienteering_Scraper import export
+from Orienteering_Scraper.pipelines import ColumnarExportPipeline
+from Orienteering_Scraper.reparse import create_spider
+from Orienteering_Scraper.tests.stored import FakeDatabase, crawled_items, store
+
+RESULTS_URL = 'http://www.example.com/results.htm'
+
+
+def dataset_files(directory):
+    return sorted(os.path.relpath(os.path.join(path, filename), directory)
+                  for path, _, filenames in os.walk(directory) for filename in filenames)
+
+
+def exported_rows(directory):
+    (path,) = dataset_files(directory)
+    return pq.read_table(os.path.join(directory, path)).to_pydict()
+
+
+@pytest.mark.parametrize('storage_layout', ['embedded', 'normalized'])
+@pytest.mark.parametrize('stream_results', [False, True])
+def test_export_stored(tmpdir, storage_layout, stream_results):
+    items = crawled_items(RESULTS_URL, stream_results)
+    spider = create_spider()
+
+    crawled_dir = str(tmpdir.join('crawled'))
+    pipeline = ColumnarExportPipeline(crawled_dir, spider.crawler.stats)
+    for item in items:
+        pipeline.process_item(item, spider)
+
+    stored_db = FakeDatabase()
+    store(stored_db, items, storage_layout)
+    stored_dir = str(tmpdir.join('stored'))
+    events_count, runs_count = export.export_stored(stored_db, storage_layout, stored_dir)
+
+    assert (events_count, runs_count) == (1, items[-1]['results_count'])
+    assert dataset_files(stored_dir) == dataset_files(crawled_dir)
+    assert exported_rows(stored_dir) == exported_rows(crawled_dir)
+
+
+def test_export_replaces_event(tmpdir):
+    directory = str(tmpdir)
+    rows = [dict((name, None) for name, _ in export.SCHEMA)]
+    rows[0]['event_id'] = 'event'
+
+    export.write_runs(directory, '2017-01-22', 'event', rows)
+    rows[0]['name'] = 'Ann Lee'
+    export.write_runs(directory, '2017-01-22', 'event', rows)
+
+    assert dataset_files(directory) == [os.path.join('date=2017-01-22', 'event.parquet')]
+    assert exported_rows(directory)['name'] == ['Ann Lee']
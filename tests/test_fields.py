@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks that the field parsers (see fields.py) parse result rows as the
+original parser of the spider did, apart from the intended changes listed
+below, that caching them does not change the parsed results, and that the
+values shared through the lookup tables, such as the arrays of missed
+controls, are never modified once handed out.
+
+@author: abradbury
+"""
+
+import random                       # For generating result rows
+
+import pytest
+from scrapy.http import HtmlResponse
+
+from Orienteering_Scraper import fields
+from Orienteering_Scraper.benchmarks.pages import generate_results_page, generate_rows
+from Orienteering_Scraper.records import ResultRecord
+from Orienteering_Scraper.spiders.napier_spider import NapierSpider
+
+# Rows with fields that the generated rows do not have, parsed as by the
+# original parser
+EXTRA_ROWS = [
+    ['1=;', 'Bob Jones', 'EPOC', 'M21', '65:02', ''],
+    ['mp', 'Dan White', 'LOC', 'M60', '58:10', 'missing 3; 2 out of order'],
+    ['n/c', 'Fred Green', 'SYO', 'M10', '9:7', ''],
+    ['', 'Gina Grey', 'CLOK', 'W12', 'dns', 'no finish time']
+]
+
+# Rows that the field parsers intentionally parse differently from the
+# original parser, and the changed fields of their results
+CHANGED_ROWS = [
+    # Times of an hour or more written as h:mm:ss
+    (['1=', 'Alice Smith', 'SYO', 'W21', '1:05:02', ''], {'time': '01:05:02'}),
+    # Status codes written in other ways are normalised
+    (['rtd', 'Carl Brown', 'DVO', 'M45', 'ret', ''], {'status': 'rtd'}),
+    (['DISQ', 'Eve Black', 'AIRE', 'W45', '44:01', ''], {'status': 'dsq'}),
+    (['NC', 'Hugh Hill', 'SYO', 'M35', '51:30', ''], {'status': 'n/c'}),
+    # Ranges of missed controls written with spaces
+    (['mp', 'Ian Moss', 'EBOR', 'M50', '62:15', 'missing 12 - 14'], {'missed': [12, 13, 14]}),
+    (['mp', 'Jo Park', 'SYO', 'W50', '59:45', 'missing 2, 5 - 6'], {'missed': [2, 5, 6]})
+]
+
+
+def baseline_parse_result_row(input_row):
+    """
+    The parser of result rows the spider used before fields.py, kept here as
+    the reference
+    """
+    result = ResultRecord(input_row[1], input_row[2], input_row[3], None)
+
+    raw_position = input_row[0].rstrip('=;').strip()
+    if raw_position.isdigit():
+        result.status = 'ok'
+        result.position = raw_position
+    else:
+        result.status = raw_position
+
+    raw_time = input_row[4]
+    if ':' in raw_time:
+        time_parts = raw_time.split(':')
+        result.time = int(time_parts[0]) * 60 + int(time_parts[1])
+    elif raw_time.isalpha():
+        result.status = raw_time
+
+    if len(input_row) > 5:
+        raw_comments = input_row[5]
+        if len(raw_comments) > 0 and not raw_comments.isspace():
+            baseline_parse_comments(input_row[5], result)
+
+    return result
+
+
+def baseline_parse_comments(raw_comments, result):
+    for comment in raw_comments.lower().split(';'):
+        if "out of order" in comment:
+            result.out_of_order = int(comment.split("out of order")[0].strip().split()[-1])
+
+        elif "missing" in comment:
+            missing_numbers_raw = comment.strip().split(' ')[-1]
+            missing_numbers_processed = []
+            for group in missing_numbers_raw.split(','):
+                split_group = group.split('-')
+                if len(split_group) > 1:
+                    missing_numbers_processed += range(int(split_group[0]), int(split_group[1]) + 1)
+                else:
+                    missing_numbers_processed += [int(split_group[0])]
+
+            result.missed = tuple(missing_numbers_processed)
+
+
+def result_rows(seed, rows_count=300):
+    """
+    Returns generated result rows, split into columns as by extract_data
+    """
+    rows = [[line[0:4].strip(), line[6:30].strip(), line[30:37].strip(), line[37:43].strip(),
+             line[43:50].strip(), line[53:].strip()]
+            for line in generate_rows(rows_count, random.Random(seed))]
+    return rows + EXTRA_ROWS
+
+
+def parsed(rows):
+    return [NapierSpider.parse_result_row(row).to_dict() for row in rows]
+
+
+@pytest.fixture
+def uncached_parsers(monkeypatch):
+    """
+    Replaces the cached field parsers with the parsers themselves
+    """
+    for name in ('parse_status', 'parse_position', 'parse_time', 'parse_comment_fields'):
+        monkeypatch.setattr(fields, name, getattr(fields, name).uncached)
+
+
+@pytest.fixture
+def empty_caches():
+    fields.clear_caches()
+    yield
+    fields.clear_caches()
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_baseline(seed, empty_caches):
+    rows = result_rows(seed)
+
+    assert parsed(rows) == [baseline_parse_result_row(row).to_dict() for row in rows]
+
+
+@pytest.mark.parametrize('row, changes', CHANGED_ROWS)
+def test_changed_from_baseline(row, changes, empty_caches):
+    result = parsed([row])[0]
+    expected = baseline_parse_result_row(row).to_dict()
+    expected['result'].update(changes)
+
+    assert result == expected
+    assert result != baseline_parse_result_row(row).to_dict()
+
+
+def test_unknown_comment_is_logged(caplog, empty_caches):
+    result = parsed([['mp', 'Kim Lowe', 'SYO', 'W21', '48:09', 'missing 4; wrong map']])[0]
+
+    assert result['result']['missed'] == [4]
+    assert [record.getMessage() for record in caplog.records] == ["Unknown comment: wrong map"]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_parse_result_row(seed, empty_caches, request):
+    rows = result_rows(seed) + [row for row, _ in CHANGED_ROWS]
+    cold = parsed(rows)
+    warm = parsed(rows)
+
+    request.getfixturevalue('uncached_parsers')
+    assert cold == parsed(rows)
+    assert warm == cold
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_parse_comment_fields(seed, empty_caches):
+    comments = [row[5] for row in result_rows(seed) if row[5]]
+
+    for comment in comments + comments:
+        assert fields.parse_comment_fields(comment) == \
+            fields.parse_comment_fields.uncached(comment)
+
+
+def test_cached_values_are_not_modified(empty_caches):
+    """
+    Parses whole pages, building the items as the spider does, then checks
+    every cached value against a fresh parse of its key
+    """
+    body = generate_results_page(courses_count=4, rows_count=200, seed=1)
+    response = HtmlResponse('http://www.example.com/results.htm', body=body, encoding='utf-8')
+
+    for _ in range(2):
+        extracted = NapierSpider.extract_results(response)
+        for _, results in extracted['courses']:
+            for result in results:
+                result['result'].get('missed', []).append(0)
+
+    missed_arrays = [value for comment_fields in fields.parse_comment_fields.table.values()
+                     for field, value in comment_fields if field == 'missed']
+    assert len(missed_arrays) > 0
+
+    for parser in (fields.parse_status, fields.parse_position, fields.parse_time,
+                   fields.parse_comment_fields):
+        for raw, value in parser.table.items():
+            assert value == parser.uncached(raw)
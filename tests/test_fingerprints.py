@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks the fingerprints of results pages kept between crawls (see
+fingerprints.py), and that the spider still finds the results of a known
+event when they are republished under a new link.
+
+@author: abradbury
+"""
+
+from scrapy.http import HtmlResponse, Request
+from six.moves.urllib.parse import urlparse
+
+from Orienteering_Scraper.fingerprints import FingerprintStore
+from Orienteering_Scraper.reparse import create_spider
+
+EVENT_URL = 'http://www.example.com/events/event/622-local-event'
+RESULTS_URL = 'http://www.example.com/event/2017-04-29/results_v1.htm'
+REPUBLISHED_RESULTS_URL = 'http://www.example.com/event/2017-04-29/results_v2.htm'
+
+HEADERS = {'ETag': '"abc"', 'Last-Modified': 'Sat, 29 Apr 2017 18:00:00 GMT'}
+
+
+def results_page(url=RESULTS_URL, body=b'<html><body><pre>Results</pre></body></html>',
+                 status=200, headers=None):
+    return HtmlResponse(url, body=body, status=status, headers=headers)
+
+
+def confirmed_store(path):
+    store = FingerprintStore(path)
+    store.stage('event', results_page(headers=HEADERS))
+    store.confirm('event', [EVENT_URL])
+    return store
+
+
+def test_missing_store_is_empty(tmpdir):
+    store = FingerprintStore.load(str(tmpdir.join('fingerprints.json')))
+
+    assert (store.pages, store.events) == ({}, {})
+    assert not store.is_known_event(EVENT_URL)
+    assert store.conditional_headers(RESULTS_URL) == {}
+
+
+def test_save_and_load(tmpdir):
+    path = str(tmpdir.join('fingerprints.json'))
+    confirmed_store(path).save()
+    store = FingerprintStore.load(path)
+
+    assert store.is_known_event(EVENT_URL)
+    assert store.events == {EVENT_URL: RESULTS_URL}
+    assert store.conditional_headers(RESULTS_URL) == {'If-None-Match': HEADERS['ETag'],
+                                                      'If-Modified-Since': HEADERS['Last-Modified']}
+    assert tmpdir.listdir() == [tmpdir.join('fingerprints.json')]
+
+
+def test_is_unchanged(tmpdir):
+    store = confirmed_store(str(tmpdir.join('fingerprints.json')))
+
+    assert store.is_unchanged(results_page(body=b'', status=304))
+    assert store.is_unchanged(results_page())
+    assert not store.is_unchanged(results_page(body=b'<html><body><pre>New</pre></body></html>'))
+    assert not store.is_unchanged(results_page(url=REPUBLISHED_RESULTS_URL))
+
+
+def test_only_stored_events_are_recorded(tmpdir):
+    store = FingerprintStore(str(tmpdir.join('fingerprints.json')))
+    store.stage('event', results_page())
+    store.stage('failed', results_page(url=REPUBLISHED_RESULTS_URL))
+
+    assert not store.is_unchanged(results_page())
+
+    store.discard('failed')
+    store.confirm('failed', [EVENT_URL])
+    assert store.pages == {}
+
+    store.confirm('event', [EVENT_URL])
+    assert store.is_unchanged(results_page())
+    assert store.conditional_headers(RESULTS_URL) == {}
+
+
+def test_known_event_page_is_requested(tmpdir):
+    spider = create_spider()
+    spider.fingerprints = confirmed_store(str(tmpdir.join('fingerprints.json')))
+    listing_page = HtmlResponse('http://www.example.com/results', body=(
+        b'<table class="eventtable"><tr><td headers="jem_title">'
+        b'<a href="/events/event/622-local-event">Local event</a></td></tr></table>'))
+
+    requests = list(spider.parse(listing_page))
+
+    assert [request.url for request in requests] == [EVENT_URL]
+    assert requests[0].callback == spider.parse_event_page
+
+
+def test_republished_results_are_requested(tmpdir):
+    spider = create_spider()
+    spider.fingerprints = confirmed_store(str(tmpdir.join('fingerprints.json')))
+
+    def event_page(results_url):
+        results_link = urlparse(results_url).path
+        return HtmlResponse(EVENT_URL, request=Request(EVENT_URL), body=(
+            '<dl class="event_info"><dd class="custom4"><a href="' + results_link + '">Results</a>'
+            '</dd></dl>').encode('utf-8'))
+
+    (request,) = spider.parse_event_page(event_page(RESULTS_URL))
+    assert request.headers.get('If-None-Match') == HEADERS['ETag'].encode('utf-8')
+
+    (request,) = spider.parse_event_page(event_page(REPUBLISHED_RESULTS_URL))
+    assert request.url == REPUBLISHED_RESULTS_URL
+    assert 'If-None-Match' not in request.headers
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks when results with the same name key are resolved to the same runner
+(see identity.py), in particular across clubs.
+
+@author: abradbury
+"""
+
+import pytest
+
+from Orienteering_Scraper.identity import EXACT, NEW, SIMILAR, IdentityIndex
+
+
+def resolve_all(results):
+    """
+    Resolves (name, club, age class) results in order, returning the runner
+    ID and how it was found for each
+    """
+    index = IdentityIndex('identities.json')
+    return [index.resolve(name, club, age_class) for name, club, age_class in results]
+
+
+def test_same_name_and_club():
+    resolved = resolve_all([(u'SÁENZ, Jimena', u'SYO', u'W21'),
+                            (u'Jimena Saenz', u'syo ', u'W35')])
+
+    assert resolved[1] == (resolved[0][0], EXACT)
+
+
+def test_similar_name_of_club():
+    resolved = resolve_all([(u'John Smith', u'SYO', u'M21'), (u'Jon Smith', u'SYO', u'M21')])
+
+    assert resolved[1] == (resolved[0][0], SIMILAR)
+
+
+@pytest.mark.parametrize('results', [
+    # The ages of the age classes are too far apart
+    [(u'Tom Brown', u'SYO', u'M14'), (u'Tim Brown', u'SYO', u'M45')],
+    [(u'John Smith', u'SYO', u'M14'), (u'Jon Smith', u'SYO', u'M45')],
+    # The names start with different letters
+    [(u'Catherine Jones', u'SYO', u'W21'), (u'Katherine Jones', u'SYO', u'W21')]
+])
+def test_similar_name_of_other_runner(results):
+    resolved = resolve_all(results)
+
+    assert resolved[1][1] == NEW
+    assert resolved[1][0] != resolved[0][0]
+
+
+@pytest.mark.parametrize('age_classes', [(u'M18', u'M21'), (u'M21', u'M55'), (u'M45', u'M50'),
+                                         (u'M', u'M65')])
+def test_similar_name_of_compatible_age_class(age_classes):
+    resolved = resolve_all([(u'John Smith', u'SYO', age_classes[0]),
+                            (u'Jon Smith', u'SYO', age_classes[1])])
+
+    assert resolved[1] == (resolved[0][0], SIMILAR)
+
+
+def test_other_club_is_not_matched():
+    resolved = resolve_all([(u'John Smith', u'SYO', u'M21'), (u'John Smith', u'DVO', u'M21')])
+
+    assert resolved[1][1] == NEW
+    assert resolved[1][0] != resolved[0][0]
+
+
+@pytest.mark.parametrize('results', [
+    [(u'Ann Lee', u'EPOC', u'W21'), (u'Ann Lee', u'', u'W21')],
+    [(u'Ann Lee', u'', u'W21'), (u'Ann Lee', u'EPOC', u'W21')]
+])
+def test_result_or_runner_without_club(results):
+    resolved = resolve_all(results)
+
+    assert resolved[1] == (resolved[0][0], EXACT)
+
+
+def test_result_without_club_between_clubs():
+    resolved = resolve_all([(u'Ann Lee', u'EPOC', u'W21'), (u'Ann Lee', u'SYO', u'W21'),
+                            (u'Ann Lee', u'', u'W21')])
+
+    assert len(set(runner_id for runner_id, _ in resolved)) == 3
+
+
+def test_runner_without_club_joins_one_club():
+    resolved = resolve_all([(u'Ann Lee', u'', u'W21'), (u'Ann Lee', u'EPOC', u'W21'),
+                            (u'Ann Lee', u'SYO', u'W21')])
+
+    assert resolved[1][0] == resolved[0][0]
+    assert resolved[2][1] == NEW
+
+
+def test_other_sex_is_not_matched():
+    resolved = resolve_all([(u'Sam Lee', u'SYO', u'M21'), (u'Sam Lee', u'SYO', u'W21')])
+
+    assert resolved[1][1] == NEW
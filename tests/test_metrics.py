@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks the timing of spider callbacks (see metrics.py), the rates derived
+from the crawler stats and the Prometheus text file they are written to.
+
+@author: abradbury
+"""
+
+import datetime
+
+import pytest
+
+from Orienteering_Scraper import metrics
+from Orienteering_Scraper.reparse import create_spider
+
+
+class FakeTime(object):
+    """
+    A clock that only moves when told to, standing in for the time module
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class TimedSpider(object):
+
+    name = 'napier'
+
+    def __init__(self, clock):
+        self.crawler = create_spider().crawler
+        self.clock = clock
+
+    @metrics.timed('parse')
+    def parse(self, seconds):
+        self.clock.now += seconds
+        return seconds
+
+    @metrics.timed('parse_items')
+    def parse_items(self, items_count):
+        for item in range(items_count):
+            self.clock.now += 1
+            yield item
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(metrics, 'time', clock)
+    return clock
+
+
+def timing(stats, stage):
+    return dict((name, stats.get_value('timing/' + stage + '/' + name))
+                for name in ('calls', 'seconds', 'max_seconds'))
+
+
+def test_timed_callback(clock):
+    spider = TimedSpider(clock)
+
+    assert spider.parse(3) == 3
+    assert spider.parse(1) == 1
+    assert timing(spider.crawler.stats, 'parse') == {'calls': 2, 'seconds': 4, 'max_seconds': 3}
+
+
+def test_timed_generator_callback(clock):
+    spider = TimedSpider(clock)
+
+    items = []
+    for item in spider.parse_items(3):
+        # Time spent consuming the output is not counted
+        clock.now += 10
+        items.append(item)
+        assert spider.crawler.stats.get_value('timing/parse_items/calls') is None
+
+    assert items == [0, 1, 2]
+    assert timing(spider.crawler.stats, 'parse_items') == {'calls': 1, 'seconds': 3,
+                                                           'max_seconds': 3}
+
+
+def stage_metrics(clock, path=''):
+    spider = TimedSpider(clock)
+    stats = spider.crawler.stats
+    stats.set_value('start_time', datetime.datetime(2018, 1, 1))
+    stats.set_value('finish_reason', 'finished')
+    stats.set_value('napier/fingerprinting', True)
+    stats.set_value('item_scraped_count', 50)
+    stats.set_value('napier/results_processed', 200)
+    stats.set_value('timing/parse_napier_common/seconds', 2.0)
+    stats.set_value('timing/extract_results/seconds', 3.0)
+    stats.set_value('napier/layout_cache_hits', 3)
+    stats.set_value('napier/layout_cache_misses', 1)
+    stats.set_value('mongo/batches', 4)
+    stats.set_value('mongo/flush_latency_total', 2.0)
+
+    extension = metrics.StageMetrics(stats, path, 15)
+    extension.start_time = clock.now
+    clock.now += 10
+    return extension, spider
+
+
+def test_rates(clock):
+    extension, spider = stage_metrics(clock)
+    extension.update(spider)
+
+    assert dict((key, value) for key, value in spider.crawler.stats.get_stats().items()
+                if key.startswith('rates/')) == {
+        'rates/items_per_second': 5.0,
+        'rates/results_per_second': 20.0,
+        'rates/parse_seconds_per_result_row': 0.025,
+        'rates/layout_cache_hit_rate': 0.75,
+        'rates/mongo_flush_latency_mean': 0.5
+    }
+
+
+def test_metrics_file(clock, tmpdir):
+    path = tmpdir.join('metrics.prom')
+    extension, spider = stage_metrics(clock, str(path))
+    extension.update(spider)
+
+    lines = path.read().splitlines()
+    assert lines[:2] == ['# TYPE orienteering_scraper_item_scraped_count gauge',
+                         'orienteering_scraper_item_scraped_count{spider="napier"} 50.0']
+    assert 'orienteering_scraper_rates_layout_cache_hit_rate{spider="napier"} 0.75' in lines
+    assert len(lines) == 2 * len([value for value in spider.crawler.stats.get_stats().values()
+                                  if isinstance(value, (int, float)) and
+                                  not isinstance(value, bool)])
+    assert not any('start_time' in line or 'finish_reason' in line or 'fingerprinting' in line
+                   for line in lines)
+    assert tmpdir.listdir() == [path]
+
+
+def test_no_metrics_file(clock, tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    extension, spider = stage_metrics(clock)
+    extension.update(spider)
+
+    assert tmpdir.listdir() == []
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks that events stored in the embedded layout are migrated (see
+migrate.py) to the documents the crawler writes in the normalised layout,
+and that events that cannot be given an ID are left out.
+
+@author: abradbury
+"""
+
+import pytest
+from bson.objectid import ObjectId
+
+from Orienteering_Scraper.identifiers import event_id
+from Orienteering_Scraper.migrate import migrate
+from Orienteering_Scraper.normalize import COURSES, EVENTS, RUNS
+from Orienteering_Scraper.tests.stored import FakeDatabase, crawled_items, store
+
+RESULTS_URL = 'http://www.example.com/results.htm'
+
+
+def normalized_documents(db):
+    return dict((collection_name, sorted(db[collection_name].find(), key=lambda doc: doc['_id']))
+                for collection_name in (EVENTS, COURSES, RUNS))
+
+
+@pytest.mark.parametrize('stream_results', [False, True])
+def test_migrate(stream_results):
+    items = crawled_items(RESULTS_URL, stream_results)
+    embedded_db = FakeDatabase()
+    store(embedded_db, items, 'embedded')
+    crawled_db = FakeDatabase()
+    store(crawled_db, items, 'normalized')
+
+    counts, skipped_count = migrate(embedded_db, batch_size=7)
+
+    assert skipped_count == 0
+    assert counts[RUNS] == items[-1]['results_count']
+    assert normalized_documents(embedded_db) == normalized_documents(crawled_db)
+
+    # Migrating again replaces the documents
+    migrate(embedded_db, batch_size=7)
+    assert normalized_documents(embedded_db) == normalized_documents(crawled_db)
+
+
+def test_legacy_events(caplog):
+    (summary,) = [item for item in crawled_items(RESULTS_URL, False) if 'results' in item]
+    db = FakeDatabase()
+    legacy = dict(summary, _id=ObjectId())
+    del legacy['doc_id']
+    without_url = dict(legacy, _id=ObjectId(), name='Night event', url=None, results=[])
+    db.results.insert_many([legacy, without_url])
+
+    counts, skipped_count = migrate(db, batch_size=1000)
+
+    assert skipped_count == 1
+    assert [doc['_id'] for doc in db[EVENTS].find()] == [event_id(RESULTS_URL)]
+    assert counts[RUNS] == summary['results_count']
+    assert str(without_url['_id']) in caplog.text
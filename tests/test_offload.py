@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks that results pages are extracted in worker processes (see
+offload.py) as the spider would extract them, and that the spider is left
+to extract a page itself when a worker fails or does not return in time.
+
+@author: abradbury
+"""
+
+import time                         # For a worker that does not return in time
+
+import pytest
+from scrapy.http import HtmlResponse, Request
+from six.moves.queue import Queue
+from twisted.internet.task import Clock
+
+from Orienteering_Scraper.benchmarks.pages import generate_results_page
+from Orienteering_Scraper.offload import ParseOffloadMiddleware
+from Orienteering_Scraper.reparse import create_spider
+from Orienteering_Scraper.spiders.napier_spider import NapierSpider
+
+RESULTS_URL = 'http://www.example.com/results.htm'
+
+# A results page in the Napier Colour format, but without any results in it
+MALFORMED_PAGE = (b'<html><body><pre>Results to follow</pre>'
+                  b'<address><p>Results software provided by Michael Napier</p></address>'
+                  b'</body></html>')
+
+# The longest a test waits for a worker process, in seconds
+WAIT = 30
+
+
+class FakeReactor(Clock):
+    """
+    A clock for the timeouts, whose calls from the pool's threads are queued
+    to be run by the test
+    """
+
+    def __init__(self):
+        Clock.__init__(self)
+        self.thread_calls = Queue()
+
+    def callFromThread(self, function, *args):
+        self.thread_calls.put((function, args))
+
+    def run_call(self):
+        function, args = self.thread_calls.get(timeout=WAIT)
+        function(*args)
+
+
+@pytest.fixture
+def spider():
+    return create_spider()
+
+
+@pytest.fixture
+def middleware(spider):
+    middleware = ParseOffloadMiddleware(1, spider.crawler.stats, timeout=WAIT)
+    middleware.reactor = FakeReactor()
+    yield middleware
+    middleware.pool.terminate()
+    middleware.pool.join()
+
+
+def offloaded(middleware, spider, body):
+    """
+    Returns the response to an offloaded request for a results page, once
+    the middleware has passed it on
+    """
+    request = Request(RESULTS_URL, meta={'offload_parse': True})
+    response = HtmlResponse(RESULTS_URL, body=body, request=request, encoding='utf-8')
+
+    outputs = []
+    middleware.process_response(request, response, spider).addCallback(outputs.append)
+    while not outputs:
+        middleware.reactor.run_call()
+    assert outputs == [response]
+    return response
+
+
+def test_extracted_in_worker(middleware, spider):
+    body = generate_results_page(courses_count=3, rows_count=20)
+    response = offloaded(middleware, spider, body)
+
+    extracted = response.meta['extracted_results']
+    expected = NapierSpider.extract_results(HtmlResponse(RESULTS_URL, body=body,
+                                                         encoding='utf-8'))
+    assert list(extracted.pop('courses')) == list(expected.pop('courses'))
+    assert extracted == expected
+    assert spider.crawler.stats.get_value('offload/pages') == 1
+
+
+def test_worker_failure(middleware, spider):
+    response = offloaded(middleware, spider, MALFORMED_PAGE)
+
+    assert 'extracted_results' not in response.meta
+    assert spider.crawler.stats.get_value('offload/failures') == 1
+
+
+def test_worker_timeout(middleware, spider):
+    outputs = []
+    middleware.timeout = 0.5
+    middleware.run_in_pool(time.sleep, (1,)).addCallback(outputs.append)
+
+    middleware.reactor.advance(0.5)
+    assert outputs[0][0] is None
+    assert spider.crawler.stats.get_value('offload/timeouts') == 1
+
+    # The output that arrives afterwards is ignored
+    middleware.reactor.run_call()
+    assert len(outputs) == 1
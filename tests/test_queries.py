@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks that stored events are read back whole, and that the lookup queries
+are answered from the indexes declared in INDEXES, rather than by scanning
+every run. Query plans come from explain(), so those checks need a MongoDB
+server (MONGO_TEST_URI, by default the local server) and are skipped if
+there is none. The plans are decoded as SON, so that the keys of compound
+indexes are compared in order.
+
+@author: abradbury
+"""
+
+import os
+
+import pytest
+from bson.son import SON
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import PyMongoError
+
+from Orienteering_Scraper import queries
+from Orienteering_Scraper.normalize import RUNS
+from Orienteering_Scraper.pipelines import event_documents
+from Orienteering_Scraper.tests.stored import FakeDatabase, crawled_items, store
+
+MONGO_TEST_URI = os.environ.get('MONGO_TEST_URI', 'mongodb://localhost:27017')
+
+CLUBS = ['SYO', 'EPOC', 'DVO']
+
+
+@pytest.fixture(scope='module')
+def db():
+    client = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError:
+        client.close()
+        pytest.skip("No MongoDB server at " + MONGO_TEST_URI)
+
+    database_name = 'orienteering_scraper_test_{:d}'.format(os.getpid())
+    test_db = client[database_name]
+    queries.ensure_indexes(test_db, 'normalized')
+
+    runs = []
+    for event_number in range(10):
+        for course_number in range(3):
+            for runner_number in range(20):
+                runs.append({
+                    'event_id': 'event{:d}'.format(event_number),
+                    'course_id': 'course{:d}-{:d}'.format(event_number, course_number),
+                    'date': '2017-{:02d}-01'.format(event_number + 1),
+                    'name': 'Runner {:d}'.format(runner_number),
+                    'club': CLUBS[runner_number % len(CLUBS)],
+                    'ageClass': 'M21',
+                    'result': {'status': 'ok', 'time': 600 + runner_number}
+                })
+    test_db[RUNS].insert_many(runs)
+
+    yield queries.ordered_database(test_db)
+    client.drop_database(database_name)
+    client.close()
+
+
+QUERIES = [
+    lambda test_db, layout: queries.runs_by_runner(test_db, layout, 'Runner 3'),
+    lambda test_db, layout: queries.club_results(test_db, layout, 'SYO', '2017-03-01',
+                                                 '2017-06-01'),
+    lambda test_db, layout: queries.course_leaderboard(test_db, layout, 'course2-1', 10),
+    lambda test_db, layout: queries.event_runs(test_db, layout, 'event4')
+]
+QUERY_IDS = ['runs_by_runner', 'club_results', 'course_leaderboard', 'event_runs']
+
+
+@pytest.mark.parametrize('query', QUERIES, ids=QUERY_IDS)
+def test_query_uses_declared_index(db, query):
+    cursor = query(db, 'normalized')
+
+    assert queries.uses_index(cursor)
+    used = queries.used_indexes(cursor)
+    assert len(used) > 0
+    for keys in used:
+        assert keys in queries.INDEXES['normalized'][RUNS]
+
+
+@pytest.mark.parametrize('query', QUERIES, ids=QUERY_IDS)
+def test_query_needs_normalized_layout(query):
+    with pytest.raises(ValueError):
+        query(None, 'embedded')
+
+
+def test_compound_index_keys_keep_their_order():
+    plan = SON([('stage', 'FETCH'), ('inputStage', SON([
+        ('stage', 'IXSCAN'), ('keyPattern', SON([('name', 1.0), ('date', -1.0)]))]))])
+
+    assert queries.plan_index_keys(plan) == [[('name', ASCENDING), ('date', DESCENDING)]]
+
+
+def without_hash(document):
+    return dict((key, value) for key, value in document.items() if key != 'content_hash')
+
+
+@pytest.mark.parametrize('storage_layout', ['embedded', 'normalized'])
+@pytest.mark.parametrize('stream_results', [False, True])
+def test_stored_events(storage_layout, stream_results):
+    """
+    Stored events are read back with the runs of every course, including
+    those of streamed courses stored apart from the event
+    """
+    items = crawled_items('http://www.example.com/results.htm', stream_results)
+    stored_db = FakeDatabase()
+    store(stored_db, items, storage_layout)
+
+    streamed = {}
+    expected = [event_documents(item, streamed) for item in items][-1]
+    ((event_doc_id, documents),) = list(queries.stored_events(stored_db, storage_layout))
+
+    assert event_doc_id == items[-1]['doc_id']
+    assert sorted(name for name, _ in documents) == sorted(name for name, _ in expected)
+    assert [without_hash(document) for name, document in documents if name == RUNS] == \
+        [document for name, document in expected if name == RUNS]
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks the points scored on each course, the updating and removal of an
+event's scores (see rankings.py), and that rankings updated event by event
+as a crawl goes match those rebuilt from the stored events.
+
+@author: abradbury
+"""
+
+import pytest
+
+from Orienteering_Scraper.normalize import RUNS
+from Orienteering_Scraper.pipelines import IdentityPipeline, RankingPipeline
+from Orienteering_Scraper.rankings import Rankings, course_points, differences, rebuild
+from Orienteering_Scraper.reparse import create_spider
+from Orienteering_Scraper.tests.stored import FakeDatabase, crawled_items, store
+
+
+def event_documents(runs):
+    """
+    Returns the run documents of an event from (course, runner ID, name,
+    club, status, time) tuples
+    """
+    return [(RUNS, {'course_id': course, 'runner_id': runner_id, 'name': name, 'club': club,
+                    'result': {'status': status, 'time': time}})
+            for course, runner_id, name, club, status, time in runs]
+
+
+def test_course_points():
+    runs = [('winner', 'ok', 1800), ('second', 'ok', 2400), ('slowest', 'ok', 3600),
+            ('mispunched', 'mp', 1500), ('no time', 'ok', None), ('retired', 'rtd', None)]
+
+    assert course_points(runs) == [('winner', 1000), ('second', 750), ('slowest', 500)]
+    assert course_points([('mispunched', 'mp', 1500)]) == []
+
+
+def test_update_and_remove_event(tmpdir):
+    rankings = Rankings(str(tmpdir.join('rankings.json')))
+
+    # Runner 'a' is written differently and runs for two clubs, and runs two
+    # courses of the second event
+    assert rankings.update_event('event1', event_documents([
+        ('course1', 'a', u'Ann Lee', u'SYO', 'ok', '00:30:00'),
+        ('course1', 'b', u'Bob Day', u'DVO', 'ok', '00:40:00'),
+        ('course1', 'c', u'Cat Orr', u'SYO', 'mp', '00:20:00')])) == 2
+    assert rankings.update_event('event2', event_documents([
+        ('course1', 'a', u'LEE, Ann', u'SYO', 'ok', '00:50:00'),
+        ('course1', 'b', u'Bob Day', u'DVO', 'ok', '00:25:00'),
+        ('course2', 'a', u'Ann Lee', u'SYO', 'ok', '00:20:00')])) == 2
+    assert rankings.update_event('event3', event_documents([
+        ('course1', 'a', u'Ann Lee', u'EPOC', 'ok', '00:30:00'),
+        ('course1', 'd', u'Dan Roe', u'EPOC', 'ok', '00:36:00')])) == 2
+
+    assert rankings.runners['a']['scores'] == {'event1': 1000, 'event2': 1000, 'event3': 1000}
+    assert rankings.runners['a']['club'] == u'SYO'
+    assert rankings.league_table() == [(3000, u'Ann Lee', u'SYO'), (1750, u'Bob Day', u'DVO'),
+                                       (833, u'Dan Roe', u'EPOC')]
+    assert rankings.club_table() == [(3000, u'SYO'), (1750, u'DVO'), (833, u'EPOC')]
+
+    # The scores of an event crawled again replace its previous scores
+    rankings.update_event('event2', event_documents([
+        ('course1', 'b', u'Bob Day', u'DVO', 'ok', '00:25:00'),
+        ('course1', 'a', u'Ann Lee', u'SYO', 'ok', '00:50:00')]))
+    assert rankings.runners['a']['scores']['event2'] == 500
+    assert rankings.club_table() == [(2500, u'SYO'), (1750, u'DVO'), (833, u'EPOC')]
+
+    # Ann now runs for SYO and EPOC at as many events, so counts for EPOC
+    rankings.remove_event('event2')
+    assert rankings.runners['a']['club'] == u'EPOC'
+    assert rankings.club_table() == [(2833, u'EPOC'), (750, u'DVO')]
+
+    # An event crawled again without runs loses its scores
+    assert rankings.update_event('event3', []) == 0
+    rankings.remove_event('event1')
+    assert rankings.state() == {'runners': {}, 'events': {}, 'clubs': {}}
+
+
+def test_runs_without_runner_ids(tmpdir):
+    rankings = Rankings(str(tmpdir.join('rankings.json')))
+    documents = event_documents([('course1', None, u'Ann  Lee', u'syo ', 'ok', '00:30:00'),
+                                 ('course2', None, u'ann lee', u'SYO', 'ok', '00:45:00')])
+    rankings.update_event('event1', documents)
+
+    assert rankings.league_table() == [(1000, u'Ann Lee', u'SYO')]
+
+
+def test_saved_rankings_keyed_by_name(tmpdir):
+    path = str(tmpdir.join('rankings.json'))
+    tmpdir.join('rankings.json').write('{"runners": {"ann lee|SYO": {"club": "SYO", '
+                                       '"scores": {"event1": 1000}, "league": 1000}}}')
+
+    with pytest.raises(ValueError):
+        Rankings.load(path)
+
+
+def emptied(items):
+    """
+    Returns the items of an event crawled again without any results
+    """
+    summary = items[-1].copy()
+    summary['courses'] = []
+    if 'results' in summary:
+        summary['results'] = []
+    return [summary]
+
+
+@pytest.mark.parametrize('storage_layout', ['embedded', 'normalized'])
+@pytest.mark.parametrize('stream_results', [False, True])
+def test_incremental_matches_rebuild(tmpdir, storage_layout, stream_results):
+    def crawled(name, seed):
+        return crawled_items('http://www.example.com/' + name + '.htm', stream_results,
+                             seed=seed)
+
+    # Events are crawled again with changed results, and without results
+    crawls = [crawled('event1', 0), crawled('event2', 1), crawled('event3', 2)]
+    crawls += [crawled('event2', 3), emptied(crawls[2])]
+
+    spider = create_spider()
+    identity = IdentityPipeline(str(tmpdir.join('identities.json')), spider.crawler.stats)
+    ranking = RankingPipeline(str(tmpdir.join('rankings.json')), spider.crawler.stats)
+    identity.open_spider(spider)
+    ranking.open_spider(spider)
+    for items in crawls:
+        for item in items:
+            ranking.process_item(identity.process_item(item, spider), spider)
+
+    # The documents of the latest crawl of each event
+    db = FakeDatabase()
+    for items in [crawls[0]] + crawls[3:]:
+        store(db, items, storage_layout)
+    rebuilt = rebuild(db, storage_layout, str(tmpdir.join('rebuilt.json')))
+
+    assert len(ranking.rankings.events) == 2
+    assert len(ranking.rankings.runners) > 0
+    assert differences(ranking.rankings, rebuilt) == []
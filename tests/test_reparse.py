@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks that saved pages are re-parsed (see reparse.py) at the URLs they were
+downloaded from, and that a page that cannot be parsed is counted without
+stopping the others being parsed.
+
+@author: abradbury
+"""
+
+import io
+import json
+import os
+
+from scrapy.http import HtmlResponse
+
+from Orienteering_Scraper import reparse
+from Orienteering_Scraper.archive import PageArchive
+from Orienteering_Scraper.benchmarks.pages import generate_results_page
+from Orienteering_Scraper.identifiers import event_id
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+BASE_URL = 'http://www.example.com/'
+
+# A results page in the Napier format, but without any results in it
+MALFORMED_PAGE = (b'<html><body><pre>Results to follow</pre>'
+                  b'<address><p>Results software provided by Michael Napier</p></address>'
+                  b'</body></html>')
+
+
+def saved_pages():
+    """
+    Returns the relative URL and body of each of a set of saved pages
+    """
+    with open(os.path.join(PAGES_DIR, 'mercs_simple.htm'), 'rb') as page:
+        mercs_page = page.read()
+
+    return {'events/classic.htm': generate_results_page(courses_count=2, rows_count=5),
+            'events/broken.htm': MALFORMED_PAGE,
+            'mercs/index.htm': mercs_page,
+            'mercs/results.htm': generate_results_page(courses_count=1, rows_count=5, seed=1)}
+
+
+def save_pages(directory):
+    for relative_url, body in saved_pages().items():
+        path = os.path.join(directory, *relative_url.split('/'))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as page:
+            page.write(body)
+
+
+def reparse_all(pages):
+    urls = reparse.find_results_pages(pages)
+    output_file = io.BytesIO()
+    items_count, failed_count, _ = reparse.reparse(pages, urls, output_file, processes=1)
+    items = [json.loads(line.decode('utf-8')) for line in output_file.getvalue().splitlines()]
+
+    assert items_count == len(items)
+    return urls, items, failed_count
+
+
+def check_reparsed(urls, items, failed_count):
+    assert urls == [BASE_URL + 'events/broken.htm', BASE_URL + 'events/classic.htm',
+                    BASE_URL + 'mercs/index.htm']
+    assert failed_count == 1
+
+    events = [item for item in items if 'results_count' in item]
+    assert [event['url'] for event in events] == [BASE_URL + 'events/classic.htm',
+                                                  BASE_URL + 'mercs/results.htm']
+    assert [event['doc_id'] for event in events] == [event_id(event['url']) for event in events]
+    assert all(event['results_count'] > 0 for event in events)
+
+
+def test_saved_pages(tmpdir):
+    save_pages(str(tmpdir))
+
+    check_reparsed(*reparse_all(reparse.SavedPages(str(tmpdir), BASE_URL.rstrip('/'))))
+
+
+def test_archived_pages(tmpdir):
+    archive = PageArchive(str(tmpdir))
+    for relative_url, body in saved_pages().items():
+        archive.store(HtmlResponse(BASE_URL + relative_url, body=body))
+    archive.store(HtmlResponse(BASE_URL + 'events.html', body=b'<html><body></body></html>'))
+    archive.close()
+
+    check_reparsed(*reparse_all(reparse.ArchivedPages(str(tmpdir))))
+
+
+def test_linked_page_not_saved(tmpdir):
+    save_pages(str(tmpdir))
+    os.remove(os.path.join(str(tmpdir), 'mercs', 'results.htm'))
+
+    _, items, _ = reparse_all(reparse.SavedPages(str(tmpdir), BASE_URL))
+
+    assert items[-1]['status'] == "Linked results page not saved: " + BASE_URL + 'mercs/results.htm'
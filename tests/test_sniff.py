@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Checks the format and MERCS sub-type that the body sniffer (see sniff.py)
+finds for saved results and MERCS event index pages.
+
+@author: abradbury
+"""
+
+import os
+
+import pytest
+
+from Orienteering_Scraper import sniff
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+
+
+@pytest.mark.parametrize('filename, expected', [
+    ('napier_colour.htm', (sniff.NAPIER_COLOUR, None)),
+    ('mercs_simple.htm', (sniff.NAPIER_MERCS, sniff.MERCS_SIMPLE)),
+    ('mercs_relay.htm', (sniff.NAPIER_MERCS, sniff.MERCS_RELAY)),
+    ('mercs_relay_label.htm', (sniff.NAPIER_MERCS, sniff.MERCS_RELAY)),
+    ('mercs_multi_day.htm', (sniff.NAPIER_MERCS, sniff.MERCS_MULTI_DAY)),
+    ('mercs_class_split.htm', (sniff.NAPIER_MERCS, sniff.MERCS_CLASS_SPLIT)),
+    ('mercs_no_results.htm', (sniff.NAPIER_MERCS, None))
+])
+def test_saved_pages(filename, expected):
+    with open(os.path.join(PAGES_DIR, filename), 'rb') as page:
+        assert sniff.sniff(page.read()) == expected
+
+
+@pytest.mark.parametrize('link', [
+    b'<a href="/events/sunday-2-classic.html">Classic</a>',
+    b'<a href="http://www.example.com/day1.htm">Day 1</a>',
+    b'<p><a href="../class/index.html">Classes</a></p>',
+    b'<p><a href="http://www.example.com/weekday2.html">Weekday 2</a></p>'
+])
+def test_other_links_are_not_results(link):
+    body = (b'<html><body>' + link + b'<p><a href="results.htm">results.htm</a></p>'
+            b'<address><p>Produced by <a href="http://www.mercs.org">MERCS</a></p></address>'
+            b'</body></html>')
+
+    assert sniff.sniff(body) == (sniff.NAPIER_MERCS, sniff.MERCS_SIMPLE)
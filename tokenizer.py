@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Splits the whitespace structured text of a course's results (the contents of
+a HTML <pre> element) into lines, and classifies each line as one of:
+
+    blank       an empty or whitespace-only line
+    italic      a line with italic markup, e.g. a note about the course
+    team        a line naming several runners, e.g. 'Bob and Jim Smith',
+                as found in team and relay results
+    header      a column heading line, e.g. 'Pos  Name  Club  Class  Time'
+    result      a single result
+
+Each course is tokenized once per page, and only the result lines are used
+for finding the columns and extracting the results. Most courses have only
+blank and result lines, which is checked with one search of the whole text
+for each marker before falling back to classifying every line.
+
+@author: abradbury
+"""
+
+import re
+
+BLANK = 'blank'
+ITALIC = 'italic'
+TEAM = 'team'
+HEADER = 'header'
+RESULT = 'result'
+
+# Substring searches are much faster than an equivalent regex alternation
+ITALIC_MARKER = '<i>'
+TEAM_MARKERS = (' and ', '&', '+', '/')
+HEADER_LINE = re.compile(r'^[ \t]*(?:pos(?:n|ition)?|place)\.?[ \t]+name\b',
+                         re.IGNORECASE | re.MULTILINE)
+
+
+def classify_line(line):
+    if len(line) == 0 or line.isspace():
+        return BLANK
+
+    if ITALIC_MARKER in line:
+        return ITALIC
+
+    if any(marker in line for marker in TEAM_MARKERS):
+        return TEAM
+
+    if HEADER_LINE.match(line):
+        return HEADER
+
+    return RESULT
+
+
+def has_only_blank_and_result_lines(text):
+    if ITALIC_MARKER in text or any(marker in text for marker in TEAM_MARKERS):
+        return False
+
+    # The header pattern is only searched for if a heading could be present
+    return 'name' not in text.lower() or HEADER_LINE.search(text) is None
+
+
+def result_lines(text):
+    """
+    Returns the lines of text that are results
+    """
+    lines = text.split('\n')
+    if has_only_blank_and_result_lines(text):
+        return [line for line in lines if len(line) > 0 and not line.isspace()]
+    return [line for line in lines if classify_line(line) == RESULT]
+
+
+def header_line(text):
+    """
+    Returns the first column heading line of the text, or None
+    """
+    match = HEADER_LINE.search(text)
+    if match is None:
+        return None
+
+    end = text.find('\n', match.start())
+    return text[match.start():end if end >= 0 else len(text)]
+
+
+def course_result_lines(course_results):
+    """
+    Returns the result lines of a course, from the selector of its results
+    """
+    return result_lines(u"".join(course_results.css('pre::text').extract()))